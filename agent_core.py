@@ -1,25 +1,65 @@
 import os
+import re
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+from document_model import load_document
+from llm_backend import get_backend
+from span_utils import span, record_usage
 from prompt_templates import SYSTEM_PROMPT, USER_INSTRUCTION_TEMPLATE
-from text_utils import clean_pdf_text, summarize_chunks  # We always summarize before GPT-4o
+from text_utils import summarize_chunks, count_tokens, SUMMARY_CONCURRENCY  # We always summarize before GPT-4o
+import token_budget
+from chunk_verdicts import aggregate_verdicts
+from page_triage import BOILERPLATE_LINES
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# 0 = never call gpt-4o; ambiguous documents get the deterministic answer too
+ESCALATE_AMBIGUOUS = os.getenv("ESCALATE_AMBIGUOUS", "1") == "1"
 
 # ======= Tool Functions ======= #
+# Tools take a reference (ticket id + page range) instead of text, so the
+# model never has to echo document text back as tool-call arguments. The
+# checks run locally over the pages already extracted for that ticket.
 
-def check_signature(text: str) -> dict:
-    is_signed = "yes" if "signature" in text.lower() else "no"
-    return {"is_signed": is_signed}
+DATE_PATTERN = re.compile(r"\b\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4}\b")
 
-def validate_lease_dates(text: str) -> dict:
-    import re
-    found_dates = re.findall(r"\b\d{1,2}[\/\-.]\d{1,2}[\/\-.]\d{2,4}\b", text)
+
+def resolve_pages(document, start_page: int = None, end_page: int = None) -> list:
+    """PageRecords for an inclusive 1-based range, clamped to the document. Raises ValueError for a bad range."""
+    try:
+        start = max(int(start_page or 1), 1)
+        end = min(int(end_page or len(document)), len(document))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid page range {start_page!r}-{end_page!r}")
+    if start > end:
+        raise ValueError(f"invalid page range {start_page}-{end_page}")
+    return [document.page(n) for n in range(start, end + 1)]
+
+
+# The tools read the page as extracted, not cleaned_text: the cleaner's
+# watermark rule also cuts signature blocks and the dates beside them.
+def page_text(page) -> str:
+    """Raw page text minus the e-signature footer, which mentions "signature" on every page."""
+    return BOILERPLATE_LINES.sub("", page.text)
+
+
+def check_signature(pages: list) -> dict:
+    signed_pages = [page.number for page in pages if "signature" in page_text(page).lower()]
+    return {
+        "is_signed": "yes" if signed_pages else "no",
+        "pages_checked": [page.number for page in pages],
+        "signature_pages": signed_pages
+    }
+
+def validate_lease_dates(pages: list) -> dict:
+    found_dates = []
+    date_pages = []
+    for page in pages:
+        dates = DATE_PATTERN.findall(page_text(page))
+        if dates:
+            found_dates.extend(dates)
+            date_pages.append(page.number)
     return {
         "valid_date_range": True if len(found_dates) >= 2 else False,
-        "dates_found": found_dates
+        "dates_found": found_dates,
+        "date_pages": date_pages
     }
 
 def generate_response(is_signed: str, valid_date_range: bool) -> str:
@@ -34,71 +74,184 @@ def generate_response(is_signed: str, valid_date_range: bool) -> str:
 
 # ======= Tool Schema Definitions ======= #
 
+DOCUMENT_REFERENCE = {
+    "type": "object",
+    "properties": {
+        "ticket_id": {"type": "string", "description": "Ticket ID of the document under review."},
+        "start_page": {"type": "integer", "description": "First page to check (1-based). Omit for page 1."},
+        "end_page": {"type": "integer", "description": "Last page to check, inclusive. Omit for the last page."}
+    },
+    "required": ["ticket_id"]
+}
+
 tools = [
     {
         "type": "function",
         "function": {
             "name": "check_signature",
-            "description": "Check if the lease text contains a signature.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "text": {"type": "string"}
-                },
-                "required": ["text"]
-            }
+            "description": "Check the given pages of the ticket's lease for a signature. The page text is looked up server-side.",
+            "parameters": DOCUMENT_REFERENCE
         }
     },
     {
         "type": "function",
         "function": {
             "name": "validate_lease_dates",
-            "description": "Validate the lease date range in the text.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "text": {"type": "string"}
-                },
-                "required": ["text"]
-            }
+            "description": "Validate the lease date range on the given pages of the ticket's lease. The page text is looked up server-side.",
+            "parameters": DOCUMENT_REFERENCE
         }
     },
 ]
 
+TOOL_FUNCTIONS = {"check_signature": check_signature, "validate_lease_dates": validate_lease_dates}
+
 # ======= Agent Router ======= #
 
-def run_agent(ticket_id: str, pdf_path: str):
+def run_agent(ticket_id: str, pdf_path: str, max_concurrency: int = SUMMARY_CONCURRENCY, document=None, on_progress=None):
+    """
+    Returns (customer response, trace file). `on_progress(kind, data)` sees the
+    summarization events, a "decision" event with the aggregated verdict and,
+    when escalated, the reasoning model's streamed text and tool results.
+    """
     print(f"\n[🧼] Cleaning PDF text before summarization...")
-    # ✅ Always summarize before GPT-4o
-    summarized_text, trace_file_path = summarize_chunks(pdf_path)
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": USER_INSTRUCTION_TEMPLATE.format(ticket_id=ticket_id)},
-            {"role": "user", "content": summarized_text}
-        ],
-        tools=tools,
-        tool_choice="auto",
-        temperature=0.5
+    if document is None:
+        document = load_document(pdf_path)
+
+    # ✅ Always summarize before deciding
+    summarized_text, trace_file_path, verdicts = summarize_chunks(
+        pdf_path, max_concurrency=max_concurrency, document=document, ticket_id=ticket_id, on_progress=on_progress
     )
 
-    tool_calls = response.choices[0].message.tool_calls
-    if not tool_calls:
-        return "⚠️ GPT did not call any tools. Please try again."
+    with span("aggregate", chunks=len(verdicts)) as record:
+        decision = aggregate_verdicts(verdicts)
+        record.update(decision)
+    if on_progress:
+        on_progress("decision", {**decision, "escalated": bool(decision["ambiguous"] and ESCALATE_AMBIGUOUS)})
+
+    if decision["ambiguous"] and ESCALATE_AMBIGUOUS:
+        messages = reasoning_messages(ticket_id, summarized_text, document)
+        if not token_budget.allows(estimate_reasoning_tokens(messages)):
+            token_budget.degrade(f"Token budget: deciding from local page checks instead of asking {REASONING_MODEL}")
+            return decide_locally(document), trace_file_path
+        print(f"[🤔] Ambiguous verdicts ({'; '.join(decision['reasons'])}), asking {REASONING_MODEL}")
+        return reason_over_summary(ticket_id, summarized_text, document, on_progress), trace_file_path
+
+    print(f"[🧮] Decided from chunk verdicts: signed={decision['is_signed']} dates={decision['valid_date_range']}")
+    return generate_response(decision["is_signed"], decision["valid_date_range"]), trace_file_path
+
+
+REASONING_MODEL = os.getenv("REASONING_MODEL", "gpt-4o")
+REASONING_MAX_TOKENS = 300  # tool calls carry references now, not document text
+MAX_TOOL_TURNS = int(os.getenv("MAX_TOOL_TURNS", 4))
 
+
+def run_tool_call(call, ticket_id: str, document) -> dict:
+    try:
+        args = json.loads(call.function.arguments or "{}")
+    except ValueError:
+        return {"error": "arguments are not valid JSON"}
+
+    fn = TOOL_FUNCTIONS.get(call.function.name)
+    if fn is None:
+        return {"error": f"unknown tool {call.function.name}"}
+    if args.get("ticket_id") != ticket_id:
+        return {"error": f"unknown ticket {args.get('ticket_id')}; this review is for ticket {ticket_id}"}
+    try:
+        pages = resolve_pages(document, args.get("start_page"), args.get("end_page"))
+    except ValueError:
+        return {"error": "invalid page range"}
+    return fn(pages)
+
+
+def merge_tool_results(result_store: dict, name: str, result: dict) -> None:
+    """Several calls may cover different page ranges; a signature or date on any of them counts."""
+    if "error" in result:
+        return
+    if name == "check_signature":
+        check = result_store.setdefault("check", {"is_signed": "no", "signature_pages": []})
+        check["signature_pages"] = sorted(set(check["signature_pages"]) | set(result["signature_pages"]))
+        check["is_signed"] = "yes" if check["signature_pages"] else "no"
+    elif name == "validate_lease_dates":
+        dates = result_store.setdefault("dates", {"dates_found": []})
+        dates["dates_found"] += result["dates_found"]
+        dates["valid_date_range"] = len(dates["dates_found"]) >= 2
+
+
+def reasoning_messages(ticket_id: str, summarized_text: str, document) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_INSTRUCTION_TEMPLATE.format(ticket_id=ticket_id, page_count=len(document))},
+        {"role": "user", "content": summarized_text}
+    ]
+
+
+def estimate_reasoning_tokens(messages: list) -> int:
+    """One turn over `messages` plus the tool schemas, answered in full."""
+    return count_tokens(json.dumps(messages) + json.dumps(tools), REASONING_MODEL) + REASONING_MAX_TOKENS
+
+
+def decide_locally(document) -> str:
+    """What the tool loop would conclude from its two tools run over every page, without a model call."""
+    signature = check_signature(document.pages)
+    dates = validate_lease_dates(document.pages)
+    return generate_response(signature["is_signed"], dates["valid_date_range"])
+
+
+def reason_over_summary(ticket_id: str, summarized_text: str, document, on_progress=None) -> str:
+    """
+    Tool loop over the summary: tool calls are answered from `document`'s
+    pages and sent back to the model only while it still owes us one of
+    the two checks, for at most MAX_TOOL_TURNS turns. With `on_progress`,
+    the model's text is streamed out as "reasoning" events and each tool
+    result is reported as a "tool" event.
+    """
+    messages = reasoning_messages(ticket_id, summarized_text, document)
     result_store = {}
-    for call in tool_calls:
-        name = call.function.name
-        args = json.loads(call.function.arguments)
 
-        if name == "check_signature":
-            result_store["check"] = check_signature(**args)
-        elif name == "validate_lease_dates":
-            result_store["dates"] = validate_lease_dates(**args)
+    for turn in range(MAX_TOOL_TURNS):
+        if turn and not token_budget.allows(estimate_reasoning_tokens(messages)):
+            # The model still owes one of the checks; don't answer from half of them
+            token_budget.degrade(f"Token budget: stopped the tool loop after {turn} turn(s), "
+                                 f"deciding from local page checks")
+            return decide_locally(document)
+        request = dict(model=REASONING_MODEL, messages=messages, tools=tools, tool_choice="auto",
+                       temperature=0.5, max_tokens=REASONING_MAX_TOKENS)
+        with span("reasoning", model=REASONING_MODEL, turn=turn) as record:
+            if on_progress:
+                on_delta = lambda text, turn=turn: on_progress("reasoning", {"turn": turn, "text": text})
+                response = get_backend().chat_stream(on_delta, **request)
+            else:
+                response = get_backend().chat(**request)
+            record_usage(record, response)
+            token_budget.charge(response, REASONING_MODEL)
+
+        message = response.choices[0].message
+        tool_calls = message.tool_calls
+        if not tool_calls:
+            break
+
+        messages.append({
+            "role": "assistant",
+            "content": message.content,
+            "tool_calls": [
+                {"id": call.id, "type": "function", "function": {"name": call.function.name, "arguments": call.function.arguments}}
+                for call in tool_calls
+            ]
+        })
+        for call in tool_calls:
+            result = run_tool_call(call, ticket_id, document)
+            merge_tool_results(result_store, call.function.name, result)
+            if on_progress:
+                on_progress("tool", {"name": call.function.name, "result": result})
+            messages.append({"role": "tool", "tool_call_id": call.id, "content": json.dumps(result)})
+
+        if "check" in result_store and "dates" in result_store:
+            break  # both answers are in; no follow-up turn needed
+
+    if not result_store:
+        return "⚠️ GPT did not call any tools. Please try again."
 
     is_signed = result_store.get("check", {}).get("is_signed", "no")
     valid_date_range = result_store.get("dates", {}).get("valid_date_range", False)
 
-    return generate_response(is_signed, valid_date_range), trace_file_path
\ No newline at end of file
+    return generate_response(is_signed, valid_date_range)
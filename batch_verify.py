@@ -0,0 +1,215 @@
+"""
+Headless bulk verification of historical leases.
+
+    python batch_verify.py leases/ --output results/backlog.jsonl --vision
+    python batch_verify.py manifest.jsonl --parse-workers 4 --documents 8 --llm-concurrency 32
+
+Input is a directory (searched recursively for *.pdf) or a manifest: a .txt
+file with one PDF path per line, or a .jsonl file of {"pdf_path", "ticket_id"}
+objects. PDFs are parsed in a process pool; up to --documents documents then
+run through run_agent (and the vision check with --vision) at once, and all
+of their LLM calls share one pool of --llm-concurrency requests in flight.
+
+Each finished document is appended to the output JSONL right away.
+Re-running with the same output skips documents that already succeeded, so
+an interrupted run resumes where it stopped. No notifications are sent.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+import statistics
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from document_model import load_document
+from agent_core import run_agent
+from trace_utils import suggest_vision_pages
+from vision_utils import run_vision_stage
+from span_utils import collect_spans, write_spans
+from token_budget import document_budget
+from text_utils import SUMMARY_CONCURRENCY
+from llm_backend import BoundedBackend, get_backend, set_backend
+from llm_scheduler import PRIORITIES, get_scheduler, set_default_priority
+
+
+# ======= Inputs and Resume State =======
+
+def load_inputs(source: str) -> list:
+    """[{"pdf_path", "ticket_id"}] from a directory or manifest, in a stable order."""
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names if name.lower().endswith(".pdf")
+        )
+        items = [{"pdf_path": path} for path in paths]
+    else:
+        with open(source, "r") as f:
+            lines = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        if source.endswith(".jsonl"):
+            items = [json.loads(line) for line in lines]
+        else:
+            items = [{"pdf_path": line} for line in lines]
+
+    for item in items:
+        item["pdf_path"] = os.path.abspath(item["pdf_path"])
+        item.setdefault("ticket_id", "BATCH-" + os.path.splitext(os.path.basename(item["pdf_path"]))[0])
+    return items
+
+
+def completed_paths(output: str) -> set:
+    """PDFs that already have a successful result line in the output."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "r") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut off by the interruption
+            if result.get("status") == "ok":
+                done.add(result["pdf_path"])
+    return done
+
+
+# ======= Per-Document Run =======
+
+def verify_document(item: dict, document, vision: bool, max_concurrency: int) -> dict:
+    ticket_id = item["ticket_id"]
+    with collect_spans(ticket_id) as spans, document_budget(ticket_id) as budget:
+        response, trace_file = run_agent(ticket_id, item["pdf_path"], max_concurrency=max_concurrency, document=document)
+        flagged_pages = suggest_vision_pages(trace_file)
+        vision_results = run_vision_stage(document, flagged_pages) if vision else None
+        spans_file = write_spans(trace_file, spans)
+
+    return {
+        "response": response,
+        "pages": len(document),
+        "doc_hash": document.doc_hash,
+        "trace_file": trace_file,
+        "spans_file": spans_file,
+        "flagged_pages": flagged_pages,
+        "vision_results": vision_results,
+        "usage": budget.summary(),
+    }
+
+
+class Progress:
+    """Thread-safe JSONL writer plus running documents/minute and latency stats."""
+
+    def __init__(self, output: str, total: int):
+        self.output = output
+        self.total = total
+        self.latencies = []
+        self.failed = 0
+        self.start = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, result: dict) -> None:
+        with self._lock:
+            with open(self.output, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            self.latencies.append(result["duration"])
+            self.failed += result["status"] != "ok"
+
+            done = len(self.latencies)
+            rate = done / ((time.time() - self.start) / 60)
+            p50 = statistics.median(self.latencies)
+            p95 = sorted(self.latencies)[max(0, math.ceil(0.95 * done) - 1)]  # nearest rank
+            icon = "✅" if result["status"] == "ok" else "❌"
+            print(f"[{icon}] {done}/{self.total} {os.path.basename(result['pdf_path'])} {result['duration']:.1f}s | "
+                  f"{rate:.1f} docs/min, p50 {p50:.1f}s, p95 {p95:.1f}s, {self.failed} failed", file=sys.stderr)
+
+
+def run_batch(items: list, output: str, parse_workers: int, documents: int, llm_concurrency: int,
+              chunk_concurrency: int = SUMMARY_CONCURRENCY, vision: bool = False) -> Progress:
+    set_backend(BoundedBackend(get_backend(), llm_concurrency))
+    progress = Progress(output, len(items))
+
+    # Parsed documents waiting for a runner count against the window too, so a
+    # fast parser can't pile thousands of documents up in memory
+    window = threading.BoundedSemaphore(documents * 2)
+
+    def finish(item, parse_future, queued_at):
+        start = time.time()
+        result = {"pdf_path": item["pdf_path"], "ticket_id": item["ticket_id"]}
+        try:
+            document = parse_future.result()
+            result.update(verify_document(item, document, vision, chunk_concurrency), status="ok")
+        except Exception as e:
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+        finally:
+            result["duration"] = round(time.time() - queued_at, 2)  # parse + queueing + verification
+            result["verify_s"] = round(time.time() - start, 2)
+            progress.record(result)
+            window.release()
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as parsers, ThreadPoolExecutor(max_workers=documents) as runners:
+        def hand_off(item, queued_at):
+            def callback(parse_future):
+                try:
+                    runners.submit(finish, item, parse_future, queued_at)
+                except RuntimeError:
+                    window.release()  # shutting down after an interrupt
+            return callback
+
+        for item in items:
+            window.acquire()
+            parsers.submit(load_document, item["pdf_path"]).add_done_callback(hand_off(item, time.time()))
+
+        # Wait for every document to finish before the pools shut down
+        for _ in range(documents * 2):
+            window.acquire()
+
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify a backlog of lease PDFs without the Streamlit app.")
+    parser.add_argument("source", help="Directory of PDFs, or a .txt / .jsonl manifest")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Result JSONL (appended to; also the resume state)")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 2, help="Processes parsing PDFs")
+    parser.add_argument("--documents", type=int, default=4, help="Documents verified at once")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="LLM requests in flight across all documents")
+    parser.add_argument("--chunk-concurrency", type=int, default=SUMMARY_CONCURRENCY, help="Chunk summaries in flight per document")
+    parser.add_argument("--vision", action="store_true", help="Also run the vision signature check on flagged pages")
+    parser.add_argument("--priority", default="batch", choices=list(PRIORITIES), help="LLM rate-limit priority class")
+    parser.add_argument("--quiet", action="store_true", help="Only print per-document progress")
+    args = parser.parse_args()
+    set_default_priority(args.priority)
+
+    items = load_inputs(args.source)
+    done = completed_paths(args.output)
+    todo = [item for item in items if item["pdf_path"] not in done]
+    print(f"[📦] {len(items)} documents, {len(items) - len(todo)} already done, {len(todo)} to verify", file=sys.stderr)
+    if not todo:
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    quiet = open(os.devnull, "w") if args.quiet else None
+    try:
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            progress = run_batch(todo, args.output, args.parse_workers, args.documents, args.llm_concurrency,
+                                 args.chunk_concurrency, args.vision)
+    except KeyboardInterrupt:
+        print(f"[🛑] Interrupted; re-run the same command to resume from {args.output}", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if quiet:
+            quiet.close()
+
+    minutes = (time.time() - progress.start) / 60
+    print(f"[🏁] {len(progress.latencies)} documents in {minutes:.1f} min "
+          f"({len(progress.latencies) / minutes:.1f} docs/min), {progress.failed} failed -> {args.output}", file=sys.stderr)
+    scheduler_stats = get_scheduler().stats()
+    if scheduler_stats:
+        print(f"[🚦] LLM scheduler: {scheduler_stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: text_cleaner.TextCleaner vs the original clean_pdf_text.
+
+Checks that both give identical output on every page of the corpus, then
+reports per-page throughput. Exits non-zero on any mismatch.
+
+    python bench_clean_text.py lease_5pages.pdf other_lease.pdf --repeat 200
+"""
+import io
+import re
+import sys
+import time
+import argparse
+import contextlib
+
+import pdfplumber
+
+from text_cleaner import DEFAULT_CLEANER
+
+
+def legacy_clean_pdf_text(text: str, echo: bool = True) -> str:
+    """The cleaner as it shipped before text_cleaner.py, kept verbatim for comparison."""
+    text = re.sub(r"\n{2,}", "\n", text)
+    text = re.sub(r"(?i)page \d+ of \d+", "", text)
+    text = re.sub(r"(continued on next page)", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"\b(?:Document|Signature|Timestamp|MediaBox|CropBox).*\n", "", text)
+    text = re.sub(r"[ \t]{2,}", " ", text)
+    text = re.sub(r"^\s*\d+\s*$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"^[A-Z\s]{15,}$", "", text, flags=re.MULTILINE)
+    if echo:
+        print(text)  # optional debug
+    return text.strip()
+
+
+# Hand-written pages that exercise every rule and the interactions between them
+EDGE_CASES = [
+    "",
+    "Page 1 of 9\n\n\nRent is due monthly.\n\n",
+    "Terms continued on next page 2 of 3\nCONTINUED ON NEXT PAGE",
+    "Resident   Signature:\t\t____\nDocument ID: 44378741\nTimestamp 12:00",
+    "eSignature services. Document ID: 1\nMediaBox [0 0 612 792]\nlast line without newline Signature",
+    "12\n  7  \nSECTION HEADER IN CAPS\nAPARTMENT LEASE CONTRACT\nnormal text 3",
+    "A\n\n\n\nB\n 42 \n\nC   D",
+]
+
+
+def load_corpus(paths: list) -> list:
+    pages = []
+    for path in paths:
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                pages.append(page.extract_text() or "")
+                page.flush_cache()
+    return pages + EDGE_CASES
+
+
+def throughput(fn, pages: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in pages:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    return len(pages) * repeat / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the text cleaner against the original clean_pdf_text.")
+    parser.add_argument("documents", nargs="*", default=["lease_5pages.pdf"], help="PDFs to take pages from")
+    parser.add_argument("--repeat", type=int, default=200, help="Passes over the corpus per measurement")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.documents)
+
+    mismatches = [
+        i for i, text in enumerate(pages)
+        if legacy_clean_pdf_text(text, echo=False) != DEFAULT_CLEANER.clean(text)
+    ]
+    if mismatches:
+        print(f"[❌] Output differs from the original cleaner on {len(mismatches)} page(s): {mismatches}")
+        sys.exit(1)
+    print(f"[✅] Identical output on all {len(pages)} pages")
+
+    # The original printed every cleaned page; measure it with stdout discarded
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy_echo = throughput(legacy_clean_pdf_text, pages, args.repeat)
+    legacy = throughput(lambda t: legacy_clean_pdf_text(t, echo=False), pages, args.repeat)
+    engine = throughput(DEFAULT_CLEANER.clean, pages, args.repeat)
+
+    print(f"{'cleaner':<28} {'pages/s':>12} {'speedup':>8}")
+    for name, rate in [("original (with print)", legacy_echo), ("original (no print)", legacy), ("TextCleaner", engine)]:
+        print(f"{name:<28} {rate:>12,.0f} {rate / legacy_echo:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
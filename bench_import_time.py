@@ -0,0 +1,119 @@
+"""
+Import-time benchmark: how long a fresh interpreter takes to import each
+entry point, and which imports dominate.
+
+Each target is imported in its own `python -X importtime` subprocess, so
+module caches never carry over. Pages are measured by importing what they
+import (streamlit itself excluded). Fails when a target exceeds --max-ms.
+
+    python bench_import_time.py --repeat 5 --top 8
+    python bench_import_time.py --max-ms 400     # startup regression gate
+"""
+import os
+import ast
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+
+RESULTS_DIR = "bench_results"
+
+TARGETS = [
+    "pages/1_user_Intake.py",
+    "pages/2_business_Dashboard.py",
+    "pages/3_engineering_Logs.py",
+    "pipeline",
+    "worker",
+    "agent_core",
+    "text_utils",
+    "vision_utils",
+    "notification_outbox",
+]
+
+# The Streamlit host has these loaded before it runs a page
+HOST_MODULES = {"streamlit", "pandas"}
+
+
+def page_imports(path: str) -> list:
+    """Top-level modules a page script imports, minus what Streamlit already loaded."""
+    with open(path, "r") as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return [m for m in modules if m.split(".")[0] not in HOST_MODULES]
+
+
+def import_statement(target: str) -> str:
+    modules = page_imports(target) if target.endswith(".py") else [target]
+    return "; ".join(f"import {m}" for m in modules) or "pass"
+
+
+def measure(target: str) -> dict:
+    """One cold import. Returns wall ms and per-module self time (us) from -X importtime."""
+    code = f"import time; _t = time.perf_counter(); {import_statement(target)}; print(time.perf_counter() - _t)"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    self_times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        self_times[name.strip()] = int(self_us)
+    return {"total_ms": float(proc.stdout.strip().splitlines()[-1]) * 1000, "self_us": self_times}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app's entry points.")
+    parser.add_argument("targets", nargs="*", default=TARGETS, help="Module names or page script paths")
+    parser.add_argument("--repeat", type=int, default=5, help="Cold imports per target (median is reported)")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per target")
+    parser.add_argument("--max-ms", type=float, default=None, help="Exit non-zero if any target's median exceeds this")
+    parser.add_argument("--output", default=None, help="Result JSON path (default: bench_results/import_<ts>.json)")
+    args = parser.parse_args()
+
+    results = {}
+    failed = []
+    for target in args.targets:
+        try:
+            runs = [measure(target) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"[❌] {target}: {e}")
+            failed.append(target)
+            continue
+
+        median_ms = statistics.median(run["total_ms"] for run in runs)
+        top = sorted(runs[-1]["self_us"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        results[target] = {
+            "median_ms": round(median_ms, 1),
+            "runs_ms": [round(run["total_ms"], 1) for run in runs],
+            "modules": len(runs[-1]["self_us"]),
+            "top_self_ms": {name: round(us / 1000, 1) for name, us in top},
+        }
+
+        over = args.max_ms is not None and median_ms > args.max_ms
+        print(f"[{'❌' if over else '⏱️'}] {target:<30} {median_ms:>8.1f} ms  {len(runs[-1]['self_us']):>4} modules  slowest: "
+              + ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in top))
+        if over:
+            failed.append(target)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = args.output or os.path.join(RESULTS_DIR, f"import_{timestamp}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"timestamp": timestamp, "python": sys.version.split()[0], "targets": results}, f, indent=2)
+    print(f"[🧾] Import timings written to {output}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+End-to-end pipeline benchmark with stubbed LLM calls.
+
+Runs the run_agent stages plus the intake page's vision path against
+lease_5pages.pdf and synthetic 50/200/500-page leases, and writes per-stage
+wall times, peak memory and documents/minute to bench_results/ as JSON.
+
+    python bench_pipeline.py --sizes 5,50,200 --concurrency 1,8,32 --latency 0.8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+import pypdfium2  # installed with pdfplumber
+
+from document_model import load_document
+from text_cleaner import DEFAULT_CLEANER
+from text_utils import summarize_chunks
+from agent_core import reason_over_summary
+from chunk_verdicts import aggregate_verdicts
+from trace_utils import suggest_vision_pages
+from vision_utils import run_vision_stage
+from span_utils import collect_spans
+from llm_backend import StubBackend, set_backend
+from llm_cache import llm_cache
+import token_budget
+
+BASE_PDF = "lease_5pages.pdf"
+DATA_DIR = "bench_data"
+RESULTS_DIR = "bench_results"
+
+
+# ======= Synthetic Leases =======
+
+def make_synthetic_lease(page_count: int, base_pdf: str = BASE_PDF, data_dir: str = DATA_DIR) -> str:
+    """Cycles the pages of the sample lease until the document has `page_count` pages."""
+    base = pypdfium2.PdfDocument(base_pdf)
+    if page_count == len(base):
+        return base_pdf
+
+    os.makedirs(data_dir, exist_ok=True)
+    output = os.path.join(data_dir, f"lease_{page_count}pages.pdf")
+    if os.path.exists(output):
+        return output
+
+    lease = pypdfium2.PdfDocument.new()
+    lease.import_pages(base, [i % len(base) for i in range(page_count)])
+    lease.save(output)
+    return output
+
+
+# ======= Staged Pipeline Run =======
+
+def timed(stages: dict, name: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    stages[name] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def run_pipeline(pdf_path: str, concurrency: int) -> dict:
+    stages = {}
+    total_start = time.perf_counter()
+
+    # The same single pass the intake page makes: text, cleaning, triage layout and signature fields
+    document = timed(stages, "pdf_parse", load_document, pdf_path)
+    # load_document cleans as it parses; clean the raw texts again on their own so the cleaner gets its own figure
+    raw_texts = [page.text for page in document.pages]
+    timed(stages, "clean_pdf_text", lambda: list(DEFAULT_CLEANER.clean_pages(raw_texts)))
+    stages["pdf_parse"] = round(stages["pdf_parse"] - stages["clean_pdf_text"], 4)
+
+    with collect_spans() as spans:
+        summary, trace_file, verdicts = timed(
+            stages, "summarization", summarize_chunks,
+            pdf_path, max_concurrency=concurrency, document=document
+        )
+    # Triage, budget fitting and packing happen inside summarize_chunks; report them apart from the calls
+    chunking = next(s for s in spans if s["stage"] == "chunking")
+    stages["chunking"] = round(chunking["duration_ms"] / 1000, 4)
+    stages["summarization"] = round(stages["summarization"] - stages["chunking"], 4)
+    decision = timed(stages, "aggregation", aggregate_verdicts, verdicts)
+    if decision["ambiguous"]:
+        timed(stages, "final_reasoning", reason_over_summary, "BENCH", summary, document)
+
+    flagged_pages = suggest_vision_pages(trace_file)
+    with collect_spans() as spans:
+        vision_results = timed(stages, "vision", run_vision_stage, document, flagged_pages, max_concurrency=concurrency)
+    # run_vision_stage renders in one batch span; report it apart from the vision calls
+    render_s = sum(s["duration_ms"] for s in spans if s["stage"] == "render_pages") / 1000
+    stages["page_rendering"] = round(render_s, 4)
+    stages["vision"] = round(stages["vision"] - render_s, 4)
+    rendered = [v for v in vision_results if v["result"] is not None]
+
+    total = time.perf_counter() - total_start
+    return {
+        "pages": len(document),
+        "chunks": chunking["chunks"],
+        "ambiguous": decision["ambiguous"],
+        "flagged_pages": len(flagged_pages),
+        "rendered_pages": len(rendered),
+        "stages": stages,
+        "total_s": round(total, 4),
+        "docs_per_minute": round(60.0 / total, 2) if total else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lease verification pipeline with stubbed LLM calls.")
+    parser.add_argument("--sizes", default="5,50,200,500", help="Comma-separated page counts (5 = the sample lease)")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated summarization concurrency levels")
+    parser.add_argument("--latency", type=float, default=0.5, help="Base seconds per stubbed LLM call")
+    parser.add_argument("--per-token", type=float, default=0.0, help="Extra seconds per completion token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform random extra seconds per call")
+    parser.add_argument("--trace-memory", action="store_true", help="Report tracemalloc peaks (slows the run)")
+    parser.add_argument("--output", default=None, help="Result JSON path (default: bench_results/pipeline_<ts>.json)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    documents = {size: os.path.abspath(make_synthetic_lease(size)) for size in sizes}
+
+    backend = StubBackend(base_latency=args.latency, per_token_latency=args.per_token, jitter=args.jitter, seed=0)
+    set_backend(backend)
+    token_budget.set_ledger(None)  # stubbed spend stays out of the host's hourly budget
+    llm_cache.bypass = True  # every run must pay for its calls
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"pipeline_{timestamp}.json"))
+    results = {
+        "meta": {
+            "timestamp": timestamp,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "latency_model": {"base": args.latency, "per_token": args.per_token, "jitter": args.jitter},
+        },
+        "runs": []
+    }
+
+    # Traces and rendered pages land in a scratch dir, not the repo
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for size, pdf_path in documents.items():
+            for concurrency in levels:
+                calls_before = backend.calls
+                if args.trace_memory:
+                    tracemalloc.start()
+
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    run = run_pipeline(pdf_path, concurrency)
+
+                if args.trace_memory:
+                    run["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                    tracemalloc.stop()
+
+                run.update({
+                    "document": os.path.basename(pdf_path),
+                    "concurrency": concurrency,
+                    "llm_calls": backend.calls - calls_before,
+                    "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+                })
+                results["runs"].append(run)
+
+                stage_text = " ".join(f"{k}={v:.2f}s" for k, v in run["stages"].items())
+                print(f"[⏱️] {size:>4} pages @ c={concurrency:<3} total={run['total_s']:.2f}s "
+                      f"docs/min={run['docs_per_minute']} {stage_text}", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[🧾] Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import json
+from datetime import date
+
+# ======= Structured Chunk Verdicts =======
+# Each summarization call answers in JSON mode with one verdict per page of
+# its chunk. aggregate_verdicts() turns them into the approve/reject decision
+# and the vision page list without another LLM call; only documents it marks
+# ambiguous go on to the gpt-4o reasoning pass.
+
+VERDICT_MIN_CONFIDENCE = float(os.getenv("VERDICT_MIN_CONFIDENCE", 0.6))
+
+PAGE_VERDICT_FIELDS = ["page", "summary", "has_signature_field", "signature_present", "lease_start", "lease_end", "confidence"]
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pages": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "page": {"type": "integer"},
+                    "summary": {"type": "string"},
+                    "has_signature_field": {"type": "boolean"},
+                    "signature_present": {"type": "boolean"},
+                    "lease_start": {"type": ["string", "null"]},
+                    "lease_end": {"type": ["string", "null"]},
+                    "confidence": {"type": "number"}
+                },
+                "required": PAGE_VERDICT_FIELDS,
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["pages"],
+    "additionalProperties": False
+}
+
+# Passed as `response_format` on the summarization request
+VERDICT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "chunk_verdict", "strict": True, "schema": VERDICT_SCHEMA}
+}
+
+
+def _iso_date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_verdict(content: str, pages: list):
+    """
+    Validates a JSON-mode answer for a chunk covering `pages`.
+    Returns {"pages": [...]} with one normalized entry per page the model
+    reported, or None if the answer is unusable.
+    """
+    try:
+        data = json.loads(content)
+        entries = data["pages"]
+    except (TypeError, ValueError, KeyError):
+        return None
+
+    verdicts = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            page = int(entry.get("page"))
+            confidence = min(max(float(entry.get("confidence") or 0.0), 0.0), 1.0)
+        except (TypeError, ValueError):
+            continue
+        if page not in pages:
+            continue  # a page number the chunk does not hold
+        verdicts.append({
+            "page": page,
+            "summary": str(entry.get("summary") or ""),
+            "has_signature_field": entry.get("has_signature_field") is True,
+            "signature_present": entry.get("signature_present") is True,
+            "lease_start": _iso_date(entry.get("lease_start")),
+            "lease_end": _iso_date(entry.get("lease_end")),
+            "confidence": confidence
+        })
+
+    if not verdicts:
+        return None
+    return {"pages": sorted(verdicts, key=lambda v: v["page"])}
+
+
+def render_verdict(verdict: dict) -> str:
+    """Readable text for traces and for the gpt-4o pass on ambiguous documents."""
+    lines = []
+    for v in verdict["pages"]:
+        if v["has_signature_field"]:
+            signature = "signature field, signed" if v["signature_present"] else "signature field, not signed"
+        else:
+            signature = "no signature field"
+        dates = f"lease {v['lease_start'] or '?'} to {v['lease_end'] or '?'}" if v["lease_start"] or v["lease_end"] else "no lease dates"
+        lines.append(f"Page {v['page']}: {v['summary']} ({signature}; {dates}; confidence {v['confidence']:.2f})")
+    return "\n".join(lines)
+
+
+def vision_pages(verdicts: list) -> list:
+    """Pages with a signature field; the vision stage checks whether they are really signed."""
+    return sorted({v["page"] for verdict in verdicts if verdict for v in verdict["pages"] if v["has_signature_field"]})
+
+
+def needs_second_opinion(verdict, min_confidence: float = VERDICT_MIN_CONFIDENCE) -> bool:
+    """A failed chunk, or one where any page's answer is below `min_confidence`."""
+    return verdict is None or any(v["confidence"] < min_confidence for v in verdict["pages"])
+
+
+def aggregate_verdicts(verdicts: list, min_confidence: float = VERDICT_MIN_CONFIDENCE) -> dict:
+    """
+    Deterministic decision over every chunk's verdict (None = failed chunk).
+    Only answers at or above `min_confidence` count as evidence; the rest,
+    failed chunks and conflicting or one-sided dates make the document ambiguous.
+    """
+    pages = [v for verdict in verdicts if verdict for v in verdict["pages"]]
+    confident = [v for v in pages if v["confidence"] >= min_confidence]
+    reasons = []
+
+    failed = sum(1 for verdict in verdicts if not verdict)
+    if failed:
+        reasons.append(f"{failed} chunk(s) returned no usable verdict")
+
+    signature_pages = sorted({v["page"] for v in confident if v["has_signature_field"]})
+    signed_pages = sorted({v["page"] for v in confident if v["has_signature_field"] and v["signature_present"]})
+    if not signature_pages:
+        reasons.append("no signature field found")
+
+    starts = sorted({v["lease_start"] for v in confident if v["lease_start"]})
+    ends = sorted({v["lease_end"] for v in confident if v["lease_end"]})
+    if len(starts) > 1 or len(ends) > 1:
+        reasons.append("conflicting lease dates")
+    lease_start = starts[0] if starts else None
+    lease_end = ends[-1] if ends else None
+    valid_date_range = bool(lease_start and lease_end and lease_start < lease_end)
+    if lease_start and lease_end and not valid_date_range:
+        reasons.append("lease ends before it starts")
+    elif lease_start and not lease_end:
+        reasons.append("lease end not stated")  # e.g. a term given in months, which only the reasoning pass can read
+    elif lease_end and not lease_start:
+        reasons.append("lease start not stated")
+
+    unsure = sorted({
+        v["page"] for v in pages
+        if v["confidence"] < min_confidence and (v["has_signature_field"] or v["lease_start"] or v["lease_end"])
+    })
+    if unsure:
+        reasons.append(f"low confidence on pages {unsure}")
+
+    is_signed = "yes" if signature_pages and signed_pages == signature_pages else "no"
+    return {
+        "is_signed": is_signed,
+        "valid_date_range": valid_date_range,
+        "lease_start": lease_start,
+        "lease_end": lease_end,
+        "signature_pages": signature_pages,
+        "signed_pages": signed_pages,
+        "vision_pages": vision_pages(verdicts),
+        "ambiguous": bool(reasons),
+        "reasons": reasons
+    }
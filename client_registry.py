@@ -0,0 +1,57 @@
+import os
+import threading
+from functools import lru_cache
+
+# ======= Process-Wide Client Registry =======
+# API clients are built on first use and then shared by every caller in the
+# process (Streamlit reruns, worker threads), so importing a module never
+# pays for an SDK import, a .env read or a client construction.
+#
+#   get_client("openai") -> openai.OpenAI
+#   get_client("twilio") -> twilio.rest.Client
+
+_clients = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_env() -> None:
+    """Reads .env once per process."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def _twilio_client():
+    from twilio.rest import Client
+    return Client(os.getenv("TWILIO_SID"), os.getenv("TWILIO_TOKEN"))
+
+
+_factories = {"openai": _openai_client, "twilio": _twilio_client}
+
+
+def register_client(name: str, factory) -> None:
+    """Adds or replaces a factory; drops any client already built with the old one."""
+    with _lock:
+        _factories[name] = factory
+        _clients.pop(name, None)
+
+
+def get_client(name: str):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                load_env()
+                client = _clients[name] = _factories[name]()
+    return client
+
+
+def reset_clients() -> None:
+    with _lock:
+        _clients.clear()
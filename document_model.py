@@ -0,0 +1,131 @@
+import hashlib
+from page_triage import layout_features
+from signature_detector import signature_layout
+from text_cleaner import clean_pdf_text
+
+# ======= Parsed Document Model =======
+# One pdfplumber pass per upload. Every stage (summarization, signature page
+# search, vision rendering) reads pages from here instead of reopening the PDF.
+
+
+class PageRecord:
+    __slots__ = ("number", "text", "cleaned_text", "text_hash", "visual_hash", "layout", "signature_layout", "images")
+
+    def __init__(self, number: int, text: str, cleaned_text: str, layout: dict = None, visual_hash: str = "",
+                 signature_layout: dict = None):
+        self.number = number
+        self.text = text
+        self.cleaned_text = cleaned_text
+        self.text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.visual_hash = visual_hash  # images, vector paths and annotations; see visual_fingerprint
+        self.layout = layout or {}  # h_lines / form_fields / images counts for page triage
+        self.signature_layout = signature_layout  # signature fields for the local signature check; None = not collected
+        self.images = {}  # (dpi, grayscale) -> PIL image, filled on first render
+
+    @property
+    def fingerprint(self) -> str:
+        """Changes when the page's text or anything drawn on it changes (e.g. a signature added)."""
+        return hashlib.sha256(f"{self.text_hash}:{self.visual_hash}".encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return f"PageRecord(number={self.number}, chars={len(self.text)})"
+
+
+class ParsedDocument:
+    __slots__ = ("path", "doc_hash", "pages")
+
+    def __init__(self, path: str, doc_hash: str, pages: list):
+        self.path = path
+        self.doc_hash = doc_hash
+        self.pages = pages
+
+    def __len__(self):
+        return len(self.pages)
+
+    def page(self, page_number: int) -> PageRecord:
+        """1-based lookup, matching pdf2image and the trace files."""
+        return self.pages[page_number - 1]
+
+    def full_text(self) -> str:
+        return "\n".join(p.text for p in self.pages if p.text).strip()
+
+    def render_page(self, page_number: int, dpi: int = 200, grayscale: bool = False):
+        return self.render_pages([page_number], dpi=dpi, grayscale=grayscale)[page_number]
+
+    def render_pages(self, page_numbers, dpi: int = 200, grayscale: bool = False) -> dict:
+        """
+        Renders every requested page that isn't cached yet. pdf2image can only
+        render page ranges, so nearby pages share one pass over their span.
+        """
+        key = (dpi, grayscale)
+        missing = sorted({n for n in page_numbers if key not in self.page(n).images})
+        if missing:
+            from pdf2image import convert_from_path
+
+            for first, last in page_runs(missing):
+                images = convert_from_path(
+                    self.path, dpi=dpi, grayscale=grayscale, first_page=first, last_page=last,
+                    thread_count=min(4, last - first + 1)
+                )
+                for number, image in zip(range(first, last + 1), images):
+                    self.page(number).images[key] = image
+
+        return {n: self.page(n).images[key] for n in page_numbers}
+
+
+def page_runs(page_numbers: list, max_gap: int = 2) -> list:
+    """[2, 3, 5, 40] -> [(2, 5), (40, 40)]: merges pages at most `max_gap` apart."""
+    runs = []
+    for number in sorted(page_numbers):
+        if runs and number - runs[-1][1] <= max_gap:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
+    return [tuple(run) for run in runs]
+
+
+def visual_fingerprint(page) -> str:
+    """
+    Hash of what a pdfplumber page draws besides its text: embedded images
+    (by content), lines, rects, curves and annotations. A scanned or drawn
+    signature changes it without rendering the page.
+    """
+    digest = hashlib.sha256()
+    for image in page.images:
+        data = image["stream"].get_rawdata() or b""
+        digest.update(f"img:{image['srcsize']}:{_box(image)}:".encode("utf-8") + hashlib.sha256(data).digest())
+    for kind in ("lines", "rects", "curves"):
+        for obj in getattr(page, kind):
+            points = [(round(x), round(y)) for x, y in obj.get("pts") or []]
+            digest.update(f"{kind}:{_box(obj)}:{points}".encode("utf-8"))
+    for annot in page.annots:
+        data = annot.get("data") or {}
+        digest.update(f"annot:{data.get('Subtype')}:{_box(annot)}:{annot.get('contents')}:{'V' in data}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _box(obj: dict) -> tuple:
+    return tuple(round(obj.get(k) or 0) for k in ("x0", "top", "x1", "bottom"))
+
+
+def file_hash(pdf_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_document(pdf_path: str) -> ParsedDocument:
+    import pdfplumber  # deferred: the intake page imports this module but never parses
+
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num, page in enumerate(pdf.pages, start=1):
+            raw_text = page.extract_text() or ""
+            pages.append(PageRecord(page_num, raw_text, clean_pdf_text(raw_text), layout_features(page),
+                                    visual_fingerprint(page), signature_layout(page)))
+            page.flush_cache()  # drop pdfplumber's per-page object cache as we go
+
+    print(f"[📚] Parsed {len(pages)} pages from {pdf_path}")
+    return ParsedDocument(pdf_path, file_hash(pdf_path), pages)
@@ -1,28 +1,87 @@
 import smtplib
 from email.message import EmailMessage
 import os
-from dotenv import load_dotenv
+from client_registry import load_env
+from span_utils import span
 
-load_dotenv()
 
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+def smtp_config() -> dict:
+    """SMTP settings, read on first use (after .env) rather than at import."""
+    load_env()
+    return {
+        "host": os.getenv("SMTP_SERVER"),
+        "port": int(os.getenv("SMTP_PORT", 587)),
+        "starttls": os.getenv("SMTP_STARTTLS", "1") == "1",  # 0 for a local debugging server
+        "user": os.getenv("EMAIL_ADDRESS"),
+        "password": os.getenv("EMAIL_PASSWORD"),
+    }
 
-def send_email(to_email: str, subject: str, body: str):
+
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = EMAIL_ADDRESS
+    msg["From"] = smtp_config()["user"]
     msg["To"] = to_email
     msg.set_content(body)
+    return msg
 
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
+
+class SMTPSession:
+    """
+    One connected, authenticated SMTP session reused for many messages.
+    Reconnects once if the server has dropped an idle connection.
+    """
+
+    def __init__(self, host: str = None, port: int = None, user: str = None, password: str = None,
+                 starttls: bool = None, timeout: float = 30):
+        config = smtp_config()
+        self.host = host or config["host"]
+        self.port = port or config["port"]
+        self.user = user if user is not None else config["user"]
+        self.password = password if password is not None else config["password"]
+        self.starttls = starttls if starttls is not None else config["starttls"]
+        self.timeout = timeout
+        self._smtp = None
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
             smtp.starttls()
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.send_message(msg)
+        if self.user and self.password:
+            smtp.login(self.user, self.password)
+        self._smtp = smtp
+
+    def send(self, msg: EmailMessage) -> None:
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._connect()
+            self._smtp.send_message(msg)
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def send_email(to_email: str, subject: str, body: str):
+    """Sends one message right away. Submissions go through notification_outbox instead."""
+    try:
+        with span("email_dispatch"):
+            with SMTPSession() as session:
+                session.send(build_message(to_email, subject, body))
         return True
     except Exception as e:
         print("❌ Email failed:", e)
-        return False
\ No newline at end of file
+        return False
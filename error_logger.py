@@ -1,5 +1,5 @@
-import json
 from datetime import datetime
+import log_store
 
 def log_extraction_error(ticket_id, filename, error_detail):
     error_entry = {
@@ -9,5 +9,4 @@ def log_extraction_error(ticket_id, filename, error_detail):
         "timestamp": datetime.utcnow().isoformat()
     }
 
-    with open("error_log.json", "a") as f:
-        f.write(json.dumps(error_entry) + "\n")
\ No newline at end of file
+    log_store.insert("errors", error_entry)
@@ -0,0 +1,23 @@
+import os
+import json
+
+# ======= Labeled Leases =======
+# ground_truth.json maps a PDF file name to what a reviewer found in it:
+#
+#   "lease.pdf": {
+#       "signed": true,                 # is the lease fully signed?
+#       "signature_pages": [3, 4, 5],   # pages with a signature field or signature
+#       "signed_pages": [4, 5],         # pages that actually bear a signature (a subset of signature_pages)
+#       "date_pages": [1],              # pages stating the lease start/end
+#       "lease_start": "2024-09-13",    # ISO date or null
+#       "lease_end": null
+#   }
+
+GROUND_TRUTH_FILE = "ground_truth.json"
+
+
+def load_labels(path: str = GROUND_TRUTH_FILE) -> dict:
+    with open(path, "r") as f:
+        labels = json.load(f)
+    # Keyed by file name so labels work wherever the PDFs live
+    return {os.path.basename(name): label for name, label in labels.items()}
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+
+# ======= Persistent Job Queue (SQLite) =======
+# Jobs move queued -> running -> done | failed. A running job holds a lease
+# that its worker renews with heartbeat(); if the worker dies the lease runs
+# out and the next claim() picks the job up again (at-least-once delivery).
+
+JOB_DB = os.getenv("JOB_DB", "jobs.db")
+DEFAULT_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    ticket_id TEXT,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_ticket ON jobs (ticket_id);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id);
+"""
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or JOB_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _row_to_job(row) -> dict:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def enqueue(ticket_id: str, payload: dict, job_id: str = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS, db_path: str = None) -> str:
+    job_id = job_id or uuid.uuid4().hex
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, ticket_id, status, payload, max_attempts, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, ticket_id, json.dumps(payload), max_attempts, now, now)
+        )
+    finally:
+        conn.close()
+    return job_id
+
+
+def claim(worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS, db_path: str = None) -> dict:
+    """
+    Atomically takes the oldest queued job, or a running job whose lease
+    expired (its worker is presumed dead). Returns None when idle.
+    """
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id FROM jobs "
+            "WHERE status = 'queued' "
+            "OR (status = 'running' AND lease_until < ? AND attempts < max_attempts) "
+            "ORDER BY created_at LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+            "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (worker_id, now + lease_seconds, now, row["id"])
+        )
+        conn.execute("DELETE FROM job_events WHERE job_id = ?", (row["id"],))  # a retry reports progress from scratch
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+        conn.execute("COMMIT")
+        return _row_to_job(job)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def heartbeat(job_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS, db_path: str = None) -> bool:
+    """Extends the lease. False means another worker has taken the job over."""
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (now + lease_seconds, now, job_id, worker_id)
+        )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def complete(job_id: str, worker_id: str, result: dict, db_path: str = None) -> bool:
+    """Records the result. False means the lease ran out and another worker owns the job now."""
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (json.dumps(result), time.time(), job_id, worker_id)
+        )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def fail(job_id: str, worker_id: str, error: str, db_path: str = None) -> str:
+    """Requeues the job until it runs out of attempts. Returns the new status, or None if the job isn't ours anymore."""
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+            "error = ?, lease_until = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (error, time.time(), job_id, worker_id)
+        )
+        row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone() if cur.rowcount else None
+        conn.execute("COMMIT")
+        return row["status"] if row else None
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def recover_stuck(db_path: str = None) -> int:
+    """Requeues running jobs whose lease has expired; returns how many."""
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+            "error = COALESCE(error, 'lease expired'), lease_until = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_until < ?",
+            (now, now)
+        )
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def get_job(job_id: str, db_path: str = None) -> dict:
+    conn = connect(db_path)
+    try:
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def active_job_ids(db_path: str = None) -> set:
+    """Ids of queued and running jobs (their workspaces must be kept)."""
+    conn = connect(db_path)
+    try:
+        return {row["id"] for row in conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')")}
+    finally:
+        conn.close()
+
+
+# ======= Progress Events =======
+# Workers append events while a job runs (pipeline stages, per-chunk verdicts,
+# vision results, streamed text); the intake page polls them with
+# get_events(job_id, after=<last id seen>) to show results as they land.
+
+def add_event(job_id: str, kind: str, data: dict, db_path: str = None) -> int:
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "INSERT INTO job_events (job_id, kind, data, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, kind, json.dumps(data), time.time())
+        )
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+def get_events(job_id: str, after: int = 0, db_path: str = None) -> list:
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT id, kind, data, created_at FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, after)
+        ).fetchall()
+        return [{"id": row["id"], "kind": row["kind"], "data": json.loads(row["data"]), "created_at": row["created_at"]}
+                for row in rows]
+    finally:
+        conn.close()
+
+
+def queue_depth(db_path: str = None) -> dict:
+    conn = connect(db_path)
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+    finally:
+        conn.close()
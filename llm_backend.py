@@ -0,0 +1,431 @@
+import os
+import re
+import sys
+import json
+import glob
+import time
+import random
+import threading
+from types import SimpleNamespace
+from llm_cache import make_key
+from client_registry import get_client
+
+# ======= Pluggable LLM Backends =======
+# Every chat completion in the pipeline goes through get_backend().chat(...),
+# which takes the same keyword arguments as client.chat.completions.create.
+# get_backend().chat_stream(on_delta, ...) is the same call with the content
+# handed to on_delta as it streams in (live only; the others send it whole).
+#
+#   LLM_BACKEND=live    -> real OpenAI calls (default)
+#   LLM_BACKEND=record  -> real calls, each request/response pair saved to LLM_RECORD_DIR
+#   LLM_BACKEND=replay  -> served from LLM_RECORD_DIR by request fingerprint, no network
+#   LLM_BACKEND=stub    -> canned answers after LLM_STUB_LATENCY seconds, no network
+#
+# live and record calls go through the rate-limit scheduler (see llm_scheduler)
+# unless LLM_SCHEDULER=0.
+
+RECORD_DIR = os.getenv("LLM_RECORD_DIR", "llm_recordings")
+LLM_SCHEDULER = os.getenv("LLM_SCHEDULER", "1") == "1"
+
+
+class ReplayMissError(KeyError):
+    pass
+
+
+def fingerprint(request: dict) -> str:
+    return make_key(**request)
+
+
+def response_to_dict(response) -> dict:
+    if isinstance(response, dict):
+        return response
+    if hasattr(response, "model_dump"):
+        return response.model_dump()
+    return json.loads(json.dumps(response, default=lambda o: o.__dict__))
+
+
+def dict_to_response(data):
+    """Rebuilds attribute access (response.choices[0].message.content) from a dict."""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: dict_to_response(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [dict_to_response(v) for v in data]
+    return data
+
+
+def text_response(content: str, model: str, usage: dict = None) -> dict:
+    return {
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content, "tool_calls": None}
+        }],
+        "usage": usage
+    }
+
+
+def assemble_stream(chunks, on_delta) -> SimpleNamespace:
+    """
+    Folds a stream=True completion back into a regular response, calling
+    on_delta(text) for each piece of content as it arrives. Tool call
+    fragments are joined by index.
+    """
+    model, content, finish_reason, usage = None, [], None, None
+    tool_calls = {}
+    for chunk in chunks:
+        model = model or chunk.model
+        if getattr(chunk, "usage", None):
+            usage = response_to_dict(chunk.usage)
+        for choice in chunk.choices:
+            delta = choice.delta
+            if delta.content:
+                content.append(delta.content)
+                on_delta(delta.content)
+            for fragment in delta.tool_calls or []:
+                call = tool_calls.setdefault(fragment.index, {"id": None, "type": "function",
+                                                             "function": {"name": "", "arguments": ""}})
+                call["id"] = fragment.id or call["id"]
+                if fragment.function:
+                    call["function"]["name"] += fragment.function.name or ""
+                    call["function"]["arguments"] += fragment.function.arguments or ""
+            finish_reason = choice.finish_reason or finish_reason
+
+    data = text_response("".join(content) or None, model, usage)
+    data["choices"][0]["finish_reason"] = finish_reason
+    data["choices"][0]["message"]["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)] or None
+    return dict_to_response(data)
+
+
+class LLMBackend:
+    name = "base"
+
+    def chat(self, **request):
+        raise NotImplementedError
+
+    def chat_stream(self, on_delta, **request):
+        """
+        chat() that calls on_delta(text) as the answer's content arrives and
+        returns the same response object. Backends without real streaming
+        hand over the whole content in one piece.
+        """
+        response = self.chat(**request)
+        content = response.choices[0].message.content
+        if content:
+            on_delta(content)
+        return response
+
+
+class LiveBackend(LLMBackend):
+    name = "live"
+
+    def __init__(self, api_key: str = None, max_retries: int = None):
+        self.api_key = api_key
+        self.max_retries = max_retries  # None keeps the SDK's own retries; 0 when the scheduler retries
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self.api_key is None:
+            client = get_client("openai")  # the process-wide client
+        else:
+            if self._client is None:
+                with self._lock:
+                    if self._client is None:
+                        from openai import OpenAI
+                        self._client = OpenAI(api_key=self.api_key)
+            client = self._client
+        return client if self.max_retries is None else client.with_options(max_retries=self.max_retries)
+
+    def chat(self, **request):
+        return self.client.chat.completions.create(**request)
+
+    def chat_stream(self, on_delta, **request):
+        stream = self.client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+        return assemble_stream(stream, on_delta)
+
+
+class RecordBackend(LLMBackend):
+    name = "record"
+
+    def __init__(self, inner: LLMBackend = None, record_dir: str = RECORD_DIR):
+        self.inner = inner or LiveBackend()
+        self.record_dir = record_dir
+        os.makedirs(record_dir, exist_ok=True)
+
+    def chat(self, **request):
+        start = time.time()
+        response = self.inner.chat(**request)
+        elapsed = time.time() - start
+
+        save_recording(self.record_dir, request, response_to_dict(response), elapsed)
+        return response
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Serves recorded responses. `latency` is either a fixed number of seconds,
+    "recorded" to sleep for the originally measured duration, or a callable
+    (request, recording) -> seconds.
+    """
+    name = "replay"
+
+    def __init__(self, record_dir: str = RECORD_DIR, latency=0.0):
+        self.record_dir = record_dir
+        self.latency = latency
+
+    def _delay(self, request, recording) -> float:
+        if callable(self.latency):
+            return self.latency(request, recording)
+        if self.latency == "recorded":
+            return recording.get("elapsed") or 0.0
+        return float(self.latency or 0.0)
+
+    def chat(self, **request):
+        key = fingerprint(request)
+        path = os.path.join(self.record_dir, f"{key}.json")
+        try:
+            with open(path, "r") as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMissError(f"No recording for request {key} (model={request.get('model')})")
+
+        delay = self._delay(request, recording)
+        if delay > 0:
+            time.sleep(delay)
+        return dict_to_response(recording["response"])
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline stand-in with canned answers for load tests and benchmarks.
+    Each call sleeps base_latency + per_token_latency * completion_tokens (+ jitter).
+    """
+    name = "stub"
+
+    def __init__(self, base_latency: float = 0.5, per_token_latency: float = 0.0, jitter: float = 0.0, seed: int = None):
+        self.base_latency = base_latency
+        self.per_token_latency = per_token_latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _respond(self, request: dict) -> dict:
+        model = request.get("model", "stub")
+        user_content = request["messages"][-1]["content"]
+
+        if request.get("tools") and request["messages"][-1]["role"] != "tool":
+            prompt = " ".join(m["content"] for m in request["messages"] if isinstance(m.get("content"), str))
+            ticket = STUB_TICKET.search(prompt)
+            reference = json.dumps({"ticket_id": ticket.group(1) if ticket else "", "start_page": 1})
+            tool_calls = [
+                {"id": "call_sig", "type": "function",
+                 "function": {"name": "check_signature", "arguments": reference}},
+                {"id": "call_dates", "type": "function",
+                 "function": {"name": "validate_lease_dates", "arguments": reference}},
+            ]
+            data = text_response(None, model)
+            data["choices"][0]["message"]["tool_calls"] = tool_calls
+            data["choices"][0]["finish_reason"] = "tool_calls"
+            return data
+
+        if request["messages"][-1]["role"] == "tool":
+            return text_response("The lease was reviewed with the tool results above.", model)
+
+        if isinstance(user_content, list):
+            return text_response("Yes, a handwritten signature is visible on this page.", model)
+
+        if request.get("response_format"):
+            return text_response(json.dumps(stub_verdict(user_content)), model)
+
+        if "sign" in user_content.lower():
+            content = "Summary of the page. This page contains a signature field for the residents. Lease dates are not expected here."
+        else:
+            content = "Summary of the page. No visual signature field is expected. Lease dates are not expected here."
+        return text_response(content, model)
+
+    def chat(self, **request):
+        data = self._respond(request)
+        prompt_chars = sum(len(m["content"]) for m in request["messages"] if isinstance(m.get("content"), str))
+        message = data["choices"][0]["message"]
+        completion_chars = len(message["content"] or "") + sum(len(c["function"]["arguments"]) for c in message["tool_calls"] or [])
+        completion_tokens = completion_chars // 4 or 20
+        data["usage"] = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_chars // 4 + completion_tokens
+        }
+
+        with self._lock:
+            self.calls += 1
+            jitter = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        time.sleep(self.base_latency + self.per_token_latency * completion_tokens + jitter)
+        return dict_to_response(data)
+
+
+class BoundedBackend(LLMBackend):
+    """
+    Caps requests in flight across every thread that shares this backend
+    (e.g. all documents of a batch run), on top of each stage's own pool.
+    """
+    name = "bounded"
+
+    def __init__(self, inner: LLMBackend, max_in_flight: int):
+        self.inner = inner
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def chat(self, **request):
+        with self._slots:
+            return self.inner.chat(**request)
+
+    def chat_stream(self, on_delta, **request):
+        with self._slots:
+            return self.inner.chat_stream(on_delta, **request)
+
+
+class ScheduledBackend(LLMBackend):
+    """
+    Runs every call through the rate-limit scheduler: it waits for the
+    model's token buckets in priority order and retries 429s and transient
+    errors with backoff (see llm_scheduler).
+    """
+    name = "scheduled"
+
+    def __init__(self, inner: LLMBackend, scheduler=None):
+        from llm_scheduler import get_scheduler
+        self.inner = inner
+        self.scheduler = scheduler or get_scheduler()
+
+    def chat(self, **request):
+        return self.scheduler.call(request, lambda: self.inner.chat(**request))
+
+    def chat_stream(self, on_delta, **request):
+        started = []
+
+        def forward(text):
+            started.append(True)
+            on_delta(text)
+
+        # Once text has been shown, a retry would repeat it; only failures before the first delta are retried
+        return self.scheduler.call(request, lambda: self.inner.chat_stream(forward, **request),
+                                   can_retry=lambda: not started)
+
+
+STUB_PAGE_MARKER = re.compile(r"^\[Page (\d+)\]$", re.MULTILINE)
+STUB_TICKET = re.compile(r"ticket ID: (\S+)")
+STUB_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+
+
+def stub_verdict(chunk: str) -> dict:
+    """Canned structured verdict: signature words mean a signed field, the first two dates are the term."""
+    parts = STUB_PAGE_MARKER.split(chunk)
+    pages = list(zip(parts[1::2], parts[2::2])) or [("1", chunk)]
+    verdicts = []
+    for number, text in pages:
+        has_field = "sign" in text.lower()
+        dates = ["%s-%02d-%02d" % (y, int(m), int(d)) for m, d, y in STUB_DATE.findall(text)[:2]]
+        verdicts.append({
+            "page": int(number),
+            "summary": "Summary of the page.",
+            "has_signature_field": has_field,
+            "signature_present": has_field,
+            "lease_start": dates[0] if len(dates) == 2 else None,
+            "lease_end": dates[1] if len(dates) == 2 else None,
+            "confidence": 0.9
+        })
+    return {"pages": verdicts}
+
+
+def save_recording(record_dir: str, request: dict, response: dict, elapsed: float = None) -> str:
+    key = fingerprint(request)
+    path = os.path.join(record_dir, f"{key}.json")
+    with open(path, "w") as f:
+        json.dump({"request": request, "response": response, "elapsed": elapsed}, f)
+    return path
+
+
+# ======= Process-wide Backend =======
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def build_backend(kind: str = None) -> LLMBackend:
+    kind = (kind or os.getenv("LLM_BACKEND", "live")).lower()
+    if kind == "live":
+        return ScheduledBackend(LiveBackend(max_retries=0)) if LLM_SCHEDULER else LiveBackend()
+    if kind == "record":
+        if LLM_SCHEDULER:
+            return ScheduledBackend(RecordBackend(LiveBackend(max_retries=0)))
+        return RecordBackend()
+    if kind == "replay":
+        latency = os.getenv("LLM_REPLAY_LATENCY", "0")
+        return ReplayBackend(latency=latency if latency == "recorded" else float(latency))
+    if kind == "stub":
+        return StubBackend(base_latency=float(os.getenv("LLM_STUB_LATENCY", "0.5")))
+    raise ValueError(f"Unknown LLM_BACKEND: {kind}")
+
+
+def get_backend() -> LLMBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = build_backend()
+    return _backend
+
+
+def set_backend(backend: LLMBackend) -> None:
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# ======= Seeding Replay Recordings from Existing Traces =======
+
+def seed_from_traces(trace_dir: str = "traces", record_dir: str = RECORD_DIR) -> int:
+    from text_utils import build_summary_request
+    from trace_store import trace_files, read_trace
+
+    os.makedirs(record_dir, exist_ok=True)
+    seeded = 0
+    for trace_file in trace_files(trace_dir):
+        for entry in read_trace(trace_file, with_text=True, trace_dir=trace_dir):
+            if not entry.get("verdict") or entry.get("reused"):
+                continue  # skipped, reused and failed pages and pre-verdict traces have no call to replay
+            request = build_summary_request(entry["chunk_text"], entry.get("model"))
+            save_recording(record_dir, request, text_response(json.dumps(entry["verdict"]), request["model"]))
+            seeded += 1
+    return seeded
+
+
+def seed_from_ab_traces(trace_dir: str = "ab_traces", record_dir: str = RECORD_DIR) -> int:
+    from text_utils import build_summary_request
+
+    os.makedirs(record_dir, exist_ok=True)
+    seeded = 0
+    for trace_file in sorted(glob.glob(os.path.join(trace_dir, "abtest_*.json"))):
+        with open(trace_file, "r") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            continue  # free-text runs from before the harness used the production request
+        for call in data["calls"]:
+            if not call.get("verdict"):
+                continue
+            request = build_summary_request(call["chunk_text"], call["model"])
+            save_recording(record_dir, request, text_response(json.dumps(call["verdict"]), call["model"]))
+            seeded += 1
+    return seeded
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["seed"]:
+        print("Usage: python llm_backend.py seed [record_dir]")
+        sys.exit(1)
+
+    target = sys.argv[2] if len(sys.argv) > 2 else RECORD_DIR
+    count = seed_from_traces(record_dir=target) + seed_from_ab_traces(record_dir=target)
+    print(f"[🌱] Seeded {count} recordings into {target}")
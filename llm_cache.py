@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# ======= Content-Addressed LLM Response Cache =======
+# Entries live in cache/llm/<key[:2]>/<key>.json where key is a sha256 over
+# everything that can change the model's answer (input, model, prompt, params).
+
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("cache", "llm"))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_MAX_AGE = int(os.getenv("LLM_CACHE_MAX_AGE", 30 * 24 * 3600))
+CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+
+
+def make_key(**parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE, bypass=CACHE_BYPASS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None  # bytes on disk, computed on first write
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        if self.bypass:
+            return None
+
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.max_age:
+                self._remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r") as f:
+                value = json.load(f)
+            os.utime(path)  # mtime doubles as last-access time for eviction
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value) -> None:
+        if self.bypass:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+
+        # Write-then-rename so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += len(data)
+            over_budget = self._size > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+    def _remove(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+            if self._size is not None:
+                self._size -= size
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_mtime, st.st_size
+
+    def _disk_usage(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self) -> None:
+        """Drop expired entries, then least recently used ones until under budget."""
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+
+        for path, mtime, size in entries:
+            if now - mtime <= self.max_age and total <= self.max_bytes * 0.9:
+                break
+            self._remove(path)
+            total -= size
+
+        with self._lock:
+            self._size = total
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bypass": self.bypass,
+        }
+
+
+# Shared by text_utils (chunk summaries) and vision_utils (signature checks)
+llm_cache = LLMCache()
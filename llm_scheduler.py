@@ -0,0 +1,369 @@
+"""
+Rate-limit-aware scheduling of LLM calls.
+
+Every call made through a ScheduledBackend (the default for the live and
+record backends, see llm_backend) first takes a request and its estimated
+tokens from the model's token buckets, then runs, and is retried with
+jittered exponential backoff on 429s, 5xx and connection errors, honoring
+Retry-After. Under load calls wait for the rate limit instead of failing.
+
+The buckets (requests/min and tokens/min per model) live in SQLite, so all
+worker processes on the host share one budget. Priority classes:
+
+    interactive  intake submissions (default)
+    batch        batch_verify.py
+    backfill     experiments such as summarize_ab_test.py
+
+Within a process, waiting calls are served highest priority first, then in
+arrival order. Across processes, lower classes leave a reserve of each
+bucket (PRIORITY_RESERVE) for the higher ones.
+
+    with llm_priority("batch"):
+        ...                       # calls made here, and in map_in_context workers
+"""
+import os
+import json
+import time
+import heapq
+import random
+import sqlite3
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from span_utils import annotate
+
+# ======= Settings =======
+# (requests/min, tokens/min) per model, OpenAI's usage tier 1. Raise them to
+# your account's limits with LLM_RATE_LIMITS_FILE, a JSON object of
+# {"model": [rpm, tpm]}; 0 disables that bucket.
+
+RATE_LIMITS = {
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000),
+    "gpt-4.1": (500, 30000),
+    "gpt-4.1-mini": (500, 200000),
+    "gpt-4.1-nano": (500, 200000),
+    "gpt-3.5-turbo": (3500, 200000),
+}
+DEFAULT_RATE_LIMIT = (500, 30000)
+
+if os.getenv("LLM_RATE_LIMITS_FILE"):
+    with open(os.getenv("LLM_RATE_LIMITS_FILE"), "r") as f:
+        RATE_LIMITS.update({model: tuple(limits) for model, limits in json.load(f).items()})
+
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "rate_limits.db")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 6))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1.0))  # seconds, doubles per retry
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 60.0))
+DEFAULT_PRIORITY = os.getenv("LLM_PRIORITY", "interactive")
+
+PRIORITIES = {"interactive": 0, "batch": 1, "backfill": 2}
+PRIORITY_RESERVE = {"interactive": 0.0, "batch": 0.2, "backfill": 0.5}  # share of each bucket left for higher classes
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+IMAGE_TOKENS = 1000  # rough cost of one image part
+DEFAULT_COMPLETION_TOKENS = 512  # reserved when a request sets no max_tokens
+MAX_POLL = 1.0  # re-check the shared buckets at least this often while waiting
+WAIT_SAMPLES = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    model TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or RATE_LIMIT_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+_local = threading.local()
+
+
+def bucket_store(db_path: str = None) -> sqlite3.Connection:
+    """This thread's connection to the buckets; every call takes from them, so it's opened once per thread, not per take."""
+    db_path = db_path or RATE_LIMIT_DB
+    conns = _local.__dict__.setdefault("conns", {})
+    if db_path not in conns:
+        conns[db_path] = connect(db_path)
+    return conns[db_path]
+
+
+# ======= Priority Classes =======
+
+_priority = contextvars.ContextVar("llm_priority", default=None)
+
+
+@contextmanager
+def llm_priority(name: str):
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_default_priority(name: str) -> None:
+    """Priority of every call in this process outside llm_priority(), e.g. for a batch CLI."""
+    global DEFAULT_PRIORITY
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    DEFAULT_PRIORITY = name
+
+
+def current_priority() -> str:
+    return _priority.get() or DEFAULT_PRIORITY
+
+
+# ======= Estimating and Retrying =======
+
+def estimate_tokens(request: dict) -> int:
+    """What the call counts against tokens/min: roughly 4 characters per prompt token plus max_tokens."""
+    chars, images = len(json.dumps(request.get("tools") or "")), 0
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    images += 1
+                else:
+                    chars += len(part.get("text") or "")
+        else:
+            chars += len(content or "")
+        chars += len(json.dumps(message.get("tool_calls") or ""))
+    completion = request.get("max_tokens") or request.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return chars // 4 + images * IMAGE_TOKENS + 4 * len(request.get("messages", [])) + completion
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())  # HTTP date form
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error) -> bool:
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False  # a 429 that waiting won't fix
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, openai.APIConnectionError)  # includes timeouts
+
+
+def backoff_delay(retry: int, hint: float = None, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX,
+                  rng=random) -> float:
+    """Full-jitter exponential backoff; a Retry-After hint is honored, plus a little jitter so waiters don't stampede."""
+    if hint is not None:
+        return min(cap, hint) + rng.uniform(0, base)
+    return rng.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+# ======= Shared Token Buckets =======
+
+def take(model: str, tokens: int, priority: str = "interactive", db_path: str = None, now: float = None) -> float:
+    """
+    Takes one request and `tokens` from the model's buckets if both have
+    enough above the priority's reserve. Returns 0 when taken, otherwise the
+    seconds until they will have (or until a Retry-After block ends).
+    """
+    rpm, tpm = RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+    reserve = PRIORITY_RESERVE[priority]
+    now = now or time.time()
+    conn = bucket_store(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT * FROM buckets WHERE model = ?", (model,)).fetchone()
+        requests, bucket_tokens, blocked_until = (row["requests"], row["tokens"], row["blocked_until"]) if row else (rpm, tpm, 0)
+        elapsed = max(0.0, now - row["updated_at"]) if row else 0.0
+        requests = min(rpm, requests + elapsed * rpm / 60)
+        bucket_tokens = min(tpm, bucket_tokens + elapsed * tpm / 60)
+        tokens = min(tokens, tpm * (1 - reserve))  # an oversized call still gets through once the bucket is full
+
+        if now < blocked_until:
+            wait = blocked_until - now
+        else:
+            wait = max(
+                (reserve * rpm + 1 - requests) * 60 / rpm if rpm else 0.0,
+                (reserve * tpm + tokens - bucket_tokens) * 60 / tpm if tpm else 0.0,
+                0.0
+            )
+        if wait == 0:
+            requests -= 1
+            bucket_tokens -= tokens
+
+        conn.execute(
+            "INSERT INTO buckets (model, requests, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (model) DO UPDATE SET requests = excluded.requests, tokens = excluded.tokens, "
+            "updated_at = excluded.updated_at",
+            (model, requests, bucket_tokens, now, blocked_until)
+        )
+        conn.execute("COMMIT")
+        return wait
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def block(model: str, seconds: float, db_path: str = None) -> None:
+    """After a 429, holds every process's calls to the model for `seconds`."""
+    until = time.time() + seconds
+    rpm, tpm = RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+    bucket_store(db_path).execute(
+        "INSERT INTO buckets (model, requests, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (model) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+        (model, rpm, tpm, time.time(), until)
+    )
+
+
+# ======= Scheduler =======
+
+class LLMScheduler:
+    """Orders this process's waiting calls by priority and runs them through the shared buckets with retries."""
+
+    def __init__(self, db_path: str = None, max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, seed: int = None):
+        self.db_path = db_path
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._random = random.Random(seed)
+        self._cond = threading.Condition()
+        self._queues = {}  # model -> heap of (priority rank, arrival)
+        self._arrivals = itertools.count()
+        self._metrics = {}
+
+    def _stats_for(self, priority: str) -> dict:
+        return self._metrics.setdefault(priority, {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0,
+                                                   "waits": deque(maxlen=WAIT_SAMPLES)})
+
+    def acquire(self, model: str, tokens: int, priority: str):
+        """
+        Blocks until the call may go. Returns (seconds waited, calls queued
+        ahead of it on arrival). The queue decides who asks the shared
+        buckets next; the SQLite round trip itself runs outside the lock so
+        other threads can keep queueing and dequeueing meanwhile.
+        """
+        entry = (PRIORITIES[priority], next(self._arrivals))
+        start = time.time()
+        with self._cond:
+            queue = self._queues.setdefault(model, [])
+            depth = len(queue)
+            heapq.heappush(queue, entry)
+            self._cond.notify_all()  # a new head may have arrived
+        try:
+            while True:
+                with self._cond:
+                    while queue[0] != entry:
+                        self._cond.wait(MAX_POLL)
+                wait = take(model, tokens, priority, self.db_path)
+                if wait == 0:
+                    break
+                with self._cond:
+                    self._cond.wait(min(wait, MAX_POLL))
+        finally:
+            with self._cond:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+        return time.time() - start, depth
+
+    def call(self, request: dict, fn, can_retry=None):
+        """Runs fn() for `request` once the rate limit allows, retrying transient failures."""
+        model = request.get("model", "default")
+        tokens = estimate_tokens(request)
+        priority = current_priority()
+        waited, retries, depth = 0.0, 0, 0
+        try:
+            while True:
+                seconds, depth = self.acquire(model, tokens, priority)
+                waited += seconds
+                try:
+                    return fn()
+                except Exception as e:
+                    hint = retry_after(e)
+                    limited = getattr(e, "status_code", None) == 429
+                    if limited:
+                        with self._cond:
+                            self._stats_for(priority)["rate_limited"] += 1
+                    if retries >= self.max_retries or not is_retryable(e) or (can_retry and not can_retry()):
+                        with self._cond:
+                            self._stats_for(priority)["failed"] += 1
+                        raise
+                    retries += 1
+                    delay = backoff_delay(retries, hint, self.backoff_base, self.backoff_max, self._random)
+                    if limited:
+                        block(model, delay, self.db_path)
+                    print(f"[🚦] {model} {type(e).__name__}, retry {retries}/{self.max_retries} in {delay:.1f}s")
+                    time.sleep(delay)
+                    waited += delay
+        finally:
+            with self._cond:
+                stats = self._stats_for(priority)
+                stats["requests"] += 1
+                stats["retries"] += retries
+                stats["waits"].append(waited)
+            annotate(priority=priority, queue_depth=depth, queue_wait_ms=round(waited * 1000, 2), retries=retries)
+
+    def stats(self) -> dict:
+        """Per priority: calls, retries, 429s, failures, calls waiting now and queue wait percentiles."""
+        with self._cond:
+            queued = {}
+            for queue in self._queues.values():
+                for rank, _ in queue:
+                    name = next(name for name, r in PRIORITIES.items() if r == rank)
+                    queued[name] = queued.get(name, 0) + 1
+            summary = {}
+            for priority, stats in self._metrics.items():
+                waits = sorted(stats["waits"])
+                summary[priority] = {
+                    **{k: v for k, v in stats.items() if k != "waits"},
+                    "queued": queued.get(priority, 0),
+                    "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                    "wait_p95_ms": round(waits[max(0, -(-len(waits) * 95 // 100) - 1)] * 1000, 1) if waits else 0.0,
+                    "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+                }
+            return summary
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
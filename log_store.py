@@ -0,0 +1,241 @@
+"""
+Indexed store for submission and extraction-error logs (SQLite).
+
+submission_logger and error_logger write here; the dashboards page through
+it with filtered queries instead of re-reading flat files. Import the JSONL
+logs written before the store existed (safe to re-run, it resumes where the
+last import stopped):
+
+    python log_store.py import submission_log.json error_log.json
+"""
+import os
+import sys
+import json
+import sqlite3
+
+LOG_DB = os.getenv("LOG_DB", "logs.db")
+
+SUBMISSION_COLUMNS = ["timestamp", "email", "phone", "method", "ticket_id", "result", "duration", "tokens", "cost_usd"]
+ERROR_COLUMNS = ["timestamp", "ticket_id", "filename", "error"]
+
+# Legacy JSONL file -> table it imports into
+LEGACY_LOGS = {"submission_log.json": "submissions", "error_log.json": "errors"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    method TEXT,
+    ticket_id TEXT,
+    result TEXT,
+    duration REAL,
+    tokens INTEGER,
+    cost_usd REAL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_submissions_ticket ON submissions (ticket_id);
+CREATE INDEX IF NOT EXISTS idx_submissions_method_timestamp ON submissions (method, timestamp);
+
+CREATE TABLE IF NOT EXISTS errors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    ticket_id TEXT,
+    filename TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_errors_timestamp ON errors (timestamp);
+CREATE INDEX IF NOT EXISTS idx_errors_ticket ON errors (ticket_id);
+
+-- How far each legacy JSONL file has been imported (byte offset)
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    rows INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = {"submissions": SUBMISSION_COLUMNS, "errors": ERROR_COLUMNS}
+
+# Columns added after a table first shipped; older databases get them on connect
+_ADDED_COLUMNS = {"submissions": {"tokens": "INTEGER", "cost_usd": "REAL"}}
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or LOG_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    _add_missing_columns(conn)
+    return conn
+
+
+def _add_missing_columns(conn) -> None:
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, sql_type in columns.items():
+            if name in existing:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # i.e. another process added it first
+                    raise
+
+
+def _insert(conn, table: str, entries: list) -> None:
+    columns = _COLUMNS[table]
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        [[entry.get(c) for c in columns] for entry in entries]
+    )
+
+
+def insert(table: str, entry: dict, db_path: str = None) -> None:
+    conn = connect(db_path)
+    try:
+        _insert(conn, table, [entry])
+    finally:
+        conn.close()
+
+
+# ======= Filtered, Paginated Queries =======
+
+def _where(method=None, ticket_id=None, since=None, until=None) -> tuple:
+    clauses, params = [], []
+    if method is not None:
+        methods = [method] if isinstance(method, str) else list(method)
+        if not methods:
+            return "WHERE 0", []
+        clauses.append(f"method IN ({', '.join('?' for _ in methods)})")
+        params += methods
+    if ticket_id:
+        clauses.append("ticket_id = ?")
+        params.append(ticket_id)
+    if since:
+        clauses.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        clauses.append("timestamp < ?")
+        params.append(until)
+    return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def query(table: str, limit: int = 50, offset: int = 0, db_path: str = None, **filters) -> list:
+    """Newest first. Filters: method (str or list, submissions only), ticket_id, since, until (ISO timestamps)."""
+    where, params = _where(**filters)
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM {table} {where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def count(table: str, db_path: str = None, **filters) -> int:
+    where, params = _where(**filters)
+    conn = connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} {where}", params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def distinct_methods(db_path: str = None) -> list:
+    conn = connect(db_path)
+    try:
+        rows = conn.execute("SELECT DISTINCT method FROM submissions WHERE method IS NOT NULL ORDER BY method").fetchall()
+        return [row[0] for row in rows]
+    finally:
+        conn.close()
+
+
+def rows_after(table: str, last_id: int = 0, columns: list = None, limit: int = 10000, db_path: str = None) -> list:
+    """Rows inserted after `last_id`, oldest first; lets a dashboard fetch only what is new."""
+    selected = ", ".join(["id"] + (columns or _COLUMNS[table]))
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT {selected} FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+# ======= One-Time JSONL Import =======
+
+def import_jsonl(path: str, table: str, db_path: str = None) -> int:
+    """
+    Imports the lines of a legacy JSONL log that were not imported before.
+    Progress is stored as a byte offset, so re-running only reads new lines.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    key = os.path.abspath(path)
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT offset FROM imports WHERE path = ?", (key,)).fetchone()
+        offset = row["offset"] if row else 0
+        if offset >= os.path.getsize(path):
+            return 0
+
+        entries = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a writer is mid-line; pick it up next time
+                offset += len(line)
+                if line.strip():
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        print(f"[⚠️] Skipping unreadable line in {path}")
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _insert(conn, table, entries)
+            conn.execute(
+                "INSERT INTO imports (path, offset, rows) VALUES (?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET offset = excluded.offset, rows = rows + excluded.rows",
+                (key, offset, len(entries))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(entries)
+    finally:
+        conn.close()
+
+
+def import_legacy_logs(paths: list = None, db_path: str = None) -> dict:
+    """The file name picks the table, so every path must be named like one of LEGACY_LOGS (in any directory)."""
+    paths = paths or list(LEGACY_LOGS)
+    tables = {path: LEGACY_LOGS.get(os.path.basename(path)) for path in paths}
+    unknown = [path for path, table in tables.items() if table is None]
+    if unknown:
+        raise ValueError(f"Unknown legacy log(s) {', '.join(unknown)}; expected files named {' or '.join(LEGACY_LOGS)}")
+    return {path: import_jsonl(path, table, db_path) for path, table in tables.items()}
+
+
+if __name__ == "__main__":
+    usage = "Usage: python log_store.py import [submission_log.json] [error_log.json]"
+    if sys.argv[1:2] != ["import"]:
+        print(usage)
+        sys.exit(1)
+
+    try:
+        results = import_legacy_logs(sys.argv[2:] or None)
+    except ValueError as e:
+        print(f"[❌] {e}\n{usage}")
+        sys.exit(1)
+    for path, imported in results.items():
+        print(f"[📥] Imported {imported} rows from {path} into {LOG_DB}")
@@ -0,0 +1,28 @@
+import os
+import json
+
+# ======= Model Prices =======
+# USD per 1M tokens as (prompt, completion), from OpenAI's public price list.
+# Prices change: override or extend with MODEL_PRICES_FILE, a JSON object of
+# {"model": [prompt_usd, completion_usd]}.
+
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+if os.getenv("MODEL_PRICES_FILE"):
+    with open(os.getenv("MODEL_PRICES_FILE"), "r") as f:
+        MODEL_PRICES.update({model: tuple(prices) for model, prices in json.load(f).items()})
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int):
+    """Estimated USD for one call, or None for a model without a known price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return ((prompt_tokens or 0) * prices[0] + (completion_tokens or 0) * prices[1]) / 1_000_000
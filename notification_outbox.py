@@ -0,0 +1,317 @@
+"""
+Notification outbox: outgoing emails and SMS are queued in SQLite and sent
+by a dispatcher instead of inside the submission.
+
+    python notification_outbox.py                # dispatch until stopped
+    python notification_outbox.py --once         # drain what is due, then exit
+    python notification_outbox.py --dead         # list dead letters
+    python notification_outbox.py --retry-dead   # requeue every dead letter
+
+worker.py runs a dispatcher next to its workers. Point it at a local
+debugging server (SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_STARTTLS=0)
+and SMS_TRANSPORT=stub to exercise it without sending anything.
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import smtplib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from email_utils import SMTPSession, build_message
+from sms_utils import get_sms_transport
+from span_utils import span
+
+OUTBOX_DB = os.getenv("OUTBOX_DB", "outbox.db")
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 30))  # seconds; doubles per attempt
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+SMS_CONCURRENCY = int(os.getenv("SMS_CONCURRENCY", 8))
+DISPATCH_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 2.0))
+CLAIM_SECONDS = 300  # a dispatcher that dies mid-batch releases its messages after this
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT,
+    body TEXT NOT NULL,
+    ticket_id TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_due ON messages (channel, status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_messages_ticket ON messages (ticket_id);
+"""
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or OUTBOX_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+# ======= Queue =======
+
+def enqueue(channel: str, recipient: str, body: str, subject: str = None, ticket_id: str = None,
+            max_attempts: int = OUTBOX_MAX_ATTEMPTS, db_path: str = None) -> int:
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "INSERT INTO messages (channel, recipient, subject, body, ticket_id, status, max_attempts, "
+            "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (channel, recipient, subject, body, ticket_id, max_attempts, now, now, now)
+        )
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+def claim_batch(channel: str, limit: int = OUTBOX_BATCH_SIZE, db_path: str = None) -> list:
+    """
+    Atomically takes up to `limit` due messages. A message claimed by a
+    dispatcher that died is due again once its claim runs out; that counts
+    as a failed attempt, so a message that keeps crashing or hanging the
+    dispatcher is dead-lettered instead of retried forever.
+    """
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT * FROM messages WHERE channel = ? AND status IN ('queued', 'sending') AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (channel, now, limit)
+        ).fetchall()
+        claimed = []
+        for row in rows:
+            message = dict(row)
+            if message["status"] == "sending":
+                message["attempts"] += 1
+                if message["attempts"] >= message["max_attempts"]:
+                    conn.execute(
+                        "UPDATE messages SET status = 'dead', attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                        (message["attempts"], "dispatcher stopped while sending", now, message["id"])
+                    )
+                    print(f"[❌] {channel} #{message['id']} to {message['recipient']} dead-lettered after {message['attempts']} stalled sends")
+                    continue
+            conn.execute(
+                "UPDATE messages SET status = 'sending', attempts = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (message["attempts"], now + CLAIM_SECONDS, now, message["id"])
+            )
+            message["status"] = "sending"
+            claimed.append(message)
+        conn.execute("COMMIT")
+        return claimed
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def mark_sent(message_id: int, db_path: str = None) -> None:
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        conn.execute(
+            "UPDATE messages SET status = 'sent', attempts = attempts + 1, last_error = NULL, "
+            "sent_at = ?, updated_at = ? WHERE id = ?",
+            (now, now, message_id)
+        )
+    finally:
+        conn.close()
+
+
+def backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)  # jitter spreads out retries after an outage
+
+
+def mark_failed(message_id: int, error: str, permanent: bool = False, db_path: str = None) -> str:
+    """Schedules a retry with exponential backoff, or dead-letters the message. Returns the new status."""
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT attempts, max_attempts FROM messages WHERE id = ?", (message_id,)).fetchone()
+        attempts = row["attempts"] + 1
+        status = "dead" if permanent or attempts >= row["max_attempts"] else "queued"
+        conn.execute(
+            "UPDATE messages SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+            (status, attempts, error, now + backoff(attempts), now, message_id)
+        )
+        return status
+    finally:
+        conn.close()
+
+
+def get_message(message_id: int, db_path: str = None) -> dict:
+    conn = connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def dead_letters(limit: int = 100, db_path: str = None) -> list:
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT * FROM messages WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def retry_dead(message_id: int = None, db_path: str = None) -> int:
+    """Requeues one dead letter (or all of them) with a fresh set of attempts."""
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        cur = conn.execute(
+            "UPDATE messages SET status = 'queued', attempts = 0, next_attempt_at = ?, updated_at = ? "
+            "WHERE status = 'dead' AND (? IS NULL OR id = ?)",
+            (now, now, message_id, message_id)
+        )
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def outbox_depth(db_path: str = None) -> dict:
+    conn = connect(db_path)
+    try:
+        rows = conn.execute("SELECT channel, status, COUNT(*) AS n FROM messages GROUP BY channel, status").fetchall()
+        return {f"{row['channel']}:{row['status']}": row["n"] for row in rows}
+    finally:
+        conn.close()
+
+
+# ======= Dispatcher =======
+
+def is_permanent(error: Exception) -> bool:
+    """Errors a retry cannot fix: rejected recipients, SMTP 5xx replies, Twilio 4xx other than rate limiting."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500:
+        return True
+    status = getattr(error, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+
+def _record_failure(message: dict, error: Exception, db_path: str) -> None:
+    status = mark_failed(message["id"], str(error), permanent=is_permanent(error), db_path=db_path)
+    label = "dead-lettered" if status == "dead" else "will retry"
+    print(f"[❌] {message['channel']} #{message['id']} to {message['recipient']} failed ({label}): {error}")
+
+
+def dispatch_emails(session: SMTPSession = None, limit: int = OUTBOX_BATCH_SIZE, db_path: str = None) -> int:
+    """Sends a batch of due emails over one SMTP session. Returns how many were sent."""
+    messages = claim_batch("email", limit, db_path)
+    if not messages:
+        return 0
+
+    session = session or SMTPSession()
+    sent = 0
+    with span("email_dispatch", messages=len(messages)) as record:
+        try:
+            for message in messages:
+                try:
+                    session.send(build_message(message["recipient"], message["subject"], message["body"]))
+                except Exception as e:
+                    _record_failure(message, e, db_path)
+                    if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+                        session.close()  # connection-level trouble: start the next message on a fresh one
+                    continue
+                mark_sent(message["id"], db_path)
+                sent += 1
+        finally:
+            session.close()
+        record["sent"] = sent
+    return sent
+
+
+def dispatch_sms(transport=None, limit: int = OUTBOX_BATCH_SIZE, max_concurrency: int = SMS_CONCURRENCY,
+                 db_path: str = None) -> int:
+    """Sends a batch of due SMS with up to `max_concurrency` in flight. Returns how many were sent."""
+    messages = claim_batch("sms", limit, db_path)
+    if not messages:
+        return 0
+
+    transport = transport or get_sms_transport()
+
+    def send(message):
+        try:
+            with span("sms_dispatch", ticket_id=message["ticket_id"]):
+                transport.send(message["recipient"], message["body"])
+        except Exception as e:
+            _record_failure(message, e, db_path)
+            return False
+        mark_sent(message["id"], db_path)
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(messages)))) as executor:
+        return sum(executor.map(send, messages))
+
+
+def dispatch_once(session: SMTPSession = None, transport=None, db_path: str = None) -> int:
+    """Drains every due message in batches. Returns how many were sent."""
+    total = 0
+    while True:
+        sent_now = dispatch_emails(session, db_path=db_path) + dispatch_sms(transport, db_path=db_path)
+        total += sent_now
+        if not sent_now:
+            return total
+
+
+def run_dispatcher(stop: threading.Event = None, interval: float = DISPATCH_INTERVAL, db_path: str = None) -> None:
+    stop = stop or threading.Event()
+    print("[📮] Notification dispatcher started")
+    while not stop.is_set():
+        try:
+            sent = dispatch_once(db_path=db_path)
+            if sent:
+                print(f"[📮] Dispatched {sent} notification(s)")
+        except Exception as e:
+            print(f"[❌] Dispatcher error: {e}")
+        stop.wait(interval)
+    print("[📮] Notification dispatcher stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send queued email/SMS notifications.")
+    parser.add_argument("--once", action="store_true", help="Send what is due, then exit")
+    parser.add_argument("--dead", action="store_true", help="List dead letters")
+    parser.add_argument("--retry-dead", action="store_true", help="Requeue every dead letter")
+    args = parser.parse_args()
+
+    if args.dead:
+        for message in dead_letters():
+            print(f"#{message['id']} {message['channel']} to {message['recipient']} "
+                  f"(ticket {message['ticket_id']}, {message['attempts']} attempts): {message['last_error']}")
+    elif args.retry_dead:
+        print(f"[♻️] Requeued {retry_dead()} dead letter(s)")
+    elif args.once:
+        print(f"[📮] Dispatched {dispatch_once()} notification(s); outbox: {outbox_depth()}")
+    else:
+        try:
+            run_dispatcher()
+        except KeyboardInterrupt:
+            sys.exit(0)
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import sqlite3
+
+# ======= Per-Ticket Page Results (SQLite) =======
+# The verdict entries and vision answer of every page a ticket has had
+# reviewed, keyed by the page's fingerprint (text + drawn content, see
+# document_model). When a corrected lease is re-uploaded under the same
+# ticket, unchanged pages are answered from here (even if they moved to
+# another page number) and only the changed ones go back to the models.
+# Each answer is stored with the version of what produced it (a hash of the
+# models and prompts, see verdict_version / vision_version); an answer from
+# another version is never reused.
+
+PAGE_STORE_DB = os.getenv("PAGE_STORE_DB", "page_results.db")
+INCREMENTAL_REVIEW = os.getenv("INCREMENTAL_REVIEW", "1") == "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_results (
+    ticket_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    doc_hash TEXT,
+    verdict TEXT,
+    verdict_version TEXT,
+    vision TEXT,
+    vision_version TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (ticket_id, fingerprint)
+);
+"""
+
+# Columns added after the table first shipped; older databases get them on connect
+_ADDED_COLUMNS = {"page_results": {"verdict_version": "TEXT", "vision_version": "TEXT"}}
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or PAGE_STORE_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    _add_missing_columns(conn)
+    return conn
+
+
+def _add_missing_columns(conn) -> None:
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, sql_type in columns.items():
+            if name in existing:
+                continue
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # i.e. another process added it first
+                    raise
+
+
+def _lookup(ticket_id: str, document, column: str, version: str, db_path: str = None) -> dict:
+    """page number -> stored JSON value of `column` for the document's pages seen before, answered by `version`."""
+    by_fingerprint = {}
+    for page in document.pages:
+        by_fingerprint.setdefault(page.fingerprint, []).append(page.number)  # e.g. repeated blank pages
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT fingerprint, {column} FROM page_results "
+            f"WHERE ticket_id = ? AND {column} IS NOT NULL AND {column}_version = ?",
+            (ticket_id, version)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {number: json.loads(row[column])
+            for row in rows for number in by_fingerprint.get(row["fingerprint"], [])}
+
+
+def _store(ticket_id: str, document, column: str, values: dict, version: str, db_path: str = None) -> None:
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for number, value in values.items():
+            page = document.page(number)
+            conn.execute(
+                f"INSERT INTO page_results (ticket_id, fingerprint, page, doc_hash, {column}, {column}_version, updated_at) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (ticket_id, fingerprint) DO UPDATE SET "
+                f"page = excluded.page, doc_hash = excluded.doc_hash, {column} = excluded.{column}, "
+                f"{column}_version = excluded.{column}_version, updated_at = excluded.updated_at",
+                (ticket_id, page.fingerprint, number, document.doc_hash, json.dumps(value), version, now)
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+# ======= Chunk Verdicts =======
+
+def known_verdicts(ticket_id: str, document, version: str, db_path: str = None) -> dict:
+    """page number -> [verdict entries] for pages unchanged since an earlier review, renumbered to this upload."""
+    known = _lookup(ticket_id, document, "verdict", version, db_path)
+    return {number: [dict(entry, page=number) for entry in entries] for number, entries in known.items()}
+
+
+def save_verdicts(ticket_id: str, document, verdicts: list, version: str, skip_pages=(), db_path: str = None) -> None:
+    """
+    Stores the page entries of the successful chunk verdicts. Pass the pages
+    of failed chunks as `skip_pages`: a long page split across chunks is
+    only stored once every part of it has an answer.
+    """
+    entries = {}
+    for verdict in verdicts:
+        for entry in (verdict or {}).get("pages", []):
+            if entry["page"] not in skip_pages:
+                entries.setdefault(entry["page"], []).append(entry)  # a long page can span several chunks
+    _store(ticket_id, document, "verdict", entries, version, db_path)
+
+
+# ======= Vision Results =======
+
+def known_vision(ticket_id: str, document, pages: list, version: str, db_path: str = None) -> dict:
+    """page number -> stored vision answer, for the given pages that are unchanged."""
+    known = _lookup(ticket_id, document, "vision", version, db_path)
+    return {number: known[number] for number in pages if number in known}
+
+
+def save_vision(ticket_id: str, document, vision_results: list, version: str, db_path: str = None) -> None:
+    """Stores successful vision answers; errors are retried next time."""
+    answers = {r["page"]: r["result"] for r in vision_results if r["result"] is not None}
+    _store(ticket_id, document, "vision", answers, version, db_path)
@@ -0,0 +1,114 @@
+"""
+Local page triage: scores each page before summarization so boilerplate
+pages (pet policy, parking rules, ...) never reach the LLM.
+
+Measure recall and savings against labeled leases:
+
+    python page_triage.py --labels ground_truth.json --thresholds 0.5,1,1.5 lease_5pages.pdf
+"""
+import os
+import re
+import argparse
+
+TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", 1.0))  # 0 sends every page to the LLM
+
+# ======= Text Features (compiled once) =======
+# (name, pattern, weight): a feature adds its weight once if the pattern matches
+
+TEXT_FEATURES = [
+    ("signature_words", re.compile(r"\bsign(?:ed|ature|atures|s|ing)?\b|\be-?sign", re.IGNORECASE), 1.0),
+    ("party_labels", re.compile(r"\b(?:lessee|lessor|resident|tenant|landlord|owner'?s representative|initials)\b", re.IGNORECASE), 0.5),
+    ("signature_line", re.compile(r"_{5,}"), 0.5),
+    ("date_pattern", re.compile(
+        r"\b\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}\b"
+        r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}\b"
+        r"|\b\d{1,2}(?:st|nd|rd|th)?\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+\d{4}\b",
+        re.IGNORECASE
+    ), 0.5),
+    ("term_words", re.compile(r"\b(?:commencement|lease term|term|move[- ]?(?:in|out)|expir(?:es|ation)|begins?|ends)\b", re.IGNORECASE), 0.5),
+]
+
+# E-signature vendors stamp every page ("digitally signed using RentCafe
+# eSignature services. Document ID: ..."); those lines say nothing about the page
+BOILERPLATE_LINES = re.compile(r"^.*(?:esignature services|document id:|page \d+ of \d+).*$", re.IGNORECASE | re.MULTILINE)
+
+# ======= Layout Features (from pdfplumber objects) =======
+LAYOUT_WEIGHTS = {"h_lines": 0.25, "form_fields": 0.5, "images": 0.25}
+
+
+def layout_features(page) -> dict:
+    """Counts collected from a pdfplumber page while it is open in load_document."""
+    h_lines = sum(1 for l in page.lines if abs(l["top"] - l["bottom"]) < 1 and l["x1"] - l["x0"] > 40)
+    h_lines += sum(1 for r in page.rects if r["height"] < 2 and r["width"] > 40)
+    form_fields = sum(1 for a in page.annots if "Widget" in str(a.get("data", {}).get("Subtype")))
+    return {"h_lines": h_lines, "form_fields": form_fields, "images": len(page.images)}
+
+
+def score_page(text: str, layout: dict = None) -> tuple:
+    """Returns (score, matched feature names)."""
+    if not text.strip() and not layout:
+        return 0.0, []
+
+    text = BOILERPLATE_LINES.sub("", text)
+    score = 0.0
+    matched = []
+    for name, pattern, weight in TEXT_FEATURES:
+        if pattern.search(text):
+            score += weight
+            matched.append(name)
+
+    for name, weight in LAYOUT_WEIGHTS.items():
+        if (layout or {}).get(name):
+            score += weight
+            matched.append(name)
+
+    return round(score, 2), matched
+
+
+def triage_document(document) -> dict:
+    """page number -> (score, matched features)"""
+    return {page.number: score_page(page.text, page.layout) for page in document.pages}
+
+
+# ======= Recall / Savings Report =======
+
+def evaluate(documents: list, labels: dict, thresholds: list) -> list:
+    from document_model import load_document
+
+    scored = []
+    for pdf_path in documents:
+        document = load_document(pdf_path)
+        label = labels.get(os.path.basename(pdf_path), {})
+        relevant = set(label.get("signature_pages", [])) | set(label.get("date_pages", []))
+        for page in document.pages:
+            score, _ = score_page(page.text, page.layout)
+            scored.append((score, page.number in relevant, len(page.cleaned_text)))
+
+    rows = []
+    for threshold in thresholds:
+        kept = [s for s in scored if s[0] >= threshold]
+        relevant_total = sum(1 for s in scored if s[1])
+        relevant_kept = sum(1 for s in kept if s[1])
+        rows.append({
+            "threshold": threshold,
+            "pages": len(scored),
+            "pages_sent": len(kept),
+            "recall": round(relevant_kept / relevant_total, 3) if relevant_total else None,
+            "est_tokens_saved": sum(s[2] for s in scored if s[0] < threshold) // 4,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    from ground_truth import load_labels
+
+    parser = argparse.ArgumentParser(description="Report page-triage recall and savings on labeled leases.")
+    parser.add_argument("documents", nargs="+", help="PDF files to score")
+    parser.add_argument("--labels", default="ground_truth.json", help="Ground-truth label file")
+    parser.add_argument("--thresholds", default="0.5,1,1.5,2", help="Comma-separated thresholds to compare")
+    args = parser.parse_args()
+
+    rows = evaluate(args.documents, load_labels(args.labels), [float(t) for t in args.thresholds.split(",")])
+    print(f"{'threshold':>9} {'pages':>6} {'sent':>6} {'recall':>7} {'tokens saved':>13}")
+    for row in rows:
+        print(f"{row['threshold']:>9} {row['pages']:>6} {row['pages_sent']:>6} {str(row['recall']):>7} {row['est_tokens_saved']:>13}")
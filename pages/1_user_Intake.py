@@ -1,14 +1,10 @@
 import streamlit as st
-from pdf_utils import find_signature_page, extract_signature_image
-from agent_core import run_agent
-from email_utils import send_email
-from sms_utils import send_sms
-from vision_utils import check_signature_image
-from submission_logger import log_submission
-from error_logger import log_extraction_error
-from trace_utils import suggest_vision_pages
+import job_queue
+import notification_outbox
+import workspace
+from sms_utils import format_us_phone
 import os
-import json
+import uuid
 import time
 
 st.set_page_config(page_title="Agentic AI Intake", layout="wide")
@@ -34,105 +30,181 @@ if proceed:
         st.warning("📄 Please upload a valid document to continue.")
     elif not user_email and not user_phone:
         st.warning("📬 Please provide at least one way to reach you (email or phone).")
+    elif contact_method == "SMS" and user_phone and not format_us_phone(user_phone):
+        st.warning("⚠️ Please enter a valid 10-digit U.S. phone number.")
     else:
-        start_time = time.time()
-        with st.spinner("🔍 Processing your submission..."):
-            # Save uploaded file to disk
-            uploaded_file_path = "uploaded_lease.pdf"
-            with open(uploaded_file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-            # Run reasoning agent on the uploaded file path
-            try:
-                response, trace_file = run_agent(ticket_id, uploaded_file_path)
-            except Exception as e:
-                st.error("❌ GPT processing failed. Check logs.")
-                log_extraction_error(
-                    ticket_id=ticket_id,
-                    filename=uploaded_file.name,
-                    error_detail=str(e)
-                )
-                st.stop()
-
-            elapsed_time = time.time() - start_time
-            minutes = int(elapsed_time // 60)
-            seconds = int(elapsed_time % 60)
-
-            st.success(f"✅ Document processed in {minutes} min {seconds} sec.")
-
-            st.success("✅ Document processed by AI.")
-            st.markdown("### 🤖 AI Response:")
-            st.write(response)
-            if "lease begins" in response.lower() or "move-in" in response.lower():
-                st.success("📅 Lease dates found in summary.")
-            elif "dates not present but expected" in response.lower():
-                st.error("⚠️ Lease start/end dates missing.")
-
-            # === Step 3: Email Notification ===
-            if user_email:
-                email_sent = send_email(user_email, "Your Lease Review Result", response)
-                if email_sent:
-                    st.success("📧 Email sent to user.")
-                else:
-                    st.warning("⚠️ Failed to send email.")
-
-            # === Step 4: Callback Queue ===
-            if contact_method == "Call Me":
-                callback_data = {
-                    "ticket_id": ticket_id,
-                    "phone": user_phone,
-                    "status": response
-                }
-                with open("followup_queue.json", "a") as f:
-                    f.write(json.dumps(callback_data) + "\n")
-                st.info("📞 Callback request added to human follow-up queue.")
-
-            # === Step 5: SMS Notification ===
-            if contact_method == "SMS" and user_phone:
-                cleaned = user_phone.strip().replace("-", "").replace(" ", "").replace("(", "").replace(")", "")
-                if cleaned.startswith("+1"):
-                    formatted = cleaned
-                elif cleaned.startswith("1") and len(cleaned) == 11:
-                    formatted = f"+{cleaned}"
-                elif len(cleaned) == 10:
-                    formatted = f"+1{cleaned}"
-                else:
-                    st.warning("⚠️ Please enter a valid 10-digit U.S. phone number.")
-                    formatted = None
-
-                if formatted:
-                    sms_sent = send_sms(formatted, response)
-                    if sms_sent:
-                        st.success(f"📱 SMS sent to {formatted}.")
-                    else:
-                        st.warning("⚠️ Failed to send SMS.")
-
-            # === Step 6: Log Submission ===
-            log_submission(
-                email=user_email,
-                phone=user_phone,
-                method=contact_method,
-                ticket_id=ticket_id,
-                result=response
-            )
-
-            # === Step 7: Flag Vision Pages ===
-            flagged_pages = suggest_vision_pages(trace_file)
-            if flagged_pages:
-                st.markdown(f"🔍 Pages flagged for vision signature check: `{flagged_pages}`")
-
-            # === Step 8: Vision Scan of Flagged Pages ===
-            if flagged_pages:
-                for page in flagged_pages:
-                    image_path = extract_signature_image(uploaded_file_path, page)
-                    if image_path and os.path.exists(image_path):
-                        st.image(image_path, caption=f"Signature Page (Page {page})", use_container_width=True)
-
-                        with st.spinner(f"🧠 Checking Page {page} for signature..."):
-                            vision_result = check_signature_image(image_path)
-                            st.markdown(f"### 🖋 Vision Result – Page {page}")
-                            st.write(vision_result)
-                    else:
-                        st.warning(f"⚠️ Could not extract image for page {page}.")
+        # Stream the upload into this submission's own workspace, then hand off
+        job_id = uuid.uuid4().hex
+        job_workspace = workspace.create_workspace(job_id, ticket_id=ticket_id or job_id[:8])
+        uploaded_file_path = os.path.join(job_workspace, workspace.UPLOAD_NAME)
+        workspace.save_upload(uploaded_file, uploaded_file_path)
+
+        job_queue.enqueue(
+            ticket_id=ticket_id or job_id[:8],
+            job_id=job_id,
+            payload={
+                "pdf_path": uploaded_file_path,
+                "workspace": job_workspace,
+                "filename": uploaded_file.name,
+                "ticket_id": ticket_id or job_id[:8],
+                "email": user_email,
+                "phone": user_phone,
+                "contact_method": contact_method
+            }
+        )
+        st.session_state["job_id"] = job_id
+        st.success(f"📥 Submission received. Your tracking number is `{job_id}`.")
+
+# === Step 3: Status View ===
+
+def load_events(job: dict) -> list:
+    """Progress events of the job's current attempt, fetched incrementally across reruns."""
+    cache = st.session_state.get("job_events")
+    if not cache or cache["key"] != [job["id"], job["attempts"]]:
+        cache = {"key": [job["id"], job["attempts"]], "events": [], "last_id": 0}
+    new_events = job_queue.get_events(job["id"], after=cache["last_id"])
+    if new_events:
+        cache["events"] += new_events
+        cache["last_id"] = new_events[-1]["id"]
+    st.session_state["job_events"] = cache
+    return cache["events"]
+
+
+def page_rows(triage: dict, chunks: list) -> list:
+    rows = {page: {"Page": page, "Status": "⏳ Reading", "Signature": "", "Lease dates": ""} for page in triage["kept"]}
+    for page in triage["skipped"]:
+        rows[page] = {"Page": page, "Status": "⏭️ Skipped (boilerplate)", "Signature": "", "Lease dates": ""}
+    for page in triage.get("no_text", []):
+        rows[page]["Status"] = "🖼️ No text to read"
+    for page in triage.get("over_budget", []):
+        rows[page]["Status"] = "💸 Skipped (review budget reached)"
+    for chunk in chunks:
+        if chunk["verdict"] is None:
+            for page in chunk["pages"]:
+                rows[page]["Status"] = "⚠️ Could not read"
+            continue
+        for entry in chunk["verdict"]["pages"]:
+            row = rows[entry["page"]]
+            row["Status"] = "♻️ Unchanged since last upload" if chunk.get("reused") else "✅ Done"
+            if entry["signature_present"]:
+                row["Signature"] = "✍️ Signed"
+            elif entry["has_signature_field"]:
+                row["Signature"] = "⬜ Unsigned field"
+            if entry["lease_start"] or entry["lease_end"]:
+                row["Lease dates"] = f"{entry['lease_start'] or '?'} → {entry['lease_end'] or '?'}"
+    return [rows[page] for page in sorted(rows)]
+
+
+def render_progress(events: list) -> None:
+    """What the worker has reported so far: page status, the verdict, then the vision checks."""
+    by_kind = {}
+    for event in events:
+        by_kind.setdefault(event["kind"], []).append(event["data"])
+
+    if "parsed" in by_kind and "triage" not in by_kind:
+        st.caption(f"📄 Read {by_kind['parsed'][-1]['pages']} pages, picking the ones worth checking...")
+
+    if "triage" in by_kind:
+        triage = by_kind["triage"][-1]
+        chunks = by_kind.get("chunk", [])
+        total = triage["chunks"] or 1
+        st.progress(min(len(chunks) / total, 1.0), text=f"🧩 {len(chunks)} of {triage['chunks']} sections reviewed")
+        st.dataframe(page_rows(triage, chunks), hide_index=True, use_container_width=True)
+
+    if "decision" in by_kind:
+        decision = by_kind["decision"][-1]
+        if decision["escalated"]:
+            st.info(f"🤔 The pages disagree ({'; '.join(decision['reasons'])}); taking a closer look...")
+        else:
+            signed = "signed" if decision["is_signed"] == "yes" else "not signed"
+            dates = "lease dates found" if decision["valid_date_range"] else "lease dates missing"
+            st.info(f"🧮 Preliminary result: {signed}, {dates}.")
+
+    reasoning = "".join(delta["text"] for delta in by_kind.get("reasoning", []))
+    if reasoning:
+        st.markdown(f"> {reasoning}")
+    for tool in by_kind.get("tool", []):
+        st.caption(f"🔧 {tool['name']}: {tool['result']}")
+
+    if "response" in by_kind:
+        st.markdown("### 🤖 AI Response:")
+        st.write(by_kind["response"][-1]["text"])
+
+    if "flagged" in by_kind:
+        flagged_pages = by_kind["flagged"][-1]["pages"]
+        checked = {vision["page"]: vision for vision in by_kind.get("vision", [])}
+        if flagged_pages:
+            st.markdown(f"🔍 Checking signatures visually on pages `{flagged_pages}` ({len(checked)} done)")
+        for page in sorted(checked):
+            vision = checked[page]
+            if vision["result"] is None:
+                st.warning(f"⚠️ Could not check page {page}: {vision['error']}")
             else:
-                st.info("✅ No pages flagged for visual signature verification.")
\ No newline at end of file
+                st.markdown(f"**🖋 Page {page}:** {vision['result']}")
+
+
+st.subheader("📡 Submission Status")
+job_id = st.text_input("Tracking Number", value=st.session_state.get("job_id", ""))
+auto_refresh = st.checkbox("🔄 Auto-refresh while processing", value=True)
+
+if job_id:
+    job = job_queue.get_job(job_id.strip())
+    if job is None:
+        st.warning("⚠️ No submission found for that tracking number.")
+    elif job["status"] in ("queued", "running"):
+        waited = int(time.time() - job["created_at"])
+        label = "⏳ Waiting for a worker" if job["status"] == "queued" else "🔍 Processing your submission"
+        st.info(f"{label}... ({waited} sec, attempt {job['attempts']}/{job['max_attempts']})")
+        if job["status"] == "running":
+            render_progress(load_events(job))
+        if auto_refresh:
+            time.sleep(1)
+            st.rerun()
+    elif job["status"] == "failed":
+        st.error("❌ GPT processing failed. Check logs.")
+    else:
+        result = job["result"]
+        minutes = int(result["duration"] // 60)
+        seconds = int(result["duration"] % 60)
+        st.success(f"✅ Document processed in {minutes} min {seconds} sec.")
+
+        response = result["response"]
+        st.markdown("### 🤖 AI Response:")
+        st.write(response)
+        if "lease begins" in response.lower() or "move-in" in response.lower():
+            st.success("📅 Lease dates found in summary.")
+        elif "dates not present but expected" in response.lower():
+            st.error("⚠️ Lease start/end dates missing.")
+
+        # Email and SMS are sent by the outbox dispatcher; show where each one is
+        notifications = result["notifications"]
+        for channel, label in (("email", "📧 Email"), ("sms", "📱 SMS")):
+            if channel not in notifications:
+                continue
+            message = notification_outbox.get_message(notifications[channel]) if notifications[channel] else None
+            if message is None:
+                st.warning(f"⚠️ Failed to send {label}.")
+            elif message["status"] == "sent":
+                st.success(f"{label} sent.")
+            elif message["status"] == "dead":
+                st.warning(f"⚠️ Failed to send {label}: {message['last_error']}")
+            else:
+                st.info(f"{label} queued for delivery (attempt {message['attempts'] + 1}).")
+        if notifications.get("callback"):
+            st.info("📞 Callback request added to human follow-up queue.")
+
+        flagged_pages = result["flagged_pages"]
+        if flagged_pages:
+            st.markdown(f"🔍 Pages flagged for vision signature check: `{flagged_pages}`")
+            for vision in result["vision_results"]:
+                page = vision["page"]
+                if vision["result"] is None:
+                    st.warning(f"⚠️ Could not check page {page}: {vision.get('error')}")
+                    continue
+                # Page images are only kept on disk when VISION_DEBUG_DIR is set
+                if vision["image_path"] and os.path.exists(vision["image_path"]):
+                    st.image(vision["image_path"], caption=f"Signature Page (Page {page})", use_container_width=True)
+                st.markdown(f"### 🖋 Vision Result – Page {page}")
+                st.write(vision["result"])
+        else:
+            st.info("✅ No pages flagged for visual signature verification.")
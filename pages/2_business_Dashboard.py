@@ -1,24 +1,56 @@
 import streamlit as st
-import json
 import pandas as pd
+import log_store
 
 st.set_page_config(page_title="📊 Business Dashboard", layout="wide")
 st.title("📩 Processed Submissions")
 
-try:
-    with open("submission_log.json", "r") as f:
-        logs = [json.loads(line) for line in f.readlines()]
-except FileNotFoundError:
-    logs = []
+# Legacy JSONL logs are imported once per session (only lines added since the last import)
+if "logs_imported" not in st.session_state:
+    log_store.import_legacy_logs()
+    st.session_state["logs_imported"] = True
 
-if logs:
-    df = pd.DataFrame(logs)
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
+
+def load_new_submissions():
+    """Keeps a light copy of the log in the session and fetches only rows newer than the last one seen."""
+    cache = st.session_state.setdefault("submission_stats", {"last_id": 0, "df": None})
+    while True:
+        rows = log_store.rows_after("submissions", cache["last_id"], columns=["timestamp", "method", "duration", "cost_usd"])
+        if not rows:
+            break
+        new = pd.DataFrame(rows)
+        new["timestamp"] = pd.to_datetime(new["timestamp"])
+        cache["df"] = new if cache["df"] is None else pd.concat([cache["df"], new], ignore_index=True)
+        cache["last_id"] = rows[-1]["id"]
+    return cache["df"]
+
+
+stats = load_new_submissions()
+
+if stats is not None:
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Submissions", len(stats))
+    col2.metric("Last 24h", int((stats["timestamp"] >= pd.Timestamp.now() - pd.Timedelta(days=1)).sum()))
+    col3.metric("Avg. Duration (s)", round(stats["duration"].mean(), 1) if stats["duration"].notna().any() else "—")
+    col4.metric("Avg. LLM Cost ($)", round(stats["cost_usd"].mean(), 4) if stats["cost_usd"].notna().any() else "—")
 
     with st.expander("🔍 Filters", expanded=True):
-        method = st.multiselect("Contact Method", df["method"].unique(), default=list(df["method"].unique()))
-        df = df[df["method"].isin(method)]
+        methods = log_store.distinct_methods()
+        col1, col2, col3 = st.columns([2, 1, 1])
+        method = col1.multiselect("Contact Method", methods, default=methods)
+        ticket_id = col2.text_input("Ticket ID").strip()
+        page_size = col3.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    filters = {"method": method, "ticket_id": ticket_id or None}
+    total = log_store.count("submissions", **filters)
+    pages = max(1, -(-total // page_size))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
 
-    st.dataframe(df.sort_values("timestamp", ascending=False), use_container_width=True)
+    rows = log_store.query("submissions", limit=page_size, offset=(page - 1) * page_size, **filters)
+    if rows:
+        df = pd.DataFrame(rows).drop(columns=["id"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        st.dataframe(df, use_container_width=True)
+    st.caption(f"{total} matching submissions")
 else:
-    st.info("No submissions found yet.")
\ No newline at end of file
+    st.info("No submissions found yet.")
@@ -1,19 +1,117 @@
 import streamlit as st
+import os
 import json
 import pandas as pd
+import log_store
+import trace_store
 
 st.set_page_config(page_title="🛠 Engineering Logs", layout="wide")
 st.title("🧪 Extraction Errors")
 
-try:
-    with open("error_log.json", "r") as f:
-        logs = [json.loads(line) for line in f.readlines()]
-except FileNotFoundError:
-    logs = []
+# Legacy JSONL logs are imported once per session (only lines added since the last import)
+if "logs_imported" not in st.session_state:
+    log_store.import_legacy_logs()
+    st.session_state["logs_imported"] = True
 
-if logs:
-    df = pd.DataFrame(logs)
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-    st.dataframe(df.sort_values("timestamp", ascending=False), use_container_width=True)
+total_errors = log_store.count("errors")
+if total_errors:
+    col1, col2 = st.columns([3, 1])
+    ticket_id = col1.text_input("Ticket ID").strip() or None
+    page_size = col2.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    total = log_store.count("errors", ticket_id=ticket_id)
+    pages = max(1, -(-total // page_size))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+
+    rows = log_store.query("errors", limit=page_size, offset=(page - 1) * page_size, ticket_id=ticket_id)
+    if rows:
+        df = pd.DataFrame(rows).drop(columns=["id"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        st.dataframe(df, use_container_width=True)
+    st.caption(f"{total} of {total_errors} errors")
+else:
+    st.info("No errors have been logged yet.")
+
+# === Stage Latency ===
+st.title("⏱️ Stage Latency")
+
+
+def load_new_spans(path: str = "span_log.json"):
+    """Reads only the span lines appended since the last rerun."""
+    cache = st.session_state.setdefault("spans", {"offset": 0, "df": None})
+    if not os.path.exists(path):
+        return cache["df"]
+    if os.path.getsize(path) < cache["offset"]:
+        cache.update(offset=0, df=None)  # the log was rotated
+
+    spans = []
+    with open(path, "rb") as f:
+        f.seek(cache["offset"])
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # still being written
+            cache["offset"] += len(line)
+            spans.append(json.loads(line))
+
+    if spans:
+        new = pd.DataFrame(spans)
+        new["timestamp"] = pd.to_datetime(new["timestamp"])
+        cache["df"] = new if cache["df"] is None else pd.concat([cache["df"], new], ignore_index=True)
+    return cache["df"]
+
+
+sdf = load_new_spans()
+
+if sdf is not None:
+    percentiles = sdf.groupby("stage")["duration_ms"].quantile([0.5, 0.95, 0.99]).unstack()
+    percentiles.columns = ["p50_ms", "p95_ms", "p99_ms"]
+    percentiles["count"] = sdf.groupby("stage").size()
+    st.subheader("Percentiles per Stage")
+    st.dataframe(percentiles.round(1), use_container_width=True)
+
+    with st.expander("📈 Over Time", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        stage = col1.selectbox("Stage", sorted(sdf["stage"].unique()))
+        bucket = col2.selectbox("Bucket", ["h", "D", "W"], index=1, format_func={"h": "Hour", "D": "Day", "W": "Week"}.get)
+        quantile = col3.selectbox("Percentile", [0.5, 0.95, 0.99], format_func=lambda q: f"p{int(q * 100)}")
+
+        series = (
+            sdf[sdf["stage"] == stage]
+            .set_index("timestamp")["duration_ms"]
+            .resample(bucket)
+            .quantile(quantile)
+            .dropna()
+        )
+        st.line_chart(series, use_container_width=True)
+
+    with st.expander("🎫 Where Did a Submission Spend Its Time?"):
+        tickets = sdf["ticket_id"].dropna().unique()
+        if len(tickets):
+            ticket = st.selectbox("Ticket", sorted(tickets, reverse=True))
+            tdf = sdf[sdf["ticket_id"] == ticket]
+            st.bar_chart(tdf.groupby("stage")["duration_ms"].sum(), use_container_width=True)
+            st.dataframe(tdf.sort_values("start"), use_container_width=True)
+
+            # The trace index points straight at this ticket's summary traces
+            traces = trace_store.find_traces(ticket_id=ticket, limit=5)
+            if traces:
+                trace = st.selectbox("Summary Trace", traces, format_func=lambda t: os.path.basename(t["path"]))
+                entries = pd.DataFrame(trace_store.read_trace(trace["path"]))
+                st.dataframe(entries.drop(columns=["chunk_hash"], errors="ignore"), use_container_width=True)
+        else:
+            st.info("No spans carry a ticket id yet.")
+
+    # LLM calls made through the rate-limit scheduler carry their queue wait and retries
+    if "queue_wait_ms" in sdf.columns:
+        with st.expander("🚦 LLM Rate Limiting"):
+            ldf = sdf.dropna(subset=["queue_wait_ms"])
+            waits = ldf.groupby("priority")["queue_wait_ms"].quantile([0.5, 0.95, 0.99]).unstack()
+            waits.columns = ["wait_p50_ms", "wait_p95_ms", "wait_p99_ms"]
+            waits["calls"] = ldf.groupby("priority").size()
+            waits["max_queue_depth"] = ldf.groupby("priority")["queue_depth"].max()
+            waits["retries"] = ldf.groupby("priority")["retries"].sum()
+            st.dataframe(waits.round(1), use_container_width=True)
+            st.line_chart(ldf.set_index("timestamp")["queue_wait_ms"].resample("h").quantile(0.95).dropna(),
+                          use_container_width=True)
 else:
-    st.info("No errors have been logged yet.")
\ No newline at end of file
+    st.info("No stage timings have been recorded yet.")
@@ -1,34 +1,32 @@
-import pdfplumber
-from pdf2image import convert_from_path
 import re
 from datetime import datetime
 import os
+from document_model import load_document
+from span_utils import span
 
 # === 1. Extract All Text ===
-def extract_text_from_pdf(file):
+def extract_text_from_pdf(file, document=None):
     try:
-        with pdfplumber.open(file) as pdf:
-            all_text = "\n".join(
-                [page.extract_text() for page in pdf.pages if page.extract_text()]
-            )
-        return all_text.strip()
+        if document is None:
+            document = load_document(file)
+        return document.full_text()
     except Exception as e:
         return f"⚠️ Error extracting text: {e}"
 
 # === 2. Detect Which Page Has a Signature ===
-def find_signature_page(file_path):
+def find_signature_page(file_path, document=None):
     try:
-        with pdfplumber.open(file_path) as pdf:
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if text and re.search(r"sign(ed|ature)", text, re.IGNORECASE):
-                    return i + 1  # 1-based index for pdf2image
+        if document is None:
+            document = load_document(file_path)
+        for page in document.pages:
+            if page.text and re.search(r"sign(ed|ature)", page.text, re.IGNORECASE):
+                return page.number  # 1-based index for pdf2image
     except Exception as e:
         print(f"⚠️ Error scanning pages for signature: {e}")
     return None
 
 # === 3. Extract That Page as an Image ===
-def extract_signature_image(file_path, page_number, output=None):
+def extract_signature_image(file_path, page_number, output=None, document=None):
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         os.makedirs("outputs", exist_ok=True)
@@ -36,10 +34,15 @@ def extract_signature_image(file_path, page_number, output=None):
         if output is None:
             output = os.path.join("outputs", f"signature_page_p{page_number}_{timestamp}.png")
 
-        images = convert_from_path(file_path, first_page=page_number, last_page=page_number)
-        images[0].save(output, "PNG")
+        with span("render_page", page=page_number):
+            if document is None:
+                from pdf2image import convert_from_path
+                image = convert_from_path(file_path, first_page=page_number, last_page=page_number)[0]
+            else:
+                image = document.render_page(page_number)
+            image.save(output, "PNG")
         return output
 
     except Exception as e:
         print(f"⚠️ Error extracting image from page {page_number}: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+from document_model import load_document
+from agent_core import run_agent
+import notification_outbox
+from sms_utils import format_us_phone
+from vision_utils import run_vision_stage, vision_version, VISION_DEBUG_DIR
+import page_store
+from token_budget import document_budget
+from submission_logger import log_submission
+from error_logger import log_extraction_error
+from trace_utils import suggest_vision_pages
+from span_utils import collect_spans, write_spans
+
+# ======= Submission Pipeline =======
+# Everything the intake page used to do under its spinner. Runs inside a
+# worker process (worker.py); the page only enqueues the payload.
+
+
+def process_submission(payload: dict, on_progress=None) -> dict:
+    """
+    payload: pdf_path, filename, ticket_id, email, phone, contact_method and
+    workspace (see workspace.py), where the run's own files are written.
+    Returns a JSON-serializable result for the job's status view; email/SMS
+    notifications are outbox message ids (False if the phone was invalid).
+    `on_progress(kind, data)` receives stage events as they happen (the
+    worker stores them with job_queue.add_event for the intake page).
+    """
+    ticket_id = payload["ticket_id"]
+    pdf_path = payload["pdf_path"]
+    start_time = time.time()
+    report = on_progress or (lambda kind, data: None)
+    workspace = payload.get("workspace")  # None for jobs queued before workspaces existed
+
+    with collect_spans(ticket_id) as spans, document_budget(ticket_id) as budget:
+        # Parse once; every later stage reads pages from this document
+        try:
+            document = load_document(pdf_path)
+            report("parsed", {"pages": len(document)})
+            response, trace_file = run_agent(ticket_id, pdf_path, document=document, on_progress=on_progress)
+        except Exception as e:
+            log_extraction_error(
+                ticket_id=ticket_id,
+                filename=payload.get("filename"),
+                error_detail=str(e)
+            )
+            raise
+        report("response", {"text": response})
+
+        notifications = {}
+
+        # === Email Notification (sent by the outbox dispatcher) ===
+        if payload.get("email"):
+            notifications["email"] = notification_outbox.enqueue(
+                "email", payload["email"], response, subject="Your Lease Review Result", ticket_id=ticket_id
+            )
+
+        # === Callback Queue ===
+        if payload.get("contact_method") == "Call Me":
+            callback_data = {
+                "ticket_id": ticket_id,
+                "phone": payload.get("phone"),
+                "status": response,
+                "workspace": workspace
+            }
+            if workspace:
+                with open(os.path.join(workspace, "callback.json"), "w") as f:
+                    json.dump(callback_data, f)
+            # One line per request in the shared queue the follow-up team works from
+            with open("followup_queue.json", "a") as f:
+                f.write(json.dumps(callback_data) + "\n")
+            notifications["callback"] = True
+
+        # === SMS Notification ===
+        if payload.get("contact_method") == "SMS" and payload.get("phone"):
+            formatted = format_us_phone(payload["phone"])
+            notifications["sms"] = notification_outbox.enqueue("sms", formatted, response, ticket_id=ticket_id) if formatted else False
+
+        response_duration = round(time.time() - start_time, 2)
+
+        # === Vision Scan of Flagged Pages ===
+        flagged_pages = suggest_vision_pages(trace_file)
+        report("flagged", {"pages": flagged_pages})
+        # Pages unchanged since this ticket's last review keep their stored answer
+        known_vision = (page_store.known_vision(ticket_id, document, flagged_pages, vision_version())
+                        if page_store.INCREMENTAL_REVIEW else {})
+        for page, answer in known_vision.items():
+            report("vision", {"page": page, "result": answer, "error": None, "reused": True})
+        debug_dir = os.path.join(workspace, "pages") if workspace and VISION_DEBUG_DIR else VISION_DEBUG_DIR
+        checked = run_vision_stage(document, [p for p in flagged_pages if p not in known_vision],
+                                   debug_dir=debug_dir, on_progress=on_progress)
+        if page_store.INCREMENTAL_REVIEW:
+            page_store.save_vision(ticket_id, document, checked, vision_version())
+        vision_results = sorted(
+            checked + [{"page": page, "image_path": None, "result": answer, "error": None, "reused": True}
+                       for page, answer in known_vision.items()],
+            key=lambda vision: vision["page"]
+        )
+
+        spans_file = write_spans(trace_file, spans, os.path.join(workspace, "spans.json") if workspace else None)
+
+        # === Log Submission (after vision, so the spend covers every model call) ===
+        log_submission(
+            email=payload.get("email"),
+            phone=payload.get("phone"),
+            method=payload.get("contact_method"),
+            ticket_id=ticket_id,
+            result=response,
+            duration=response_duration,
+            tokens=budget.tokens,
+            cost_usd=round(budget.cost_usd, 6)
+        )
+
+    return {
+        "response": response,
+        "trace_file": trace_file,
+        "spans_file": spans_file,
+        "flagged_pages": flagged_pages,
+        "vision_results": vision_results,
+        "notifications": notifications,
+        "usage": budget.summary(),
+        "duration": round(time.time() - start_time, 2)
+    }
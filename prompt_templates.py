@@ -11,10 +11,30 @@ Respond in a professional tone, clearly guiding the user.
 
 USER_INSTRUCTION_TEMPLATE = """
 Please review this document for ticket ID: {ticket_id}
+It has {page_count} pages. The tools look the page text up themselves: pass the
+ticket ID and a page range (start_page/end_page), never the document text.
 
 Determine if the lease is complete:
 - Is it signed?
 - Does it contain valid start and end dates?
 
 Output should clearly state if the document is approved or rejected.
-"""
\ No newline at end of file
+"""
+
+# Structured per-page verdicts (see chunk_verdicts.py); answered in JSON mode
+CHUNK_VERDICT_PROMPT = (
+    "You are a smart assistant helping to review lease documents page by page.\n"
+    "The text may hold several consecutive pages; each one starts with a [Page N] marker.\n\n"
+    "Return one entry per page with:\n"
+    "- page: the N from the page's [Page N] marker.\n"
+    "- summary: one sentence on what the page covers.\n"
+    "- has_signature_field: true only if the page has a space meant for someone to sign "
+    "(a signature line, box or e-sign field). Pages that merely reference signing in the future, "
+    "and footers like 'digitally signed using RentCafe eSignature services', do not count.\n"
+    "- signature_present: true only if the text shows the field was actually signed "
+    "(a name or e-signature stamp in the field, a signed date next to it).\n"
+    "- lease_start / lease_end: the lease term's start and end dates as YYYY-MM-DD, "
+    "or null if this page does not state them.\n"
+    "- confidence: 0 to 1, how sure you are of this page's answers.\n\n"
+    "Be precise — your answer is aggregated by a downstream system that approves or rejects the lease."
+)
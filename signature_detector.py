@@ -0,0 +1,306 @@
+"""
+Local signature pre-check: decides from the page layout, and the ink on the
+rendered page, whether a flagged page is clearly signed or clearly unsigned,
+so only the uncertain ones go to the GPT-4o vision check.
+
+Signature fields are found while the pdfplumber page is open in
+load_document (signature_layout):
+
+    line    a horizontal rule or run of underscores next to a label such as
+            "Signature" / "Lessee" / "Resident", plus the rules stacked under it
+    widget  a form field named like a signature field
+    label   a "Signature" column header; only an image under it counts
+
+A page is "signed" when a field holds an embedded image, vector strokes, an
+ink annotation, a typed e-signature or enough dark pixels above its line;
+"unsigned" when every line and widget field was rendered and is empty; and
+"uncertain" otherwise.
+
+Measure precision/recall against pages labeled in ground_truth.json
+("signed_pages", see ground_truth.py):
+
+    python signature_detector.py --labels ground_truth.json lease_5pages.pdf
+"""
+import os
+import re
+import argparse
+
+SIGNATURE_GATE = os.getenv("SIGNATURE_GATE", "1") == "1"  # 0 sends every flagged page to vision
+SIGNATURE_INK_SIGNED = float(os.getenv("SIGNATURE_INK_SIGNED", 0.02))  # dark-pixel share above a line that means ink
+SIGNATURE_INK_EMPTY = float(os.getenv("SIGNATURE_INK_EMPTY", 0.003))  # at or below this a field counts as blank
+
+# ======= Field Detection (from pdfplumber objects) =======
+
+LABEL_WORDS = re.compile(r"^\W*(?:signature|signatures|signed|sign|signee|lessee|lessor|resident|residents|tenant|tenants"
+                         r"|landlord|owner|owner's|owner’s|guarantor|co-signer|agent|manager)\W*$", re.IGNORECASE)
+COLUMN_LABELS = re.compile(r"^signatures?(?:/initials)?$", re.IGNORECASE)
+WIDGET_NAMES = re.compile(r"sign", re.IGNORECASE)
+NOT_SIGNATURE_WIDGETS = re.compile(r"date|initial", re.IGNORECASE)
+SCRIPT_FONTS = re.compile(r"script|hand|brush|cursive|signature", re.IGNORECASE)
+UNDERSCORES = re.compile(r"_{5,}")
+
+MIN_RULE_WIDTH = 40  # points; same as page triage's h_lines
+REGION_HEIGHT = 30  # points above a rule where a signature would be written
+LABEL_GAP = 150  # a label this far left of a rule, on the same line, names it
+STACK_GAP = 24  # rules this close under a signature line belong to the same block
+COLUMN_DEPTH = 150  # how far below a "Signature" header its cells reach
+MIN_REGION_HEIGHT = 12  # less room than this above a rule is a table row, not a place to sign
+MAX_TEXT_SHARE = 0.3  # a "line" region this full of printed text is a ruled paragraph
+MAX_IMAGE_SHARE = 0.5  # images covering more of the page are scans/backgrounds, not signatures
+
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _center_in(obj: tuple, region: tuple) -> bool:
+    x, y = (obj[0] + obj[2]) / 2, (obj[1] + obj[3]) / 2
+    return region[0] <= x <= region[2] and region[1] <= y <= region[3]
+
+
+def _bbox(obj: dict) -> tuple:
+    return (obj["x0"], obj["top"], obj["x1"], obj["bottom"])
+
+
+def _rules(page, words: list) -> list:
+    """Horizontal rules (lines, hairline rects, underscore runs) as boxes, top to bottom."""
+    rules = [_bbox(l) for l in page.lines if abs(l["top"] - l["bottom"]) < 1 and l["x1"] - l["x0"] > MIN_RULE_WIDTH]
+    rules += [_bbox(r) for r in page.rects if r["height"] < 2 and r["width"] > MIN_RULE_WIDTH]
+    rules += [(w["x0"], w["bottom"] - 1, w["x1"], w["bottom"]) for w in words
+              if UNDERSCORES.search(w["text"]) and w["x1"] - w["x0"] > MIN_RULE_WIDTH]
+    return sorted(rules, key=lambda r: (r[1], r[0]))
+
+
+def _names_rule(label: dict, rule: tuple) -> bool:
+    """Label under the rule, above it, or to its left on the same line."""
+    overlaps = label["x0"] < rule[2] and rule[0] < label["x1"]
+    if overlaps and rule[3] <= label["top"] <= rule[3] + STACK_GAP:
+        return True
+    if overlaps and rule[1] - REGION_HEIGHT - 10 <= label["bottom"] <= rule[1]:
+        return True
+    return label["x1"] <= rule[0] + 2 and rule[0] - label["x1"] < LABEL_GAP and abs(label["bottom"] - rule[3]) < 6
+
+
+def _signature_lines(rules: list, labels: list) -> list:
+    """(label text, region above the rule) for every rule a label names, and the rules stacked under those."""
+    lines = []
+    for rule in rules:
+        label = next((l["text"] for l in labels if _names_rule(l, rule)), None)
+        if label is None:
+            above = [(text, r) for text, r in lines
+                     if abs(r[0] - rule[0]) < 3 and abs(r[2] - rule[2]) < 3 and 0 < rule[1] - r[1] <= STACK_GAP]
+            label = above[-1][0] if above else None
+        if label is not None:
+            lines.append((label, rule))
+
+    # The region stops at the nearest rule above, so stacked lines don't share ink
+    fields = []
+    for label, rule in lines:
+        ceiling = max([r[3] + 0.5 for r in rules if r[0] < rule[2] and rule[0] < r[2] and r[3] < rule[1]] + [0])
+        fields.append((label, (rule[0], max(ceiling, rule[1] - REGION_HEIGHT), rule[2], rule[1] - 1.5)))
+    return fields
+
+
+def _field(kind: str, label: str, region: tuple, page, chars: list, ink_annots: list) -> dict:
+    """A signature field's region and what the PDF itself draws in it."""
+    page_area = float(page.width * page.height)
+    in_region = [c for c in chars if _overlaps(_bbox(c), region)]
+    masks = [_bbox(c) for c in in_region]
+    region_area = max(1.0, (region[2] - region[0]) * (region[3] - region[1]))
+    text_area = sum(max(0, min(b[2], region[2]) - max(b[0], region[0])) * max(0, min(b[3], region[3]) - max(b[1], region[1]))
+                    for b in masks)
+    for obj in list(page.lines) + list(page.rects):  # printed borders aren't ink; mask their edges
+        box = _bbox(obj)
+        if not _overlaps(box, region):
+            continue
+        if box[3] - box[1] < 2 or box[2] - box[0] < 2:
+            masks.append(box)
+        else:
+            masks += [(box[0], box[1] - 1, box[2], box[1] + 1), (box[0], box[3] - 1, box[2], box[3] + 1),
+                      (box[0] - 1, box[1], box[0] + 1, box[3]), (box[2] - 1, box[1], box[2] + 1, box[3])]
+    return {
+        "kind": kind,
+        "label": label,
+        "region": tuple(round(v, 1) for v in region),
+        "images": sum(1 for im in page.images if _center_in(_bbox(im), region)
+                      and (im["x1"] - im["x0"]) * (im["bottom"] - im["top"]) < MAX_IMAGE_SHARE * page_area),
+        "curves": sum(1 for c in page.curves if _center_in(_bbox(c), region) and c["bottom"] - c["top"] >= 3),
+        "ink": sum(1 for box in ink_annots if _overlaps(box, region)),
+        "script_chars": sum(1 for c in in_region if SCRIPT_FONTS.search(c.get("fontname") or "")),
+        "typed_signature": "/s/" in "".join(c["text"] for c in in_region),
+        "text_share": round(text_area / region_area, 2),
+        "masks": [tuple(round(v, 1) for v in box) for box in masks],
+    }
+
+
+def signature_layout(page) -> dict:
+    """Signature fields of a pdfplumber page and what they hold, collected while load_document has it open."""
+    words = page.extract_words()
+    labels = [w for w in words if LABEL_WORDS.match(w["text"])]
+    chars = page.chars
+    ink_annots = [_bbox(a) for a in page.annots if "Ink" in str((a.get("data") or {}).get("Subtype"))]
+
+    fields = [_field("line", label, region, page, chars, ink_annots)
+              for label, region in _signature_lines(_rules(page, words), labels)
+              if region[3] - region[1] >= MIN_REGION_HEIGHT]
+    fields = [f for f in fields if f["text_share"] <= MAX_TEXT_SHARE]
+
+    for annot in page.annots:
+        data = annot.get("data") or {}
+        name = data.get("T") or ""
+        name = name.decode("latin-1") if isinstance(name, bytes) else str(name)
+        is_signature = "Sig" in str(data.get("FT")) or (WIDGET_NAMES.search(name) and not NOT_SIGNATURE_WIDGETS.search(name))
+        if "Widget" in str(data.get("Subtype")) and is_signature:
+            field = _field("widget", name, _bbox(annot), page, chars, ink_annots)
+            field["value"] = bool(data.get("V"))
+            fields.append(field)
+
+    for label in words:
+        if COLUMN_LABELS.match(label["text"]):
+            region = (label["x0"] - 10, label["bottom"], label["x1"] + 60, label["bottom"] + COLUMN_DEPTH)
+            field = _field("label", label["text"], region, page, [], ink_annots)
+            if field["images"]:  # a header with nothing under it says nothing either way
+                fields.append(field)
+
+    return {"width": float(page.width), "height": float(page.height), "fields": fields,
+            "ink_annots": len(ink_annots)}
+
+
+# ======= Classification =======
+
+INK_LEVEL = 128  # grayscale values below this count as ink
+FIELD_NAMES = {"line": "line", "widget": "field", "label": "column"}
+
+
+def ink_density(image, region: tuple, masks: list, scale: float) -> float:
+    """Share of dark pixels in `region` (PDF points) of a rendered page, with printed text and borders whited out."""
+    from PIL import ImageDraw
+
+    box = [max(0, int(region[0] * scale)), max(0, int(region[1] * scale)),
+           min(image.width, int(region[2] * scale)), min(image.height, int(region[3] * scale))]
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return 0.0
+    crop = image.crop(box).convert("L")
+    draw = ImageDraw.Draw(crop)
+    for m in masks:
+        draw.rectangle([(m[0] - region[0]) * scale - 1, (m[1] - region[1]) * scale - 1,
+                        (m[2] - region[0]) * scale + 1, (m[3] - region[1]) * scale + 1], fill=255)
+    histogram = crop.histogram()
+    return sum(histogram[:INK_LEVEL]) / float(crop.width * crop.height)
+
+
+def classify_page(layout: dict, image=None, signed_ink: float = SIGNATURE_INK_SIGNED,
+                  empty_ink: float = SIGNATURE_INK_EMPTY) -> dict:
+    """
+    {"status": "signed" | "unsigned" | "uncertain", "reasons": [...], "ink": [...]}.
+    `image` is the rendered page (any DPI), or None to decide from the PDF objects alone.
+    """
+    fields = (layout or {}).get("fields") or []
+    if not fields:
+        return {"status": "uncertain", "reasons": ["no signature field found"], "ink": []}
+
+    signed = []
+    for field in fields:
+        name = f"'{field['label']}' {FIELD_NAMES[field['kind']]}"
+        if field["images"]:
+            signed.append(f"embedded image in the {name}")
+        if field["curves"]:
+            signed.append(f"drawn strokes on the {name}")
+        if field["ink"]:
+            signed.append(f"ink annotation on the {name}")
+        if field["script_chars"] or field["typed_signature"]:
+            signed.append(f"typed e-signature on the {name}")
+        if field.get("value"):
+            signed.append(f"filled {name}")
+
+    checkable = [f for f in fields if f["kind"] != "label"]
+    densities = []
+    if image is not None:
+        scale = image.width / layout["width"]
+        for field in checkable:
+            density = ink_density(image, field["region"], field["masks"], scale)
+            densities.append(round(density, 4))
+            if density >= signed_ink:
+                signed.append(f"ink above the '{field['label']}' {FIELD_NAMES[field['kind']]} ({density:.1%} dark)")
+
+    if signed:
+        return {"status": "signed", "reasons": signed, "ink": densities}
+    if image is None:
+        return {"status": "uncertain", "reasons": [f"page not rendered; nothing embedded in {len(fields)} field(s)"], "ink": []}
+    if layout.get("ink_annots"):
+        return {"status": "uncertain", "reasons": ["ink annotation outside the signature fields"], "ink": densities}
+    if checkable and max(densities) <= empty_ink:
+        return {"status": "unsigned", "reasons": [f"{len(checkable)} signature field(s) blank"], "ink": densities}
+    return {"status": "uncertain", "reasons": ["faint marks in a signature field"], "ink": densities}
+
+
+def local_answer(outcome: dict) -> str:
+    """The vision-result text for a page the local check settled."""
+    if outcome["status"] == "signed":
+        return f"Yes, the page is signed (local check: {'; '.join(outcome['reasons'])})."
+    return f"No signature is present (local check: {'; '.join(outcome['reasons'])})."
+
+
+# ======= Precision / Recall Report =======
+
+def evaluate(documents: list, labels: dict, dpi: int, signed_ink: float, empty_ink: float, all_pages: bool = False) -> dict:
+    from document_model import load_document
+
+    results = []
+    for pdf_path in documents:
+        name = os.path.basename(pdf_path)
+        label = labels.get(name)
+        if label is None or ("signed_pages" not in label and label.get("signed")):
+            print(f"[⚠️] No signed_pages label for {name}, skipped")
+            continue
+        truth = set(label.get("signed_pages", []))
+        document = load_document(pdf_path)
+        pages = [p.number for p in document.pages] if all_pages else \
+            sorted(set(label.get("signature_pages", [])) | truth)
+        try:
+            images = document.render_pages(pages, dpi=dpi, grayscale=True)
+        except Exception as e:
+            print(f"[⚠️] Could not render {name} ({e}); classifying from PDF objects only")
+            images = {}
+        for number in pages:
+            outcome = classify_page(document.page(number).signature_layout, images.get(number), signed_ink, empty_ink)
+            results.append({"document": name, "page": number, "signed": number in truth, **outcome})
+
+    def ratio(numerator, denominator):
+        return round(numerator / denominator, 3) if denominator else None
+
+    said_signed = [r for r in results if r["status"] == "signed"]
+    said_unsigned = [r for r in results if r["status"] == "unsigned"]
+    return {
+        "pages": len(results),
+        "decided": len(said_signed) + len(said_unsigned),
+        "signed_precision": ratio(sum(r["signed"] for r in said_signed), len(said_signed)),
+        "signed_recall": ratio(sum(r["signed"] for r in said_signed), sum(r["signed"] for r in results)),
+        "unsigned_precision": ratio(sum(not r["signed"] for r in said_unsigned), len(said_unsigned)),
+        "unsigned_recall": ratio(sum(not r["signed"] for r in said_unsigned), sum(not r["signed"] for r in results)),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    from ground_truth import load_labels
+    from vision_utils import VISION_DPI
+
+    parser = argparse.ArgumentParser(description="Report local signature-check precision/recall on labeled leases.")
+    parser.add_argument("documents", nargs="+", help="PDF files to check")
+    parser.add_argument("--labels", default="ground_truth.json", help="Ground-truth label file")
+    parser.add_argument("--dpi", type=int, default=VISION_DPI, help="Render DPI for the ink check")
+    parser.add_argument("--signed-ink", type=float, default=SIGNATURE_INK_SIGNED, help="Dark-pixel share that means signed")
+    parser.add_argument("--empty-ink", type=float, default=SIGNATURE_INK_EMPTY, help="Dark-pixel share at or below which a field is blank")
+    parser.add_argument("--all-pages", action="store_true", help="Check every page, not only the labeled signature pages")
+    args = parser.parse_args()
+
+    report = evaluate(args.documents, load_labels(args.labels), args.dpi, args.signed_ink, args.empty_ink, args.all_pages)
+    print(f"{'document':>24} {'page':>5} {'label':>9} {'local':>10}  reasons")
+    for r in report["results"]:
+        mark = "" if r["status"] == "uncertain" or (r["status"] == "signed") == r["signed"] else "  ❌"
+        print(f"{r['document'][:24]:>24} {r['page']:>5} {'signed' if r['signed'] else 'unsigned':>9} {r['status']:>10}  "
+              f"{'; '.join(r['reasons'])}{mark}")
+    print(f"\n{report['decided']} of {report['pages']} pages settled locally (vision calls saved)")
+    print(f"signed:   precision {report['signed_precision']}, recall {report['signed_recall']}")
+    print(f"unsigned: precision {report['unsigned_precision']}, recall {report['unsigned_recall']}")
@@ -1,21 +1,84 @@
-from twilio.rest import Client
 import os
-from dotenv import load_dotenv
+import time
+import threading
+from client_registry import load_env, get_client
+from span_utils import span
 
-load_dotenv()
-account_sid = os.getenv("TWILIO_SID")
-auth_token = os.getenv("TWILIO_TOKEN")
-from_number = os.getenv("TWILIO_NUMBER")
 
-client = Client(account_sid, auth_token)
+def format_us_phone(phone: str):
+    cleaned = phone.strip().replace("-", "").replace(" ", "").replace("(", "").replace(")", "")
+    if cleaned.startswith("+1"):
+        return cleaned
+    elif cleaned.startswith("1") and len(cleaned) == 11:
+        return f"+{cleaned}"
+    elif len(cleaned) == 10:
+        return f"+1{cleaned}"
+    return None
+
+
+class TwilioTransport:
+    name = "twilio"
+
+    def __init__(self, sender: str = None):
+        load_env()
+        self.sender = sender or os.getenv("TWILIO_NUMBER")
+
+    @property
+    def client(self):
+        # Built on first send, not at import, and shared across the process
+        return get_client("twilio")
+
+    def send(self, to: str, body: str) -> None:
+        self.client.messages.create(body=body, from_=self.sender, to=to)
+
+
+class StubSMSTransport:
+    """Records messages instead of sending them. `fail_first` failures per number exercise retries."""
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, fail_first: int = 0):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.sent = []
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str) -> None:
+        time.sleep(self.latency)
+        with self._lock:
+            failures = self._failures.get(to, 0)
+            if failures < self.fail_first:
+                self._failures[to] = failures + 1
+                raise ConnectionError(f"stub failure {failures + 1} for {to}")
+            self.sent.append({"to": to, "body": body})
+        print(f"[📱] (stub) SMS to {to}: {body[:60]}")
+
+
+def build_sms_transport(kind: str = None):
+    load_env()
+    kind = kind or os.getenv("SMS_TRANSPORT", "twilio")  # "stub" logs messages instead of sending
+    if kind == "stub":
+        return StubSMSTransport(latency=float(os.getenv("SMS_STUB_LATENCY", "0")))
+    if kind == "twilio":
+        return TwilioTransport()
+    raise ValueError(f"Unknown SMS_TRANSPORT: {kind}")
+
+
+_transport = None
+
+
+def get_sms_transport():
+    global _transport
+    if _transport is None:
+        _transport = build_sms_transport()
+    return _transport
+
 
 def send_sms(to, body):
+    """Sends one message right away. Submissions go through notification_outbox instead."""
     try:
-        client.messages.create(
-            body=body,
-            from_=from_number,
-            to=to
-        )
+        with span("sms_dispatch"):
+            get_sms_transport().send(to, body)
         return True
     except Exception as e:
         print(f"SMS failed: {e}")
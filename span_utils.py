@@ -0,0 +1,92 @@
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+# ======= Stage Timing Spans =======
+# Each span is a flat dict (stage, start/end, duration, token usage, cache
+# status, ...). Spans go to the process-wide span log for the engineering
+# dashboard and to the active collector, which the intake page writes next
+# to the run's trace file.
+
+SPAN_LOG = "span_log.json"
+
+_current_spans = contextvars.ContextVar("current_spans", default=None)
+_current_ticket = contextvars.ContextVar("current_ticket", default=None)
+_current_record = contextvars.ContextVar("current_record", default=None)
+_log_lock = threading.Lock()
+
+
+@contextmanager
+def collect_spans(ticket_id: str = None):
+    spans = []
+    spans_token = _current_spans.set(spans)
+    ticket_token = _current_ticket.set(ticket_id)
+    try:
+        yield spans
+    finally:
+        _current_spans.reset(spans_token)
+        _current_ticket.reset(ticket_token)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    record = {"stage": stage, "ticket_id": _current_ticket.get(), **attrs}
+    record_token = _current_record.set(record)
+    start = time.time()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = str(e)
+        raise
+    finally:
+        _current_record.reset(record_token)
+        end = time.time()
+        record.update({
+            "timestamp": datetime.fromtimestamp(start).isoformat(),
+            "start": start,
+            "end": end,
+            "duration_ms": round((end - start) * 1000, 2)
+        })
+        _emit(record)
+
+
+def record_usage(record: dict, response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        record[field] = getattr(usage, field, None)
+
+
+def annotate(**fields) -> None:
+    """Adds fields to the innermost open span of this thread, if any (e.g. scheduler wait times)."""
+    record = _current_record.get()
+    if record is not None:
+        record.update(fields)
+
+
+def _emit(record: dict) -> None:
+    spans = _current_spans.get()
+    if spans is not None:
+        spans.append(record)
+
+    with _log_lock:
+        with open(SPAN_LOG, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def map_in_context(executor, fn, jobs):
+    """executor.map(fn, *job) that keeps the caller's span collector in worker threads."""
+    contexts = [contextvars.copy_context() for _ in jobs]
+    return executor.map(lambda pair: pair[0].run(fn, *pair[1]), zip(contexts, jobs))
+
+
+def write_spans(trace_file: str, spans: list, spans_file: str = None) -> str:
+    """Saves the run's spans to `spans_file`, by default next to the trace."""
+    spans_file = spans_file or trace_file.rsplit(".json", 1)[0] + ".spans.json"
+    with open(spans_file, "w") as f:
+        json.dump(sorted(spans, key=lambda s: s["start"]), f, indent=2)
+    return spans_file
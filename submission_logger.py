@@ -1,7 +1,7 @@
-import json
 from datetime import datetime
+import log_store
 
-def log_submission(email, phone, method, ticket_id, result, duration=None):
+def log_submission(email, phone, method, ticket_id, result, duration=None, tokens=None, cost_usd=None):
     log = {
         "timestamp": datetime.now().isoformat(),
         "email": email,
@@ -9,7 +9,8 @@ def log_submission(email, phone, method, ticket_id, result, duration=None):
         "method": method,
         "ticket_id": ticket_id,
         "result": result,
-        "duration": duration
+        "duration": duration,
+        "tokens": tokens,
+        "cost_usd": cost_usd
     }
-    with open("submission_log.json", "a") as f:
-        f.write(json.dumps(log) + "\n")
\ No newline at end of file
+    log_store.insert("submissions", log)
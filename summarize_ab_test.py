@@ -1,97 +1,201 @@
-from PyPDF2 import PdfReader, PdfWriter
+"""
+Model A/B harness for the chunk summarization stage.
+
+Runs the production summarization request (structured verdicts, same
+chunking and page triage as summarize_chunks) for every model on every
+document, all chunks concurrently, and compares the models on latency,
+tokens, estimated cost and accuracy against ground_truth.json.
+
+    python summarize_ab_test.py lease_5pages.pdf --models gpt-4o-mini,gpt-4.1-mini,gpt-4o
+    python summarize_ab_test.py leases/*.pdf --concurrency 16 --no-cache
+
+Cached answers are free and instant; they are counted but left out of
+latency, token and cost figures (pass --no-cache for a cold run).
+Full per-chunk results go to ab_traces/abtest_<ts>.json.
+"""
 import os
-import pdfplumber
-from openai import OpenAI
-from dotenv import load_dotenv
-from text_utils import clean_pdf_text, chunk_text
-from datetime import datetime
+import sys
 import json
+import math
+import time
+import argparse
+import statistics
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import span_utils
+import token_budget
+from document_model import load_document
+from text_utils import triage_pages, chunk_pages, summarize_chunk, CHUNK_TOKEN_BUDGET, SUMMARY_MODEL
+from page_triage import TRIAGE_THRESHOLD
+from chunk_verdicts import aggregate_verdicts
+from ground_truth import load_labels, GROUND_TRUTH_FILE
+from model_pricing import estimate_cost
+from llm_cache import llm_cache
+from llm_scheduler import get_scheduler, set_default_priority
+
+AB_TRACE_DIR = "ab_traces"
+DEFAULT_MODELS = f"{SUMMARY_MODEL},gpt-4.1-mini,gpt-4o"
+
+
+# ======= Running the Models =======
+
+def plan_chunks(pdf_path: str, max_tokens: int, triage_threshold: float) -> dict:
+    document = load_document(pdf_path)
+    kept_pages, _, _ = triage_pages(document, triage_threshold)
+    return {"document": os.path.basename(pdf_path), "pages": len(document),
+            "chunks": chunk_pages(kept_pages, max_tokens=max_tokens)}
+
+
+def run_chunk(model: str, document: str, chunk: dict, chunk_index: int, chunk_count: int) -> dict:
+    with span_utils.collect_spans(f"ab:{model}:{document}") as spans:
+        verdict = summarize_chunk(chunk["text"], chunk["pages"], chunk_index, chunk_count, model=model)
+    call = spans[-1]  # the summarize_chunk span: timing, usage, cache status
+    return {
+        "model": model,
+        "document": document,
+        "chunk_index": chunk_index,
+        "pages": chunk["pages"],
+        "chunk_text": chunk["text"],
+        "verdict": verdict,
+        "cache": call.get("cache"),
+        "error": call.get("error"),
+        "start": call["start"],
+        "end": call["end"],
+        "latency_ms": round(call["duration_ms"] - call.get("queue_wait_ms", 0), 2),  # model time, not rate-limit waits
+        "queue_wait_ms": call.get("queue_wait_ms"),
+        "retries": call.get("retries"),
+        "prompt_tokens": call.get("prompt_tokens"),
+        "completion_tokens": call.get("completion_tokens"),
+    }
+
+
+# ======= Scoring =======
+
+def score_document(verdicts: list, label: dict) -> dict:
+    decision = aggregate_verdicts(verdicts)
+    predicted = set(decision["signature_pages"])
+    expected = set(label.get("signature_pages", []))
+    return {
+        "decision": decision,
+        "signature_hits": len(predicted & expected),
+        "signature_predicted": len(predicted),
+        "signature_expected": len(expected),
+        "signed_correct": (decision["is_signed"] == "yes") == bool(label.get("signed")),
+        "start_correct": decision["lease_start"] == label.get("lease_start"),
+        "end_correct": decision["lease_end"] == label.get("lease_end"),
+    }
+
 
-# === Setup ===
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# === Extract Selected Pages for Testing ===
-def extract_selected_pages(input_pdf, output_pdf, pages_to_keep):
-    reader = PdfReader(input_pdf)
-    writer = PdfWriter()
-    for page_num in pages_to_keep:
-        writer.add_page(reader.pages[page_num - 1])  # 0-based index
-    with open(output_pdf, "wb") as f:
-        writer.write(f)
-
-extract_selected_pages("uploaded_lease.pdf", "lease_5pages.pdf", [1, 5, 37, 51, 52])
-
-# === Models & Prompt ===
-models = ["gpt-4o-mini", "gpt-3.5-turbo"]
-pdf_path = "lease_5pages.pdf"
-
-system_prompt = (
-    "You are a smart assistant helping to review lease documents page by page.\n\n"
-    "For each page, do the following:\n"
-    "1. Briefly summarize the content of this page in 2–3 lines.\n\n"
-    "2. Determine if this page is expected to contain a visible signature field or box:\n"
-    "   - Does it include a space meant for someone to sign?\n"
-    "   - Or does it merely reference signing in the future?\n"
-    "   - ⚠️ Do NOT count footers or metadata like 'digitally signed by RentCafe'.\n"
-    "   - Signature references in document footers should be ignored unless there's an actual form field or box.\n\n"
-    "3. Determine if this page includes the lease start and end date:\n"
-    "   - If lease dates are present (e.g., move-in/move-out), extract and state them clearly in your response.\n"
-    "   - If lease duration or date range is not present but should be, say so.\n"
-    "   - If lease dates are not expected here, say that explicitly.\n\n"
-    "Be precise and helpful — your answer will guide a downstream document automation system to validate this lease."
-)
-
-# === Output Log Setup ===
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-os.makedirs("ab_traces", exist_ok=True)
-
-def summarize(model_name):
-    print(f"\n🔍 MODEL: {model_name}")
-    results = []
-
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            raw_text = page.extract_text() or ""
-            cleaned = clean_pdf_text(raw_text)
-            chunks = chunk_text(cleaned, chunk_size=2000)
-
-            for chunk_index, chunk in enumerate(chunks):
-                print(f"\n📄 Page {page_num}, Chunk {chunk_index+1}/{len(chunks)}")
-
-                try:
-                    response = client.chat.completions.create(
-                        model=model_name,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": chunk}
-                        ],
-                        temperature=0.3,
-                        max_tokens=500
-                    )
-                    summary = response.choices[0].message.content
-                    print(summary)
-
-                except Exception as e:
-                    summary = f"[❌ GPT Error]: {e}"
-                    print(summary)
-
-                # Append to log
-                results.append({
-                    "model": model_name,
-                    "page": page_num,
-                    "chunk_index": chunk_index,
-                    "chunk_text": chunk,
-                    "summary": summary
-                })
-
-    # Save to file
-    output_file = f"ab_traces/abtest_{model_name}_{timestamp}.json"
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 3) if denominator else None
+
+
+def summarize_model(model: str, calls: list, scores: list) -> dict:
+    paid = [c for c in calls if c["cache"] != "hit" and not c["error"]]
+    prompt_tokens = sum(c["prompt_tokens"] or 0 for c in paid)
+    completion_tokens = sum(c["completion_tokens"] or 0 for c in paid)
+    costs = [estimate_cost(model, c["prompt_tokens"], c["completion_tokens"]) for c in paid]
+    latencies = sorted(c["latency_ms"] for c in paid)
+    wall_s = (max(c["end"] for c in calls) - min(c["start"] for c in calls)) if calls else 0
+    documents = len({c["document"] for c in calls})
+
+    return {
+        "model": model,
+        "documents": documents,
+        "chunks": len(calls),
+        "cache_hits": sum(c["cache"] == "hit" for c in calls),
+        "failed_chunks": sum(c["verdict"] is None for c in calls),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)] if latencies else None,
+        "chunks_per_s": round(len(calls) / wall_s, 2) if wall_s else None,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": round(sum(costs), 5) if costs and None not in costs else None,
+        "cost_per_doc_usd": round(sum(costs) / documents, 5) if costs and None not in costs and documents else None,
+        "labeled_documents": len(scores),
+        "signature_precision": ratio(sum(s["signature_hits"] for s in scores), sum(s["signature_predicted"] for s in scores)),
+        "signature_recall": ratio(sum(s["signature_hits"] for s in scores), sum(s["signature_expected"] for s in scores)),
+        "signed_accuracy": ratio(sum(s["signed_correct"] for s in scores), len(scores)),
+        "lease_start_accuracy": ratio(sum(s["start_correct"] for s in scores), len(scores)),
+        "lease_end_accuracy": ratio(sum(s["end_correct"] for s in scores), len(scores)),
+    }
+
+
+TABLE_COLUMNS = [
+    ("model", "model", 16), ("chunks", "chunks", 6), ("failed_chunks", "failed", 6), ("p50_ms", "p50 ms", 8),
+    ("p95_ms", "p95 ms", 8), ("chunks_per_s", "chunk/s", 7), ("prompt_tokens", "prompt tok", 10),
+    ("completion_tokens", "compl tok", 9), ("cost_per_doc_usd", "$/doc", 8), ("signature_precision", "sig P", 6),
+    ("signature_recall", "sig R", 6), ("signed_accuracy", "signed", 6), ("lease_start_accuracy", "start", 6),
+    ("lease_end_accuracy", "end", 6),
+]
+
+
+def print_table(rows: list) -> None:
+    print(" ".join(f"{title:>{width}}" for _, title, width in TABLE_COLUMNS))
+    for row in rows:
+        print(" ".join(f"{'—' if row[key] is None else row[key]!s:>{width}}" for key, _, width in TABLE_COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare models on the chunk summarization stage.")
+    parser.add_argument("documents", nargs="*", default=["lease_5pages.pdf"], help="PDFs to summarize")
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="Comma-separated model names")
+    parser.add_argument("--labels", default=GROUND_TRUTH_FILE, help="Ground-truth label file")
+    parser.add_argument("--concurrency", type=int, default=8, help="Chunk requests in flight across all models")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKEN_BUDGET, help="Chunk token budget")
+    parser.add_argument("--triage-threshold", type=float, default=TRIAGE_THRESHOLD, help="Page triage threshold (0 = every page)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the LLM cache so every call is paid for")
+    parser.add_argument("--output-dir", default=AB_TRACE_DIR, help="Where the per-chunk results are written")
+    args = parser.parse_args()
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    labels = load_labels(args.labels) if os.path.exists(args.labels) else {}
+    llm_cache.bypass = llm_cache.bypass or args.no_cache
+    os.makedirs(args.output_dir, exist_ok=True)
+    span_utils.SPAN_LOG = os.path.join(args.output_dir, "span_log.json")  # keep A/B calls out of the app's latency view
+    token_budget.set_ledger(os.path.join(args.output_dir, "token_usage.db"))  # ...and out of its hourly budget
+    set_default_priority("backfill")  # never crowd out live submissions
+
+    with contextlib.redirect_stdout(sys.stderr):
+        plans = [plan_chunks(path, args.max_tokens, args.triage_threshold) for path in args.documents]
+        jobs = [
+            (model, plan["document"], chunk, index, len(plan["chunks"]))
+            for model in models for plan in plans for index, chunk in enumerate(plan["chunks"])
+        ]
+        print(f"[🧪] {len(models)} models x {len(plans)} documents = {len(jobs)} chunk requests")
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            calls = list(executor.map(lambda job: run_chunk(*job), jobs))
+        elapsed = time.time() - start
+
+    rows = []
+    for model in models:
+        model_calls = [c for c in calls if c["model"] == model]
+        scores = []
+        for plan in plans:
+            if plan["document"] in labels:
+                verdicts = [c["verdict"] for c in model_calls if c["document"] == plan["document"]]
+                scores.append(score_document(verdicts, labels[plan["document"]]))
+        rows.append(summarize_model(model, model_calls, scores))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = os.path.join(args.output_dir, f"abtest_{timestamp}.json")
     with open(output_file, "w") as f:
-        json.dump(results, f, indent=2)
+        json.dump({"timestamp": timestamp, "documents": args.documents, "models": models,
+                   "elapsed_s": round(elapsed, 2), "summary": rows, "calls": calls}, f, indent=2)
+
+    print_table(rows)
+    unlabeled = [plan["document"] for plan in plans if plan["document"] not in labels]
+    if unlabeled:
+        print(f"[⚠️] No labels in {args.labels} for: {', '.join(unlabeled)} (accuracy columns skip them)")
+    scheduler_stats = get_scheduler().stats()
+    if scheduler_stats:
+        print(f"[🚦] LLM scheduler: {scheduler_stats}")
+    print(f"[🧾] Per-chunk results written to {output_file}")
 
-    print(f"\n✅ Saved trace to {output_file}")
 
-# === Run both models ===
-for model in models:
-    summarize(model)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import re
+from collections import namedtuple
+
+# ======= Text Cleaning Engine =======
+# Rules are compiled once at import. A rule with a `guard` only runs when one
+# of its substrings occurs in the text (a cheap C-level scan), so most pages
+# skip several regex passes. Guards must be exact: only add one when the
+# pattern cannot match without it. Rules run in order and the order is part
+# of the output contract (later rules see earlier removals).
+
+CleaningRule = namedtuple("CleaningRule", ["name", "pattern", "replacement", "flags", "guard"])
+
+DEFAULT_RULES = [
+    # Collapse multiple line breaks
+    CleaningRule("blank_lines", r"\n{2,}", "\n", 0, ("\n\n",)),
+
+    # Remove header/footer repetition patterns (very common in leases). Kept as two
+    # passes: removing "page 1 of 2" can complete a "continued on next page" match.
+    CleaningRule("page_counters", r"page \d+ of \d+", "", re.IGNORECASE, None),
+    CleaningRule("continued_footers", r"continued on next page", "", re.IGNORECASE, None),
+
+    # Remove watermark-like repeating text (often PDF layer artifacts)
+    CleaningRule(
+        "watermarks", r"\b(?:Document|Signature|Timestamp|MediaBox|CropBox).*\n", "", 0,
+        ("Document", "Signature", "Timestamp", "MediaBox", "CropBox")
+    ),
+
+    # Remove long whitespace runs
+    CleaningRule("whitespace_runs", r"[ \t]{2,}", " ", 0, ("  ", "\t")),
+
+    # Remove page numbers or page headers
+    CleaningRule("page_numbers", r"^\s*\d+\s*$", "", re.MULTILINE, None),
+
+    # Remove non-informative uppercase lines (often noise in scans)
+    CleaningRule("uppercase_noise", r"^[A-Z\s]{15,}$", "", re.MULTILINE, None),
+]
+
+
+class TextCleaner:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = list(rules)
+        self._compiled = [
+            (rule.guard, re.compile(rule.pattern, rule.flags).sub, rule.replacement)
+            for rule in self.rules
+        ]
+
+    def clean(self, text: str) -> str:
+        for guard, sub, replacement in self._compiled:
+            if guard is not None and not any(token in text for token in guard):
+                continue
+            text = sub(replacement, text)
+        return text.strip()
+
+    def clean_pages(self, pages):
+        """Lazily cleans an iterable of page texts, one page at a time."""
+        for text in pages:
+            yield self.clean(text or "")
+
+
+DEFAULT_CLEANER = TextCleaner()
+
+
+def clean_pdf_text(text: str) -> str:
+    return DEFAULT_CLEANER.clean(text)
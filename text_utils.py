@@ -1,12 +1,18 @@
 import os
 import re
-import json
-import streamlit as st
-from openai import OpenAI
-from datetime import datetime
-import pdfplumber
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from prompt_templates import CHUNK_VERDICT_PROMPT
+from text_cleaner import clean_pdf_text  # re-exported for existing callers
+from document_model import load_document
+from page_triage import score_page, TRIAGE_THRESHOLD
+from llm_cache import llm_cache, make_key
+from llm_backend import get_backend
+from span_utils import span, record_usage, map_in_context
+from trace_store import write_trace
+import page_store
+import token_budget
+from chunk_verdicts import VERDICT_RESPONSE_FORMAT, parse_verdict, render_verdict, needs_second_opinion
 
 # ======= Smart Truncator =======
 
@@ -17,104 +23,402 @@ def smart_truncate(text: str, max_tokens: int = 8000) -> str:
     return text[:max_chars] + "\n\n[...Document truncated for processing due to size limits...]"
 
 
-def chunk_text(text: str, chunk_size: int = 2000) -> list:
+# ======= Token-Aware Chunker =======
+
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", 1500))
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken missing, or its vocab can't be downloaded on an offline host
+        print(f"[⚠️] No tokenizer for {model} ({e}); estimating 4 chars per token")
+        return None
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    encoding = _encoding(model or SUMMARY_MODEL)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_units(text: str, max_tokens: int, model: str = None) -> list:
     """
-    Splits cleaned text into chunks of max `chunk_size` characters.
+    Breaks a page into (text, tokens) units no larger than `max_tokens`:
+    lines first, then sentences, then whole words. Never splits mid-word.
     """
-    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    units = []
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        tokens = count_tokens(line, model)
+        if tokens <= max_tokens:
+            units.append((line, tokens))
+            continue
+
+        for sentence in _SENTENCE_END.split(line):
+            tokens = count_tokens(sentence, model)
+            if tokens <= max_tokens:
+                units.append((sentence, tokens))
+                continue
+
+            words, used = [], 0
+            for word in sentence.split():
+                word_tokens = count_tokens(word + " ", model)
+                if words and used + word_tokens > max_tokens:
+                    units.append((" ".join(words), used))
+                    words, used = [], 0
+                words.append(word)
+                used += word_tokens
+            if words:
+                units.append((" ".join(words), used))
+    return units
+
+
+def chunk_pages(pages, max_tokens: int = CHUNK_TOKEN_BUDGET, model: str = None) -> list:
+    """
+    Packs consecutive pages into requests of at most `max_tokens`, splitting
+    long pages at line/sentence boundaries. `pages` is an iterable of
+    (page_number, text). Each chunk is {"text", "pages"}; every page inside a
+    chunk starts with a "[Page N]" marker so findings can be attributed.
+    """
+    chunks = []
+    lines, chunk_pages_seen, used = [], [], 0
+
+    def flush():
+        nonlocal lines, chunk_pages_seen, used
+        if lines:
+            chunks.append({"text": "\n".join(lines), "pages": chunk_pages_seen})
+        lines, chunk_pages_seen, used = [], [], 0
+
+    for page_number, text in pages:
+        header = f"[Page {page_number}]"
+        header_tokens = count_tokens(header, model) + 1
+
+        for unit, tokens in split_units(text, max_tokens - header_tokens, model):
+            new_page = not chunk_pages_seen or chunk_pages_seen[-1] != page_number
+            cost = tokens + 1 + (header_tokens if new_page else 0)
+            if lines and used + cost > max_tokens:
+                flush()
+                new_page = True
+            if new_page:
+                lines.append(header)
+                chunk_pages_seen.append(page_number)
+                used += header_tokens
+            lines.append(unit)
+            used += tokens + 1
+
+    flush()
+    return chunks
 
 # ======= Summarizer with Trace + Safety =======
 
-def summarize_chunks(pdf_path: str, chunk_size: int = 2000):
-    with pdfplumber.open(pdf_path) as pdf:
-        page_count = len(pdf.pages)
-        summaries = []
-        trace_data = []
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        trace_file = os.path.join("traces", f"trace_summary_{timestamp}.json")
-
-        for page_num, page in enumerate(pdf.pages, start=1):
-            raw_text = page.extract_text() or ""
-            cleaned = clean_pdf_text(raw_text)
-            chunks = chunk_text(cleaned, chunk_size)
-
-            for chunk_index, chunk in enumerate(chunks):
-                print(f"[📄] Summarizing Page {page_num}, Chunk {chunk_index+1}/{len(chunks)}")
-
-                try:
-                    response = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": (
-                                    "You are a smart assistant helping to review lease documents page by page.\n\n"
-                                    "For each page, do the following:\n"
-                                    "1. Briefly summarize the content of this page in 2–3 lines.\n\n"
-                                    "2. Determine if this page is expected to contain a visible signature field or box:\n"
-                                    "   - Does it include a space meant for someone to sign?\n"
-                                    "   - Or does it merely reference signing in the future?\n"
-                                    "   - If no visual signature field is expected, say so clearly.\n\n"
-                                    "3. Determine if this page includes the lease start and end date:\n"
-                                    "   - If lease dates are present (e.g., move-in/move-out), extract and state them clearly in your response.\n"
-                                    "   - If lease duration or date range is not present but should be, say so.\n"
-                                    "   - If lease dates are not expected here, say that explicitly.\n\n"
-                                    "Be precise and helpful — your answer will guide a downstream document automation system to validate this lease."
-                                )
-                            },
-                            {"role": "user", "content": chunk}
-                        ],
-                        temperature=0.3,
-                        max_tokens=400
-                    )
-                    summary = response.choices[0].message.content
-                except Exception as e:
-                    print(f"[❌] GPT failed on Page {page_num}, Chunk {chunk_index+1}: {e}")
-                    summary = "[⚠️ GPT failed to summarize this chunk.]"
-
-                summaries.append(summary)
-
-                # === Log the trace ===
-                trace_data.append({
-                    "page": page_num,
-                    "chunk_index": chunk_index,
-                    "chunk_text": chunk,
-                    "summary": summary
-                })
-
-        # === Save the trace file ===
-        os.makedirs("traces", exist_ok=True)
-        with open(trace_file, "w") as f:
-            json.dump(trace_data, f, indent=2)
-
-        print(f"[🧾] Full summary trace written to {trace_file}")
-        return "\n".join(summaries), trace_file
-
-
-
-# ======= Text Cleaner =======
-
-def clean_pdf_text(text: str) -> str:
-    # Collapse multiple line breaks
-    text = re.sub(r"\n{2,}", "\n", text)
-
-    # Remove header/footer repetition patterns (very common in leases)
-    text = re.sub(r"(?i)page \d+ of \d+", "", text)
-    text = re.sub(r"(continued on next page)", "", text, flags=re.IGNORECASE)
-
-    # Remove watermark-like repeating text (often PDF layer artifacts)
-    text = re.sub(r"\b(?:Document|Signature|Timestamp|MediaBox|CropBox).*\n", "", text)
-
-    # Remove long whitespace runs
-    text = re.sub(r"[ \t]{2,}", " ", text)
-
-    # Optional: remove page numbers or page headers
-    text = re.sub(r"^\s*\d+\s*$", "", text, flags=re.MULTILINE)
-
-    # Remove non-informative uppercase lines (often noise in scans)
-    text = re.sub(r"^[A-Z\s]{15,}$", "", text, flags=re.MULTILINE)
-
-    print(text)  # optional debug
-
-    return text.strip()
\ No newline at end of file
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", 8))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+# Re-asked for chunks the cheap model failed or wasn't confident about; empty = never
+SUMMARY_ESCALATION_MODEL = os.getenv("SUMMARY_ESCALATION_MODEL", "gpt-4o")
+SUMMARY_TEMPERATURE = 0.3
+# The answer holds one JSON verdict per page (~60 tokens each), so its cap grows with the chunk
+SUMMARY_ANSWER_TOKENS = 100  # the {"pages": [...]} wrapper and slack
+SUMMARY_TOKENS_PER_PAGE = 80
+SUMMARY_FAILED = "[⚠️ GPT failed to summarize this chunk.]"
+
+
+PAGE_MARKER = re.compile(r"^\[Page \d+\]$", re.MULTILINE)
+
+
+def summary_max_tokens(page_count: int) -> int:
+    return SUMMARY_ANSWER_TOKENS + SUMMARY_TOKENS_PER_PAGE * max(1, page_count)
+
+
+def build_summary_request(chunk: str, model: str = None) -> dict:
+    """Counts the chunk's "[Page N]" markers for the answer cap, so a request rebuilt from trace text is identical."""
+    return {
+        "model": model or SUMMARY_MODEL,
+        "messages": [
+            {"role": "system", "content": CHUNK_VERDICT_PROMPT},
+            {"role": "user", "content": chunk}
+        ],
+        "temperature": SUMMARY_TEMPERATURE,
+        "max_tokens": summary_max_tokens(len(PAGE_MARKER.findall(chunk))),
+        "response_format": VERDICT_RESPONSE_FORMAT
+    }
+
+
+def verdict_version() -> str:
+    """What produced a stored verdict (see page_store); changing a model, the prompt or the schema invalidates it."""
+    return make_key(kind="chunk_verdict", model=SUMMARY_MODEL, escalation_model=SUMMARY_ESCALATION_MODEL,
+                    prompt=CHUNK_VERDICT_PROMPT, temperature=SUMMARY_TEMPERATURE,
+                    response_format=VERDICT_RESPONSE_FORMAT)[:16]
+
+
+def page_label(pages: list) -> str:
+    if len(pages) == 1:
+        return f"Page {pages[0]}"
+    return f"Pages {pages[0]}-{pages[-1]}"
+
+
+def summarize_chunk(chunk: str, pages: list, chunk_index: int, chunk_count: int, model: str = None):
+    """Returns the chunk's parsed verdict (see chunk_verdicts), or None if the call or its JSON failed."""
+    request = build_summary_request(chunk, model)
+    label = page_label(pages)
+
+    # Keyed on chunk text, model, system prompt, temperature, max_tokens and schema
+    cache_key = make_key(kind="chunk_verdict", **request)
+    with span("summarize_chunk", page=pages[0], pages=pages, chunk_index=chunk_index, model=request["model"]) as record:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            record["cache"] = "hit"
+            print(f"[💾] Cache hit for {label}, Chunk {chunk_index+1}/{chunk_count}")
+            return cached["verdict"]
+        record["cache"] = "bypass" if llm_cache.bypass else "miss"
+
+        print(f"[📄] Summarizing {label}, Chunk {chunk_index+1}/{chunk_count}")
+
+        try:
+            response = get_backend().chat(**request)
+            content = response.choices[0].message.content
+        except Exception as e:
+            print(f"[❌] GPT failed on {label}, Chunk {chunk_index+1}: {e}")
+            record["error"] = str(e)
+            return None
+
+        record_usage(record, response)
+        token_budget.charge(response, request["model"])
+        verdict = parse_verdict(content, pages)
+        if verdict is None:
+            print(f"[❌] Unusable verdict for {label}, Chunk {chunk_index+1}: {str(content)[:200]}")
+            record["error"] = "invalid verdict JSON"
+            return None
+
+    # Failures above are never cached, so a retry gets a fresh call
+    llm_cache.set(cache_key, {"verdict": verdict})
+    return verdict
+
+
+# ======= Fitting the Token Budget =======
+
+MIN_TRUNCATED_TOKENS = 200  # a page cut shorter than this isn't worth a call
+
+
+@lru_cache(maxsize=None)
+def _request_overhead(model: str = None) -> int:
+    """Tokens a one-page summary call costs besides the page: the system prompt and the most it may answer."""
+    return count_tokens(CHUNK_VERDICT_PROMPT, model) + summary_max_tokens(1)
+
+
+def estimate_chunk_tokens(text: str, model: str = None) -> int:
+    """The chunk, the prompt and the answer cap, which grows by SUMMARY_TOKENS_PER_PAGE per extra page."""
+    extra_pages = max(0, len(PAGE_MARKER.findall(text)) - 1)
+    return count_tokens(text, model) + _request_overhead(model) + SUMMARY_TOKENS_PER_PAGE * extra_pages
+
+
+def fit_to_budget(pages: list, triage_scores: dict, max_tokens: int = CHUNK_TOKEN_BUDGET) -> tuple:
+    """
+    Chunks (page number, text) pairs within what the token budget has left
+    (see token_budget). When everything doesn't fit, pages are kept in
+    triage-score order, the last one that partly fits is truncated, and the
+    rest are dropped. Returns (chunks, dropped page numbers).
+    """
+    chunks = chunk_pages(pages, max_tokens=max_tokens)
+    remaining = token_budget.remaining_tokens()
+    if remaining is None or sum(estimate_chunk_tokens(chunk["text"]) for chunk in chunks) <= remaining:
+        return chunks, []
+
+    kept, dropped = [], []
+    for number, text in sorted(pages, key=lambda page: triage_scores[page[0]], reverse=True):
+        tokens = count_tokens(text)
+        cost = tokens + _request_overhead() * -(-tokens // max_tokens)  # every chunk the page needs pays the overhead
+        if cost <= remaining:
+            kept.append((number, text))
+            remaining -= cost
+        elif remaining - _request_overhead() >= MIN_TRUNCATED_TOKENS:
+            kept.append((number, smart_truncate(text, remaining - _request_overhead())))
+            token_budget.degrade(f"Token budget: truncated page {number} to fit")
+            remaining = 0
+        else:
+            dropped.append(number)
+
+    if dropped:
+        token_budget.degrade(f"Token budget: summarizing {len(kept)} of {len(pages)} pages by triage score, "
+                             f"dropped pages {sorted(dropped)}")
+    return chunk_pages(sorted(kept), max_tokens=max_tokens), sorted(dropped)
+
+
+def triage_pages(document, triage_threshold: float = TRIAGE_THRESHOLD) -> tuple:
+    """
+    Scores every page. Returns (kept (page number, cleaned text) pairs,
+    trace entries for the skipped pages, page number -> score). A page kept
+    on layout alone with no text (e.g. a scanned signature page) has nothing
+    to summarize; it is traced as skipped with reason "no text".
+    """
+    kept_pages = []
+    skipped_entries = []
+    triage_scores = {}
+    for page in document.pages:
+        score, features = score_page(page.text, page.layout)
+        triage_scores[page.number] = score
+
+        if score < triage_threshold:
+            print(f"[⏭️] Skipping Page {page.number} (triage score {score} < {triage_threshold})")
+            skipped_entries.append({
+                "page": page.number,
+                "pages": [page.number],
+                "chunk_index": None,
+                "chunk_text": page.cleaned_text,
+                "summary": None,
+                "skipped": True,
+                "triage_score": score,
+                "triage_features": features
+            })
+            continue
+        if not page.cleaned_text.strip():
+            print(f"[🖼️] Page {page.number} has no text to summarize (triage score {score})")
+            skipped_entries.append({
+                "page": page.number,
+                "pages": [page.number],
+                "chunk_index": None,
+                "chunk_text": "",
+                "summary": None,
+                "skipped": True,
+                "reason": "no text",
+                "triage_score": score,
+                "triage_features": features
+            })
+            continue
+        kept_pages.append((page.number, page.cleaned_text))
+    return kept_pages, skipped_entries, triage_scores
+
+
+def summarize_chunks(pdf_path: str, max_tokens: int = CHUNK_TOKEN_BUDGET, max_concurrency: int = SUMMARY_CONCURRENCY,
+                     document=None, triage_threshold: float = TRIAGE_THRESHOLD, ticket_id: str = None, on_progress=None,
+                     incremental: bool = page_store.INCREMENTAL_REVIEW):
+    """
+    Summarizes the document in token-budgeted chunks with up to
+    `max_concurrency` requests in flight. Short consecutive pages share a
+    chunk; each trace entry lists the pages it covers and holds the chunk's
+    structured verdict. Returns (summary text, trace file, verdicts), with
+    verdicts in page order and None for failed chunks.
+    Pass an already parsed `document` to avoid reopening the PDF.
+    Pages scoring below `triage_threshold` in page triage are not sent to the
+    LLM; they stay in the trace with `skipped` set and their score.
+    The trace is indexed under `ticket_id` and the document hash (see trace_store).
+    The cheap SUMMARY_MODEL answers first; chunks it fails or isn't
+    confident about are asked again of SUMMARY_ESCALATION_MODEL. When the
+    token budget can't cover every page, the lowest-scoring ones are dropped
+    (traced as skipped with `over_budget`), see fit_to_budget.
+    With `incremental` and a `ticket_id`, pages unchanged since an earlier
+    review of the ticket reuse their stored verdicts (see page_store) and
+    are traced with `reused` set; only the other pages are summarized.
+    `on_progress(kind, data)` is called with a "triage" event up front and a
+    "chunk" event as each chunk's verdict lands (from worker threads).
+    """
+    if document is None:
+        document = load_document(pdf_path)
+
+    kept_pages, trace_data, triage_scores = triage_pages(document, triage_threshold)
+
+    known = page_store.known_verdicts(ticket_id, document, verdict_version()) if incremental and ticket_id else {}
+    reused_pages = [number for number, _ in kept_pages if number in known]
+    if reused_pages:
+        print(f"[♻️] {len(reused_pages)} of {len(kept_pages)} pages unchanged since the last review of ticket {ticket_id}")
+    changed_pages = [(number, text) for number, text in kept_pages if number not in known]
+
+    with span("chunking", pages=len(changed_pages)) as record:
+        chunks, over_budget = fit_to_budget(changed_pages, triage_scores, max_tokens)
+        record["chunks"] = len(chunks)
+    jobs = [(chunk["text"], chunk["pages"], chunk_index, len(chunks)) for chunk_index, chunk in enumerate(chunks)]
+    print(f"[📦] Packed {len(changed_pages) - len(over_budget)} pages into {len(chunks)} chunks of up to {max_tokens} tokens")
+    if on_progress:
+        on_progress("triage", {"pages": len(document), "kept": [number for number, _ in kept_pages],
+                               "skipped": [entry["page"] for entry in trace_data], "reused": reused_pages,
+                               "no_text": [entry["page"] for entry in trace_data if entry.get("reason") == "no text"],
+                               "over_budget": over_budget, "chunks": len(chunks) + bool(reused_pages)})
+        if reused_pages:
+            on_progress("chunk", {"chunk_index": None, "chunk_count": len(chunks) + 1, "pages": reused_pages, "reused": True,
+                                  "verdict": {"pages": [entry for number in reused_pages for entry in known[number]]}})
+
+    models = {}
+
+    def summarize_job(text, pages, chunk_index, chunk_count):
+        verdict = summarize_chunk(text, pages, chunk_index, chunk_count)
+        models[chunk_index] = SUMMARY_MODEL
+        if SUMMARY_ESCALATION_MODEL and needs_second_opinion(verdict):
+            if token_budget.allows(estimate_chunk_tokens(text, SUMMARY_ESCALATION_MODEL)):
+                print(f"[🔁] Asking {SUMMARY_ESCALATION_MODEL} about {page_label(pages)} (failed or low confidence)")
+                second = summarize_chunk(text, pages, chunk_index, chunk_count, model=SUMMARY_ESCALATION_MODEL)
+                if second is not None:
+                    verdict, models[chunk_index] = second, SUMMARY_ESCALATION_MODEL
+            else:
+                token_budget.degrade(f"Token budget: kept the {SUMMARY_MODEL} verdict for {page_label(pages)}")
+        if on_progress:
+            on_progress("chunk", {"chunk_index": chunk_index, "chunk_count": chunk_count, "pages": pages, "verdict": verdict})
+        return verdict
+
+    if max_concurrency <= 1:
+        verdicts = [summarize_job(*job) for job in jobs]
+    else:
+        # executor.map yields results in submission order, not completion order
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            verdicts = list(map_in_context(executor, summarize_job, jobs))
+
+    if incremental and ticket_id:
+        failed_pages = {number for chunk, verdict in zip(chunks, verdicts) if verdict is None for number in chunk["pages"]}
+        page_store.save_verdicts(ticket_id, document, verdicts, verdict_version(), skip_pages=failed_pages)
+
+    # === Log the trace ===
+    for chunk_index, (chunk, verdict) in enumerate(zip(chunks, verdicts)):
+        trace_data.append({
+            "page": chunk["pages"][0],
+            "pages": chunk["pages"],
+            "chunk_index": chunk_index,
+            "chunk_text": chunk["text"],
+            "summary": render_verdict(verdict) if verdict else SUMMARY_FAILED,
+            "verdict": verdict,
+            "model": models[chunk_index],
+            "triage_scores": [triage_scores[p] for p in chunk["pages"]]
+        })
+    for number in over_budget:
+        trace_data.append({
+            "page": number,
+            "pages": [number],
+            "chunk_index": None,
+            "chunk_text": document.page(number).cleaned_text,
+            "summary": None,
+            "skipped": True,
+            "over_budget": True,
+            "triage_score": triage_scores[number]
+        })
+    for number in reused_pages:
+        verdict = {"pages": known[number]}
+        trace_data.append({
+            "page": number,
+            "pages": [number],
+            "chunk_index": None,
+            "chunk_text": document.page(number).cleaned_text,
+            "summary": render_verdict(verdict),
+            "verdict": verdict,
+            "reused": True,
+            "triage_scores": [triage_scores[number]]
+        })
+    trace_data.sort(key=lambda entry: entry["page"])
+    reviewed = [entry for entry in trace_data if not entry.get("skipped")]
+
+    skipped = len(document) - len(kept_pages)
+    if skipped:
+        print(f"[⏭️] Page triage skipped {skipped} of {len(document)} pages")
+
+    # === Save the trace file ===
+    trace_file = write_trace(trace_data, ticket_id=ticket_id, doc_hash=document.doc_hash)
+
+    print(f"[🧾] Full summary trace written to {trace_file}")
+    print(f"[💾] LLM cache: {llm_cache.stats()}")
+    return "\n".join(entry["summary"] for entry in reviewed), trace_file, [entry["verdict"] for entry in reviewed]
@@ -0,0 +1,189 @@
+"""
+Token budget governor.
+
+Every model response is charged here (prompt + completion tokens from its
+`usage`): to the budget of the document being processed, if any, and to a
+host-wide ledger in SQLite that enforces a rolling hourly budget across all
+worker processes. Callers ask remaining_tokens() / allows() before a call
+and degrade (fewer pages, truncated text, local checks only) when the
+answer is no, instead of failing the submission.
+
+    with document_budget(ticket_id) as budget:
+        ...                      # summarize, reason, vision
+        budget.summary()         # tokens, cost, calls per model, what was degraded
+"""
+import os
+import time
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from model_pricing import estimate_cost
+
+# Per document run; 0 = unlimited. Off by default: a fixed cap drops pages of long leases, so size it to your documents
+DOC_TOKEN_BUDGET = int(os.getenv("DOC_TOKEN_BUDGET", 0))
+HOURLY_TOKEN_BUDGET = int(os.getenv("HOURLY_TOKEN_BUDGET", 2000000))  # per host, rolling hour; 0 = unlimited
+# The hourly ledger; "" = none (see set_ledger). Stub and replayed answers cost nothing, so they skip it by default.
+CANNED_BACKEND = os.getenv("LLM_BACKEND", "live").lower() in ("stub", "replay")
+TOKEN_BUDGET_DB = os.getenv("TOKEN_BUDGET_DB", "" if CANNED_BACKEND else "token_usage.db")
+LEDGER_RETENTION = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    ticket_id TEXT,
+    model TEXT,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_timestamp ON usage (timestamp);
+"""
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path or TOKEN_BUDGET_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+_local = threading.local()
+
+
+def ledger(db_path: str = None) -> sqlite3.Connection:
+    """This thread's connection to the ledger; every response is charged, so it's opened once per thread, not per call."""
+    db_path = db_path or TOKEN_BUDGET_DB
+    conns = _local.__dict__.setdefault("conns", {})
+    if db_path not in conns:
+        conns[db_path] = connect(db_path)
+    return conns[db_path]
+
+
+def set_ledger(db_path: str = None) -> None:
+    """
+    Points this process's charges at another ledger. None keeps them out of
+    any ledger and turns the hourly budget off, for harness runs that
+    shouldn't use up live submissions' hour.
+    """
+    global TOKEN_BUDGET_DB
+    TOKEN_BUDGET_DB = db_path or ""
+
+
+class DocumentBudget:
+    """Spend of one document run. Thread-safe: chunks are charged from worker threads."""
+
+    def __init__(self, ticket_id: str = None, limit: int = DOC_TOKEN_BUDGET):
+        self.ticket_id = ticket_id
+        self.limit = limit
+        self.tokens = 0
+        self.cost_usd = 0.0
+        self.by_model = {}
+        self.degraded = []  # what was cut to stay within budget, in order
+        self._lock = threading.Lock()
+
+    def charge(self, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.tokens += prompt_tokens + completion_tokens
+            self.cost_usd += estimate_cost(model, prompt_tokens, completion_tokens) or 0.0
+            calls, tokens = self.by_model.get(model, (0, 0))
+            self.by_model[model] = (calls + 1, tokens + prompt_tokens + completion_tokens)
+
+    def remaining(self):
+        """Tokens left, or None without a limit."""
+        return max(0, self.limit - self.tokens) if self.limit else None
+
+    def degrade(self, reason: str) -> None:
+        print(f"[💸] {reason}")
+        with self._lock:
+            self.degraded.append(reason)
+
+    def summary(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "limit": self.limit or None,
+            "calls": {model: {"calls": calls, "tokens": tokens} for model, (calls, tokens) in self.by_model.items()},
+            "degraded": list(self.degraded),
+        }
+
+
+_current_budget = contextvars.ContextVar("document_budget", default=None)
+
+
+@contextmanager
+def document_budget(ticket_id: str = None, limit: int = DOC_TOKEN_BUDGET):
+    budget = DocumentBudget(ticket_id, limit)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+# ======= Charging and Checking =======
+
+def charge(response, model: str = None, db_path: str = None) -> None:
+    """Books a response's usage. `model` is the requested name (responses report dated snapshot names)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    model = model or getattr(response, "model", None)
+
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.charge(model, prompt_tokens, completion_tokens)
+
+    if not (db_path or TOKEN_BUDGET_DB):
+        return
+
+    now = time.time()
+    conn = ledger(db_path)
+    conn.execute(
+        "INSERT INTO usage (timestamp, ticket_id, model, prompt_tokens, completion_tokens) VALUES (?, ?, ?, ?, ?)",
+        (now, budget.ticket_id if budget else None, model, prompt_tokens, completion_tokens)
+    )
+    conn.execute("DELETE FROM usage WHERE timestamp < ?", (now - LEDGER_RETENTION,))
+
+
+def hourly_tokens(db_path: str = None) -> int:
+    if not (db_path or TOKEN_BUDGET_DB):
+        return 0
+    row = ledger(db_path).execute(
+        "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage WHERE timestamp >= ?",
+        (time.time() - 3600,)
+    ).fetchone()
+    return row[0]
+
+
+def remaining_tokens(db_path: str = None):
+    """Tokens the current document may still spend (the tighter of its own and the hourly budget), or None."""
+    limits = []
+    budget = _current_budget.get()
+    if budget is not None and budget.limit:
+        limits.append(budget.remaining())
+    if HOURLY_TOKEN_BUDGET and (db_path or TOKEN_BUDGET_DB):
+        limits.append(max(0, HOURLY_TOKEN_BUDGET - hourly_tokens(db_path)))
+    return min(limits) if limits else None
+
+
+def allows(tokens: int, db_path: str = None) -> bool:
+    remaining = remaining_tokens(db_path)
+    return remaining is None or tokens <= remaining
+
+
+def degrade(reason: str) -> None:
+    """Notes a budget-driven cut on the current document (printed either way)."""
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.degrade(reason)
+    else:
+        print(f"[💸] {reason}")
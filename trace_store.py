@@ -0,0 +1,159 @@
+import os
+import gzip
+import json
+import glob
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from llm_cache import hash_bytes
+
+# ======= Compact Summary Traces =======
+# One JSON line per trace entry in traces/trace_summary_<ts>_<id>.jsonl.gz.
+# Chunk text is stored once per content hash in traces/blobs/<h[:2]>/<h>.txt
+# (re-runs of the same lease reuse it) and entries carry `chunk_hash`.
+# traces/index.db maps ticket id and document hash to trace files, so
+# nothing has to glob or sort the directory to find a trace.
+
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+TRACE_COMPRESS = os.getenv("TRACE_COMPRESS", "1") == "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS traces (
+    trace_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    ticket_id TEXT,
+    doc_hash TEXT,
+    entries INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_traces_ticket ON traces (ticket_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_traces_doc ON traces (doc_hash, created_at);
+CREATE INDEX IF NOT EXISTS idx_traces_created ON traces (created_at);
+"""
+
+
+def connect(trace_dir: str = None) -> sqlite3.Connection:
+    trace_dir = trace_dir or TRACE_DIR
+    os.makedirs(trace_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(trace_dir, "index.db"), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# ======= Chunk Text Blobs =======
+
+def _blob_path(chunk_hash: str, trace_dir: str = None) -> str:
+    return os.path.join(trace_dir or TRACE_DIR, "blobs", chunk_hash[:2], f"{chunk_hash}.txt")
+
+
+def put_blob(text: str, trace_dir: str = None) -> str:
+    data = text.encode("utf-8")
+    chunk_hash = hash_bytes(data)
+    path = _blob_path(chunk_hash, trace_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, data)
+    return chunk_hash
+
+
+def get_blob(chunk_hash: str, trace_dir: str = None) -> str:
+    with open(_blob_path(chunk_hash, trace_dir), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# ======= Writing and Reading Traces =======
+
+def write_trace(entries: list, ticket_id: str = None, doc_hash: str = None,
+                trace_dir: str = None, compress: bool = TRACE_COMPRESS) -> str:
+    """Stores the entries and indexes the trace; returns its path."""
+    trace_dir = trace_dir or TRACE_DIR
+    # The random suffix keeps runs started in the same second apart
+    trace_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    path = os.path.join(trace_dir, f"trace_summary_{trace_id}.jsonl" + (".gz" if compress else ""))
+
+    lines = []
+    for entry in entries:
+        entry = dict(entry)
+        if entry.get("chunk_text") is not None:
+            entry["chunk_hash"] = put_blob(entry.pop("chunk_text"), trace_dir)
+        lines.append(json.dumps(entry, ensure_ascii=False))
+    data = ("\n".join(lines) + "\n").encode("utf-8")
+    _write_atomic(path, gzip.compress(data) if compress else data)
+
+    conn = connect(trace_dir)
+    try:
+        conn.execute(
+            "INSERT INTO traces (trace_id, path, ticket_id, doc_hash, entries, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (trace_id, path, ticket_id, doc_hash, len(entries), time.time())
+        )
+    finally:
+        conn.close()
+    return path
+
+
+def read_trace(path: str, with_text: bool = False, trace_dir: str = None):
+    """
+    Yields a trace's entries one at a time. `with_text` loads each entry's
+    chunk_text back from the blob store. Also reads the indented .json
+    traces written before this store existed.
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            yield from json.load(f)
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if with_text and "chunk_hash" in entry:
+                entry["chunk_text"] = get_blob(entry["chunk_hash"], trace_dir or os.path.dirname(path))
+            yield entry
+
+
+# ======= Index Lookups =======
+
+def find_traces(ticket_id: str = None, doc_hash: str = None, limit: int = 20, trace_dir: str = None) -> list:
+    """Index rows, newest first, for a ticket and/or document hash (all traces if neither is given)."""
+    clauses, params = [], []
+    if ticket_id:
+        clauses.append("ticket_id = ?")
+        params.append(ticket_id)
+    if doc_hash:
+        clauses.append("doc_hash = ?")
+        params.append(doc_hash)
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+
+    conn = connect(trace_dir)
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM traces {where} ORDER BY created_at DESC LIMIT ?", params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def latest_trace(ticket_id: str = None, doc_hash: str = None, trace_dir: str = None) -> str:
+    rows = find_traces(ticket_id, doc_hash, limit=1, trace_dir=trace_dir)
+    return rows[0]["path"] if rows else None
+
+
+def trace_files(trace_dir: str = None) -> list:
+    """Every trace on disk, legacy .json ones included (for one-off batch jobs, not lookups)."""
+    paths = glob.glob(os.path.join(trace_dir or TRACE_DIR, "trace_summary_*"))
+    return sorted(p for p in paths if p.endswith((".json", ".jsonl", ".jsonl.gz")) and not p.endswith(".spans.json"))
@@ -1,23 +1,42 @@
-import json
-import glob
-import os
+import re
+from chunk_verdicts import vision_pages
+from trace_store import read_trace, latest_trace
+
+PAGE_REFERENCE = re.compile(r"\bpage\s+(\d+)", re.IGNORECASE)
+
+
+def attribute_pages(summary: str, pages: list) -> list:
+    """
+    A chunk may cover several pages; the summary names the page it means
+    ("Page 52 has a signature box"). Fall back to every page in the chunk.
+    """
+    if len(pages) == 1:
+        return pages
+    referenced = [int(n) for n in PAGE_REFERENCE.findall(summary) if int(n) in pages]
+    return referenced or pages
+
 
 def suggest_vision_pages(trace_file_path: str):
     try:
-        with open(trace_file_path, "r") as f:
-            trace_data = json.load(f)
+        # Page triage kept skipped entries away from the LLM; chunk text is not needed here
+        entries = [entry for entry in read_trace(trace_file_path) if not entry.get("skipped")]
     except Exception as e:
         print(f"[❌] Failed to read {trace_file_path}: {e}")
         return []
 
+    if any("verdict" in entry for entry in entries):
+        return vision_pages([entry.get("verdict") for entry in entries])
+
+    # Traces written before structured verdicts only have free-text summaries
     pages_to_flag = []
-    for entry in trace_data:
-        summary = entry.get("summary", "").lower()
+    for entry in entries:
+        summary = (entry.get("summary") or "").lower()
         if "signature" in summary or "signed" in summary or "missing signature" in summary:
-            pages_to_flag.append(entry["page"])
+            pages_to_flag.extend(attribute_pages(summary, entry.get("pages") or [entry["page"]]))
 
     return sorted(set(pages_to_flag))
 
-def get_latest_trace_file():
-    trace_files = sorted(glob.glob("trace_summary_*.json"), reverse=True)
-    return trace_files[0] if trace_files else None
\ No newline at end of file
+
+def get_latest_trace_file(ticket_id: str = None):
+    """Newest indexed trace, optionally for one ticket."""
+    return latest_trace(ticket_id=ticket_id)
@@ -1,40 +1,196 @@
 import os
+import io
 import base64
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from llm_cache import llm_cache, make_key, hash_bytes
+from llm_backend import get_backend
+from span_utils import span, record_usage, map_in_context
+from signature_detector import SIGNATURE_GATE, classify_page, local_answer
+import token_budget
 
 def encode_image_to_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
-def check_signature_image(image_path):
-    base64_image = encode_image_to_base64(image_path)
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are an AI assistant helping verify signatures in lease agreements."
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Does this document contain a visible handwritten or digital signature?"},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        max_tokens=300,
-        temperature=0.2
+VISION_MODEL = "gpt-4o"
+VISION_SYSTEM_PROMPT = "You are an AI assistant helping verify signatures in lease agreements."
+VISION_QUESTION = "Does this document contain a visible handwritten or digital signature?"
+
+VISION_DPI = int(os.getenv("VISION_DPI", 110))
+VISION_FORMAT = os.getenv("VISION_FORMAT", "JPEG")
+VISION_QUALITY = int(os.getenv("VISION_QUALITY", 70))
+VISION_GRAYSCALE = os.getenv("VISION_GRAYSCALE", "1") == "1"
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", 4))
+VISION_CALL_TOKENS = 1500  # a high-detail page image, the question and a full answer; for budget checks
+VISION_DEBUG_DIR = os.getenv("VISION_DEBUG_DIR")  # e.g. "outputs"; unset = nothing written to disk
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def vision_version() -> str:
+    """What produced a stored vision answer (see page_store); changing the model, prompt or image settings invalidates it."""
+    return make_key(kind="vision_check", model=VISION_MODEL, system_prompt=VISION_SYSTEM_PROMPT, question=VISION_QUESTION,
+                    dpi=VISION_DPI, fmt=VISION_FORMAT, quality=VISION_QUALITY, grayscale=VISION_GRAYSCALE)[:16]
+
+
+def encode_page_image(image, fmt: str = VISION_FORMAT, quality: int = VISION_QUALITY, grayscale: bool = VISION_GRAYSCALE) -> bytes:
+    """Re-encodes a rendered page in memory; grayscale JPEG is a fraction of the PNG payload."""
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+    elif fmt.upper() == "JPEG" and image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if fmt.upper() == "PNG":
+        image.save(buffer, "PNG", optimize=True)
+    else:
+        image.save(buffer, fmt.upper(), quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def check_signature_image(image, mime_type: str = "image/png"):
+    """`image` is a file path or already encoded image bytes."""
+    if isinstance(image, (bytes, bytearray)):
+        image_bytes = bytes(image)
+    else:
+        with open(image, "rb") as image_file:
+            image_bytes = image_file.read()
+
+    cache_key = make_key(
+        kind="signature_image",
+        image_sha256=hash_bytes(image_bytes),
+        model=VISION_MODEL,
+        system_prompt=VISION_SYSTEM_PROMPT,
+        question=VISION_QUESTION,
+        temperature=0.2,
+        max_tokens=300
     )
+    with span("vision_check", model=VISION_MODEL, image_bytes=len(image_bytes)) as record:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            record["cache"] = "hit"
+            return cached["result"]
+        record["cache"] = "bypass" if llm_cache.bypass else "miss"
+
+        base64_image = base64.b64encode(image_bytes).decode("utf-8")
+
+        response = get_backend().chat(
+            model=VISION_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": VISION_SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": VISION_QUESTION},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{base64_image}"
+                            }
+                        }
+                    ]
+                }
+            ],
+            max_tokens=300,
+            temperature=0.2
+        )
+        record_usage(record, response)
+        token_budget.charge(response, VISION_MODEL)
+
+    result = response.choices[0].message.content
+    llm_cache.set(cache_key, {"result": result})
+    return result
+
+
+# ======= Vision Stage =======
+
+def run_vision_stage(document, pages, dpi: int = VISION_DPI, fmt: str = VISION_FORMAT, quality: int = VISION_QUALITY,
+                     grayscale: bool = VISION_GRAYSCALE, max_concurrency: int = VISION_CONCURRENCY,
+                     debug_dir: str = VISION_DEBUG_DIR, on_progress=None, gate: bool = SIGNATURE_GATE) -> list:
+    """
+    Renders the flagged pages of a parsed document in one batch, keeps them in
+    memory and checks them concurrently. Returns one dict per page, in order.
+    `on_progress(kind, data)` gets a "vision" event as each page is checked.
+    With `gate`, pages the local signature check (signature_detector) finds
+    clearly signed or unsigned are answered without a vision call. Pages the
+    token budget can't cover come back unchecked, with an error.
+    """
+    pages = sorted(set(pages))
+    if not pages:
+        return []
+
+    def report(entry):
+        if on_progress:
+            on_progress("vision", {k: entry[k] for k in ("page", "result", "error", "local") if k in entry})
+        return entry
+
+    with span("render_pages", pages=len(pages), dpi=dpi):
+        try:
+            images, render_error = document.render_pages(pages, dpi=dpi, grayscale=grayscale), None
+        except Exception as e:
+            print(f"⚠️ Error rendering pages {pages}: {e}")
+            images, render_error = {}, str(e)
+
+    # === Local signature check: only uncertain pages need GPT-4o ===
+    settled = []
+    if gate:
+        with span("signature_gate", pages=len(pages)) as record:
+            for page in pages:
+                outcome = classify_page(document.page(page).signature_layout, images.get(page))
+                if outcome["status"] != "uncertain":
+                    settled.append(report({"page": page, "image_path": None, "result": local_answer(outcome),
+                                           "error": None, "local": outcome["status"]}))
+            record.update(settled=len(settled), signed=sum(e["local"] == "signed" for e in settled))
+        if settled:
+            print(f"[🔎] Local signature check settled pages {[e['page'] for e in settled]}; "
+                  f"{len(pages) - len(settled)} left for vision")
+        pages = [page for page in pages if page not in {e["page"] for e in settled}]
+
+    if render_error:
+        failed = [report({"page": page, "image_path": None, "result": None, "error": render_error}) for page in pages]
+        return sorted(settled + failed, key=lambda entry: entry["page"])
+
+    over_budget = []
+    remaining = token_budget.remaining_tokens()
+    if remaining is not None and remaining < VISION_CALL_TOKENS * len(pages):
+        affordable = remaining // VISION_CALL_TOKENS
+        pages, over_budget = pages[:affordable], pages[affordable:]
+        token_budget.degrade(f"Token budget: skipped the vision check of pages {over_budget}")
+    skipped = [report({"page": page, "image_path": None, "result": None, "error": "skipped: token budget exhausted"})
+               for page in over_budget]
+
+    mime_type = MIME_TYPES.get(fmt.upper(), "image/jpeg")
+    encoded = {page: encode_page_image(images[page], fmt=fmt, quality=quality, grayscale=grayscale) for page in pages}
+
+    image_paths = {}
+    if debug_dir:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(debug_dir, exist_ok=True)
+        for page, data in encoded.items():
+            image_paths[page] = os.path.join(debug_dir, f"signature_page_p{page}_{timestamp}.{fmt.lower()}")
+            with open(image_paths[page], "wb") as f:
+                f.write(data)
+
+    def check(page):
+        try:
+            outcome = check_signature_image(encoded[page], mime_type=mime_type), None
+        except Exception as e:
+            print(f"⚠️ Vision check failed on page {page}: {e}")
+            outcome = None, str(e)
+        report({"page": page, "result": outcome[0], "error": outcome[1]})
+        return outcome
+
+    outcomes = []
+    if pages:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            outcomes = list(map_in_context(executor, check, [(page,) for page in pages]))
 
-    return response.choices[0].message.content
\ No newline at end of file
+    checked = [
+        {"page": page, "image_path": image_paths.get(page), "result": result, "error": error, "image_bytes": len(encoded[page])}
+        for page, (result, error) in zip(pages, outcomes)
+    ]
+    return sorted(settled + checked + skipped, key=lambda entry: entry["page"])
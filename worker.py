@@ -0,0 +1,130 @@
+"""
+Worker pool for queued submissions.
+
+    python worker.py --workers 4
+
+Each worker process claims jobs from job_queue, runs pipeline.process_submission
+and records the result. Start more worker.py processes on the same host to
+scale out; they coordinate through the SQLite queue.
+"""
+import os
+import signal
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+import job_queue
+import notification_outbox
+import workspace
+
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 1.0))
+
+
+def _keep_lease(job_id: str, worker_id: str, lease_seconds: int, done: threading.Event):
+    # Renew well before expiry so a slow GPT call doesn't look like a dead worker
+    while not done.wait(lease_seconds / 3):
+        if not job_queue.heartbeat(job_id, worker_id, lease_seconds):
+            print(f"[⚠️] {worker_id} lost the lease on job {job_id}")
+            return
+
+
+def _event_writer(job_id: str):
+    def on_progress(kind: str, data: dict):
+        try:
+            job_queue.add_event(job_id, kind, data)
+        except Exception as e:
+            # Progress is for the status page only; never fail the job over it
+            print(f"[⚠️] Could not record {kind} event for job {job_id}: {e}")
+    return on_progress
+
+
+def run_job(job: dict, worker_id: str, lease_seconds: int) -> None:
+    from pipeline import process_submission
+
+    done = threading.Event()
+    keeper = threading.Thread(target=_keep_lease, args=(job["id"], worker_id, lease_seconds, done), daemon=True)
+    keeper.start()
+    try:
+        result = process_submission(job["payload"], on_progress=_event_writer(job["id"]))
+        if job_queue.complete(job["id"], worker_id, result):
+            print(f"[✅] {worker_id} finished job {job['id']} in {result['duration']}s")
+        else:
+            print(f"[⚠️] {worker_id} finished job {job['id']} after losing its lease; result discarded")
+    except Exception as e:
+        status = job_queue.fail(job["id"], worker_id, f"{e}\n{traceback.format_exc()}")
+        if status is None:
+            print(f"[⚠️] {worker_id} failed job {job['id']} after losing its lease: {e}")
+        else:
+            print(f"[❌] {worker_id} failed job {job['id']} (attempt {job['attempts']}/{job['max_attempts']}, now {status}): {e}")
+    finally:
+        done.set()
+
+
+def worker_loop(index: int, lease_seconds: int, stop: multiprocessing.Event):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent coordinates shutdown
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    print(f"[👷] Worker {worker_id} started")
+
+    while not stop.is_set():
+        job = job_queue.claim(worker_id, lease_seconds)
+        if job is None:
+            stop.wait(POLL_INTERVAL)
+            continue
+        print(f"[📥] {worker_id} claimed job {job['id']} (ticket {job['ticket_id']})")
+        run_job(job, worker_id, lease_seconds)
+
+    print(f"[👋] Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run submission workers against the local job queue.")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes to start")
+    parser.add_argument("--lease", type=int, default=job_queue.DEFAULT_LEASE_SECONDS, help="Job lease in seconds")
+    parser.add_argument("--no-dispatcher", action="store_true", help="Don't send queued email/SMS from this host")
+    args = parser.parse_args()
+
+    recovered = job_queue.recover_stuck()
+    if recovered:
+        print(f"[♻️] Requeued {recovered} stuck job(s)")
+
+    stop = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=worker_loop, args=(i, args.lease, stop), name=f"worker-{i}")
+        for i in range(args.workers)
+    ]
+    for p in processes:
+        p.start()
+
+    # One dispatcher drains the notification outbox the workers fill
+    dispatcher = None
+    if not args.no_dispatcher:
+        dispatcher = threading.Thread(target=notification_outbox.run_dispatcher, args=(stop,), name="dispatcher", daemon=True)
+        dispatcher.start()
+
+    def shutdown(signum, frame):
+        print("[🛑] Stopping workers after their current job...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        # Periodic sweep so expired jobs that are out of attempts get marked failed
+        # and old submission workspaces don't fill the disk
+        while any(p.is_alive() for p in processes) and not stop.wait(60):
+            job_queue.recover_stuck()
+            try:
+                workspace.run_janitor()
+            except Exception as e:
+                print(f"[❌] Workspace janitor error: {e}")
+    finally:
+        for p in processes:
+            p.join()
+        if dispatcher is not None:
+            dispatcher.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Per-submission workspaces.
+
+Each submission gets its own directory, workspaces/<job_id>/, holding the
+upload, the run's spans, rendered page images (with VISION_DEBUG_DIR set)
+and its callback entry, so concurrent sessions never share a file name.
+
+    python workspace.py                  # evict expired / over-budget workspaces
+    python workspace.py --dry-run        # list what would be evicted
+
+worker.py runs the janitor on its periodic sweep. Workspaces of queued or
+running jobs are never evicted.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", "workspaces")
+WORKSPACE_MAX_AGE_HOURS = float(os.getenv("WORKSPACE_MAX_AGE_HOURS", 72))
+WORKSPACE_MAX_MB = float(os.getenv("WORKSPACE_MAX_MB", 2048))  # total disk budget across workspaces
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+META_FILE = "workspace.json"
+UPLOAD_NAME = "upload.pdf"
+
+
+def create_workspace(job_id: str, ticket_id: str = None, root: str = None) -> str:
+    path = os.path.join(root or WORKSPACE_ROOT, job_id)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"job_id": job_id, "ticket_id": ticket_id, "created_at": time.time()}, f)
+    return path
+
+
+def save_upload(stream, path: str, chunk_size: int = UPLOAD_CHUNK_BYTES) -> int:
+    """
+    Copies a file-like upload to `path` chunk by chunk, never holding a second
+    copy in memory. Written under a temporary name and renamed, so a worker
+    never sees a half-written PDF. Returns the bytes written.
+    """
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+    tmp_path = path + ".part"
+    written = 0
+    with open(tmp_path, "wb") as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            written += len(chunk)
+    os.replace(tmp_path, path)
+    return written
+
+
+# ======= Janitor =======
+
+def list_workspaces(root: str = None) -> list:
+    """One dict per workspace: path, job_id, ticket_id, bytes and last_used (newest file mtime)."""
+    root = root or WORKSPACE_ROOT
+    if not os.path.isdir(root):
+        return []
+
+    workspaces = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        size, last_used = 0, os.path.getmtime(path)
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue  # removed while we walked
+                size += stat.st_size
+                last_used = max(last_used, stat.st_mtime)
+        try:
+            with open(os.path.join(path, META_FILE), "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        workspaces.append({"path": path, "job_id": meta.get("job_id", name), "ticket_id": meta.get("ticket_id"),
+                           "bytes": size, "last_used": last_used})
+    return workspaces
+
+
+def select_evictions(workspaces: list, max_age_hours: float, max_bytes: int, protect: set = frozenset(),
+                     now: float = None) -> list:
+    """Everything older than `max_age_hours`, then the least recently used until the rest fits in `max_bytes`."""
+    now = now or time.time()
+    candidates = sorted((w for w in workspaces if w["job_id"] not in protect), key=lambda w: w["last_used"])
+    evict = [w for w in candidates if now - w["last_used"] > max_age_hours * 3600]
+
+    remaining = sum(w["bytes"] for w in workspaces) - sum(w["bytes"] for w in evict)
+    for w in candidates:
+        if remaining <= max_bytes:
+            break
+        if w not in evict:
+            evict.append(w)
+            remaining -= w["bytes"]
+    return evict
+
+
+def run_janitor(root: str = None, max_age_hours: float = WORKSPACE_MAX_AGE_HOURS, max_mb: float = WORKSPACE_MAX_MB,
+                dry_run: bool = False) -> list:
+    """Removes expired and over-budget workspaces, sparing queued and running jobs. Returns the evicted ones."""
+    import job_queue
+
+    workspaces = list_workspaces(root)
+    if not workspaces:
+        return []
+    evict = select_evictions(workspaces, max_age_hours, int(max_mb * 1024 * 1024), protect=job_queue.active_job_ids())
+    for w in evict:
+        if not dry_run:
+            shutil.rmtree(w["path"], ignore_errors=True)
+    if evict:
+        freed = sum(w["bytes"] for w in evict) / (1024 * 1024)
+        print(f"[🧹] {'Would evict' if dry_run else 'Evicted'} {len(evict)} workspace(s), {freed:.1f} MB")
+    return evict
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evict old submission workspaces.")
+    parser.add_argument("--root", default=WORKSPACE_ROOT, help="Workspace root directory")
+    parser.add_argument("--max-age-hours", type=float, default=WORKSPACE_MAX_AGE_HOURS, help="Evict workspaces idle longer than this")
+    parser.add_argument("--max-mb", type=float, default=WORKSPACE_MAX_MB, help="Total disk budget for all workspaces")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be evicted")
+    args = parser.parse_args()
+
+    for w in run_janitor(args.root, args.max_age_hours, args.max_mb, args.dry_run):
+        print(f"  {w['path']} (ticket {w['ticket_id']}, {w['bytes'] / 1024:.0f} KB)")